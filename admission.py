@@ -0,0 +1,273 @@
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+# 请求截止时间和并发准入控制：
+#   截止时间保存在contextvar中，deadline() 同时进入 pymongo.timeout()，
+#   作用域内的每次数据库操作（查询、更新、bulk_write、连接检出）由驱动按剩余时间附带maxTimeMS；
+#   AdmissionController 限制同时访问数据库的请求数，超出时排队，队列满返回429，排队超时返回503
+
+# 截止时间（time.monotonic()），None表示不限制
+_deadline: contextvars.ContextVar = contextvars.ContextVar("sc_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """截止时间已过"""
+
+
+class Overloaded(Exception):
+    """排队请求数已达上限"""
+
+
+def is_timeout(e: BaseException) -> bool:
+    """
+    截止时间已过或数据库操作超时（pymongo的ExecutionTimeout、NetworkTimeout等，e.timeout为True）；
+    这类错误应中断整个请求，而不是记为单个用户的查询失败
+    """
+    if isinstance(e, DeadlineExceeded):
+        return True
+    try:
+        from pymongo.errors import PyMongoError
+    except ImportError:
+        return False
+    return isinstance(e, PyMongoError) and bool(getattr(e, "timeout", False))
+
+
+def remaining() -> Optional[float]:
+    """当前作用域剩余的秒数，未设置截止时间时返回None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def remaining_ms() -> Optional[int]:
+    """剩余毫秒数（可用作maxTimeMS），截止时间已过时抛出DeadlineExceeded"""
+    left = remaining()
+    if left is None:
+        return None
+    if left <= 0:
+        raise DeadlineExceeded("请求已超过截止时间")
+    return max(1, int(left * 1000))
+
+
+def _driver_timeout(seconds: float):
+    """pymongo 4.2+ 的客户端操作超时，旧版本或内存引擎下不附带maxTimeMS"""
+    try:
+        import pymongo
+        return pymongo.timeout(seconds)
+    except (ImportError, AttributeError):
+        return contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    在作用域内设置截止时间，嵌套时取更早的一个；seconds为None时不改变当前截止时间
+    """
+    if seconds is None:
+        yield
+        return
+    new_deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None and current < new_deadline:
+        new_deadline = current
+    token = _deadline.set(new_deadline)
+    try:
+        with _driver_timeout(max(new_deadline - time.monotonic(), 0.001)):
+            yield
+    finally:
+        _deadline.reset(token)
+
+
+class AdmissionController:
+    """
+    有界并发准入：最多max_concurrent个请求同时访问数据库，
+    其余最多max_queue个排队等待（不超过queue_timeout秒和请求截止时间），超出时立即拒绝
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 0, queue_timeout: float = 1.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.max_active = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.deadline_exceeded = 0
+
+    def acquire(self) -> None:
+        """
+        获取一个执行名额
+        队列已满时抛出Overloaded，排队超时抛出DeadlineExceeded
+        """
+        with self._cond:
+            if self.active >= self.max_concurrent or self.waiting:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise Overloaded("数据库繁忙，排队请求过多")
+                self._wait_for_slot()
+            self.active += 1
+            self.admitted += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def _wait_for_slot(self) -> None:
+        """在持有锁的情况下排队，直到有空闲名额或超时"""
+        wait = self.queue_timeout
+        left = remaining()
+        if left is not None:
+            wait = min(wait, left)
+        until = time.monotonic() + wait
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            while self.active >= self.max_concurrent:
+                timeout = until - time.monotonic()
+                if timeout <= 0:
+                    self.timed_out += 1
+                    raise DeadlineExceeded("数据库繁忙，排队超时")
+                self._cond.wait(timeout)
+        finally:
+            self.waiting -= 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record_deadline_exceeded(self) -> None:
+        with self._cond:
+            self.deadline_exceeded += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'waiting': self.waiting,
+                'max_active': self.max_active,
+                'max_waiting': self.max_waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'deadline_exceeded': self.deadline_exceeded
+            }
+
+
+def request_timeout(value: Optional[str], default: Optional[float], maximum: Optional[float]) -> Optional[float]:
+    """
+    解析客户端指定的超时（毫秒），无效或未指定时使用default，不超过maximum（秒）
+    """
+    timeout = default
+    if value:
+        try:
+            timeout = float(value) / 1000
+        except ValueError:
+            pass
+    if timeout is not None and timeout <= 0:
+        timeout = default
+    if timeout is not None and maximum:
+        timeout = min(timeout, maximum)
+    return timeout
+
+
+def controller_from_env() -> Optional[AdmissionController]:
+    """
+    MONGO_MAX_CONCURRENCY 大于0时创建准入控制（每个进程独立）：
+    MONGO_MAX_QUEUE 为排队上限（默认与并发数相同），MONGO_QUEUE_TIMEOUT_MS 为最长排队时间
+    """
+    max_concurrent = int(os.environ.get("MONGO_MAX_CONCURRENCY", "0"))
+    if max_concurrent <= 0:
+        return None
+    return AdmissionController(
+        max_concurrent,
+        int(os.environ.get("MONGO_MAX_QUEUE", str(max_concurrent))),
+        float(os.environ.get("MONGO_QUEUE_TIMEOUT_MS", "1000")) / 1000
+    )
+
+
+# ==================== Flask集成 ====================
+# 任务状态查询只读取本地文件，不访问数据库
+EXEMPT_ENDPOINTS = {"index", "healthz", "metrics_endpoint", "static", "job_status", "list_jobs"}
+# 全量扫描和批量写入的接口不使用默认截止时间（客户端仍可指定），但同样需要获取名额；
+# 批量写入在截止时间中断时部分用户已写入，客户端无法区分哪些成功
+LONG_RUNNING_ENDPOINTS = {
+    "export", "population_stats", "batch_update_rank_list", "combo_update", "batch_update_user_cars"
+}
+
+
+def install_flask(app, controller: Optional[AdmissionController] = None,
+                  default_timeout: Optional[float] = None, max_timeout: Optional[float] = None) -> None:
+    """
+    为每个请求设置截止时间并进行准入控制：
+    截止时间取请求头 X-Request-Timeout-Ms 或参数 timeout_ms，未指定时为default_timeout秒
+    （LONG_RUNNING_ENDPOINTS不设默认值），不超过max_timeout秒；
+    controller不为None时排队获取名额，队列满返回429，排队超时返回503（均带Retry-After）；
+    路由中抛出的超时错误（is_timeout）同样返回503
+    健康检查、指标和首页不受限制
+    """
+    from flask import g, jsonify, request
+
+    def _error_response(e: Exception, status: int = 503):
+        response = jsonify({'success': False, 'error': str(e)})
+        response.status_code = status
+        if status in (429, 503):
+            response.headers["Retry-After"] = "1"
+        return response
+
+    @app.errorhandler(DeadlineExceeded)
+    def _deadline_exceeded(e):
+        return _error_response(e)
+
+    try:
+        from pymongo.errors import PyMongoError
+
+        @app.errorhandler(PyMongoError)
+        def _database_error(e):
+            return _error_response(e) if is_timeout(e) else _error_response(e, 500)
+    except ImportError:
+        pass
+
+    @app.before_request
+    def _admit():
+        if request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+        timeout = request_timeout(
+            request.headers.get("X-Request-Timeout-Ms") or request.args.get("timeout_ms"),
+            None if request.endpoint in LONG_RUNNING_ENDPOINTS else default_timeout,
+            max_timeout
+        )
+        scope = contextlib.ExitStack()
+        scope.enter_context(deadline(timeout))
+        try:
+            if controller:
+                scope.enter_context(controller.slot())
+        except (Overloaded, DeadlineExceeded) as e:
+            scope.close()
+            return _error_response(e, 429 if isinstance(e, Overloaded) else 503)
+        g.admission_scope = scope
+        return None
+
+    @app.teardown_request
+    def _release(exc):
+        scope = g.pop("admission_scope", None)
+        if scope is None:
+            return
+        left = remaining()
+        if controller and left is not None and left <= 0:
+            controller.record_deadline_exceeded()
+        scope.close()
@@ -1,22 +1,113 @@
+import atexit
 import os
-from flask import Flask, request, jsonify, render_template
+from typing import Any, Dict
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from pymongo import MongoClient
-from sc import MongoDBManager
+from metrics import MetricsRegistry, instrument_manager, instrument_flask, render_gauges
+from http_codec import install_flask, make_conditional
+import admission
+from storage import MemoryClient, get_client_factory
+from serve import ProcessLocal
+from jobs import JobStore, JobRunner
+from write_behind import WriteFailed
+from sc import (
+    MongoDBManager, QUERY_PARTS, BULK_QUERY_CHUNK_SIZE, BULK_WRITE_CHUNK_SIZE, STATS_CACHE_MAX_AGE, user_to_ndjson,
+    job_chunk_processor, parse_uid_field, RANK_INDEX_REFRESH_INTERVAL
+)
 import json
 from flask_cors import CORS
 
 
 app = Flask(__name__)
-CORS(app)  # 允许跨域请求，解决前端跨域问题
+# 允许跨域请求，解决前端跨域问题；页面需要读取ETag并发送If-None-Match，
+# 带该请求头的跨域GET需要预检，缓存预检结果避免每次查询多一次往返
+CORS(app, expose_headers=['ETag'], allow_headers=['Content-Type', 'If-None-Match'], max_age=600)
 
 # 获取当前工作目录的绝对路径
 current_directory = os.path.abspath(os.getcwd())
 # 设置 Flask 模板文件夹为当前目录，方便渲染模板
 app.template_folder = current_directory
 
-# 初始化 MongoDB 管理器实例
-manager = MongoDBManager()
-manager.connect()  # 连接 MongoDB 数据库
+# 通过环境变量开启耗时统计，未开启时不包装任何方法
+metrics = MetricsRegistry() if os.environ.get('MONGO_METRICS') == '1' else None
+if metrics:
+    instrument_flask(app, metrics)
+# 快速JSON编码器（JSON_BACKEND）和响应压缩（HTTP_COMPRESSION、HTTP_COMPRESS_MIN_SIZE）；
+# 在耗时统计之后注册，压缩先于统计执行，响应字节数为压缩后的大小
+install_flask(app)
+# 请求截止时间（REQUEST_TIMEOUT_MS，默认10秒，传递给每次数据库操作作为maxTimeMS）和
+# 并发准入控制（MONGO_MAX_CONCURRENCY大于0时开启，每个进程独立计数）
+admission_controller = admission.controller_from_env()
+admission.install_flask(
+    app,
+    admission_controller,
+    float(os.environ.get('REQUEST_TIMEOUT_MS', '10000')) / 1000 or None,
+    float(os.environ.get('REQUEST_MAX_TIMEOUT_MS', '60000')) / 1000 or None
+)
+
+
+def create_manager() -> MongoDBManager:
+    """
+    创建并连接 MongoDB 管理器，由 manager 在每个进程首次使用时调用
+    MONGO_BACKEND=memory 时使用进程内存引擎，MONGO_MAX_POOL_SIZE 指定每个进程的连接池上限
+    """
+    max_pool_size = int(os.environ.get('MONGO_MAX_POOL_SIZE', '0')) or None
+    instance = MongoDBManager(client_factory=get_client_factory(), max_pool_size=max_pool_size)
+    # 通过环境变量开启读缓存，MONGO_CACHE_SIZE为0时不开启
+    cache_size = int(os.environ.get('MONGO_CACHE_SIZE', '0'))
+    if cache_size > 0:
+        instance.enable_cache(cache_size, float(os.environ.get('MONGO_CACHE_TTL', '30')))
+    # MONGO_RAW_BSON=1 时以原始BSON读取car_list，车辆分数只解码用到的字段
+    if os.environ.get('MONGO_RAW_BSON') == '1':
+        instance.enable_raw_bson()
+    # MONGO_WRITE_BEHIND_MS 大于0时开启写回队列，该时间窗口内同一文档的更新合并写入
+    write_behind_ms = float(os.environ.get('MONGO_WRITE_BEHIND_MS', '0'))
+    if write_behind_ms > 0:
+        instance.enable_write_behind(
+            write_behind_ms / 1000, int(os.environ.get('MONGO_WRITE_BEHIND_MAX', '1000'))
+        )
+        # 进程退出时写入剩余更新
+        atexit.register(instance.disable_write_behind)
+    if metrics:
+        instrument_manager(instance, metrics)
+    instance.connect()  # 连接 MongoDB 数据库
+    # 内存引擎可通过 MONGO_MEMORY_SEED 写入合成用户，用于本地调试和压测（每个进程各自一份）
+    if isinstance(instance.client, MemoryClient) and int(os.environ.get('MONGO_MEMORY_SEED', '0')) > 0:
+        from benchmarks.population import seed_population
+        seed_population(instance.db, int(os.environ['MONGO_MEMORY_SEED']))
+    # MONGO_RANK_INDEX=1 时在后台线程构建名次索引，每 MONGO_RANK_INDEX_REFRESH 秒重建；
+    # 构建完成前或超过 MONGO_RANK_INDEX_MAX_AGE 秒未重建时名次为null
+    if os.environ.get('MONGO_RANK_INDEX') == '1':
+        max_age = os.environ.get('MONGO_RANK_INDEX_MAX_AGE')
+        instance.start_rank_index_refresh(
+            float(os.environ.get('MONGO_RANK_INDEX_REFRESH', str(RANK_INDEX_REFRESH_INTERVAL))),
+            float(max_age) if max_age else None
+        )
+    return instance
+
+
+# 导入时不连接数据库：pymongo客户端不能跨fork使用，多进程部署（python serve.py）时
+# 每个工作进程在处理第一个请求时各自创建管理器和连接池
+manager = ProcessLocal(create_manager)
+
+
+def create_job_runner() -> JobRunner:
+    """
+    创建后台任务执行器，由 job_runner 在每个进程首次使用时调用，并继续执行重启前未完成的任务
+    JOB_DIR 为任务持久化目录（多进程共享），JOB_MAX_RUNNING 为同时执行的任务数，JOB_WORKERS 为每个任务并发处理的块数
+    """
+    runner = JobRunner(
+        JobStore(os.environ.get('JOB_DIR', os.path.join(current_directory, 'jobs_data'))),
+        lambda action, params: job_chunk_processor(manager, action, params),
+        max_jobs=int(os.environ.get('JOB_MAX_RUNNING', '2')),
+        workers=int(os.environ.get('JOB_WORKERS', '4'))
+    )
+    runner.resume()
+    return runner
+
+
+job_runner = ProcessLocal(create_job_runner)
+
 
 @app.route('/')
 def index():
@@ -33,22 +124,80 @@ def query():
         if not uids:
             return jsonify({'success': False, 'error': '缺少uids参数'})
 
-        uids = [int(uid.strip()) for uid in uids.split(',') if uid.strip().isdigit()]
+        uids = parse_uid_field(uids)
+
+        # 每个集合只发起一次$in批量查询
+        parts = QUERY_PARTS if query_type == "all" else (query_type,)
+        bulk_data = manager.get_users_bulk(uids, parts)
+        results = {str(uid): bulk_data[uid] for uid in uids}
+        # position=1 时附带全局名次，只从名次索引读取，索引未就绪时为null
+        if "user" in parts and request.args.get('position') in ('1', 'true'):
+            positions = manager.get_user_positions(uids)
+            for uid in uids:
+                results[str(uid)]['position'] = positions[uid]
+
+        # 按响应体计算ETag，If-None-Match匹配时返回304
+        return make_conditional(jsonify({'success': True, 'data': results}), request.headers.get('If-None-Match'))
+
+    except Exception as e:
+        if admission.is_timeout(e):
+            raise  # 由 admission 返回503
+        return jsonify({'success': False, 'error': str(e)})
+
+# 流式导出全部用户，每行一个用户的NDJSON
+@app.route('/export', methods=['GET'])
+def export():
+    try:
+        query_type = request.args.get('type', 'all')
+        batch_size = int(request.args.get('batch_size', BULK_QUERY_CHUNK_SIZE))
+        parts = QUERY_PARTS if query_type == "all" else (query_type,)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+    def generate():
+        # 按游标批次输出，避免在内存中构造完整结果
+        lines = []
+        for uid, user_data in manager.iter_users(parts, batch_size):
+            lines.append(user_to_ndjson(uid, user_data))
+            if len(lines) >= batch_size:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
 
-        results = {}
-        for uid in uids:
-            user_data = {}
-            if query_type in ["user", "all"]:
-                user_data["user_rank"] = manager.get_user_rank(uid)
-            if query_type in ["car", "all"]:
-                user_data["car_scores"] = manager.get_car_scores(uid)
-            if query_type in ["rank-list", "all"]:
-                user_data["rank_list"] = manager.get_recent_rank_list(uid)
-            results[str(uid)] = user_data
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-        return jsonify({'success': True, 'data': results})
+# 排行榜，按rank_score降序分页，cursor为上一页返回的next
+@app.route('/leaderboard', methods=['GET'])
+def leaderboard():
+    try:
+        limit = int(request.args.get('limit', 50))
+        result = manager.get_leaderboard(limit, request.args.get('cursor'))
+        return jsonify(result)
+
+    except Exception as e:
+        if admission.is_timeout(e):
+            raise
+        return jsonify({'success': False, 'error': str(e)})
+
+# 车辆分数分布统计，结果缓存在 STATS_CACHE_FILE 指定的文件中
+@app.route('/stats', methods=['GET'])
+def population_stats():
+    try:
+        percentiles = request.args.get('percentiles')
+        car_ids = request.args.get('car_ids')
+        result = manager.get_population_stats(
+            [float(p) for p in percentiles.split(',')] if percentiles else None,
+            int(request.args['bins']) if request.args.get('bins') else None,
+            os.environ.get('STATS_CACHE_FILE', 'stats_cache.json'),
+            float(request.args.get('max_age', STATS_CACHE_MAX_AGE)),
+            [c.strip() for c in car_ids.split(',') if c.strip()] if car_ids else None
+        )
+        return jsonify(result)
 
     except Exception as e:
+        if admission.is_timeout(e):
+            raise
         return jsonify({'success': False, 'error': str(e)})
 
 # 更新用户排名和分数
@@ -86,8 +235,11 @@ def update_user():
                 'error': '参数类型错误，uid、score和level必须为整数'
             }), 400
 
-        # 执行更新操作
-        result = manager.update_user_rank(uid, score, level)
+        # 执行更新操作，写回模式下 sync=true 时等待写入确认，写入失败时返回错误
+        try:
+            result = manager.update_user_rank(uid, score, level, sync=bool(data.get('sync')))
+        except WriteFailed as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
         # 构造响应数据
         response = {
@@ -98,6 +250,8 @@ def update_user():
         return jsonify(response)
 
     except Exception as e:
+        if admission.is_timeout(e):
+            raise
         # 捕获所有异常并返回错误信息
         return jsonify({
             'success': False,
@@ -112,13 +266,53 @@ def batch_update_user_cars():
         uid = data.get('uid')
         updates = data.get('updates')
 
+        # async=true 时以后台任务对 uids 中的每个用户执行相同的车辆更新
+        if data.get('async'):
+            return submit_job('update-cars', data.get('uids') or uid, {'updates': updates}, data)
+
         if not uid or not updates:
             return jsonify({'success': False, 'error': '缺少参数'})
 
-        result = manager.batch_update_cars_for_user(uid, updates)
+        result = manager.batch_update_cars_for_user(uid, updates, sync=bool(data.get('sync')))
         return jsonify(result)
 
     except Exception as e:
+        if admission.is_timeout(e):
+            raise
+        return jsonify({'success': False, 'error': str(e)})
+
+# 批量组合更新车辆分数和比赛记录
+@app.route('/combo-update', methods=['POST'])
+def combo_update():
+    try:
+        data = request.get_json(force=True)
+        uids = data.get('uids')
+        car_id = data.get('car_id')
+        rank_score = data.get('rank_score')
+        season_score = data.get('season_score')
+        rank_list = data.get('rank_list')
+
+        if not uids or not car_id or rank_score is None or season_score is None or rank_list is None:
+            return jsonify({'success': False, 'error': '参数不完整'}), 400
+
+        uids = parse_uid_field(uids)
+        if uids is None:
+            return jsonify({'success': False, 'error': 'uids 格式错误'}), 400
+
+        chunk_size = int(data.get('chunk_size', BULK_WRITE_CHUNK_SIZE))
+        result = manager.combo_update_bulk(
+            uids, str(car_id), int(rank_score), int(season_score), rank_list, chunk_size
+        )
+        success = sum(1 for r in result.values() if r['success'])
+        return jsonify({
+            'success': True,
+            'data': {str(uid): r for uid, r in result.items()},
+            'summary': {'total': len(result), 'success': success, 'failed': len(result) - success}
+        })
+
+    except Exception as e:
+        if admission.is_timeout(e):
+            raise
         return jsonify({'success': False, 'error': str(e)})
 
 # 修改比赛排名
@@ -132,21 +326,157 @@ def batch_update_rank_list():
         if not uids or not new_list:
             return jsonify({'success': False, 'error': '参数不完整'})
 
-        if isinstance(uids, str):
-            uids = [int(x.strip()) for x in uids.split(',') if x.strip().isdigit()]
-        elif isinstance(uids, list):
-            uids = [int(x) for x in uids if isinstance(x, int) or (isinstance(x, str) and x.isdigit())]
-        else:
+        # async=true 时立即返回任务ID，由后台任务分块执行
+        if data.get('async'):
+            return submit_job('update-list', uids, {'new_list': new_list}, data)
+
+        uids = parse_uid_field(uids)
+        if uids is None:
             return jsonify({'success': False, 'error': 'uids 格式错误'})
 
-        result = {}
-        for uid in uids:
-            res = manager.update_recent_rank_list(uid, new_list)
-            result[uid] = res
+        # 分批bulk_write写入，chunk_size可由请求指定
+        chunk_size = int(data.get('chunk_size', BULK_WRITE_CHUNK_SIZE))
+        result = manager.batch_update_recent_rank_list(uids, new_list, chunk_size)
 
         return jsonify({'success': True, 'data': result})
 
     except Exception as e:
+        if admission.is_timeout(e):
+            raise
         return jsonify({'success': False, 'error': str(e)})
+
+def submit_job(action: str, uids, params: Dict[str, Any], data: Dict[str, Any]):
+    """
+    提交后台任务并立即返回任务ID（新建返回202），进度通过 GET /jobs/<id> 查询
+    请求头 Idempotency-Key（或参数 idempotency_key）相同的重复提交返回已有任务
+    """
+    uids = parse_uid_field(uids)
+    if not uids:
+        return jsonify({'success': False, 'error': 'uids 为空或格式错误'}), 400
+    try:
+        state, created = job_runner.submit(
+            action,
+            params,
+            uids,
+            int(data.get('chunk_size', BULK_WRITE_CHUNK_SIZE)),
+            request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    response = jsonify({
+        'success': True,
+        'data': {'job_id': state['id'], 'status': state['status'], 'status_url': f"/jobs/{state['id']}"}
+    })
+    response.status_code = 202 if created else 200
+    response.headers['Location'] = f"/jobs/{state['id']}"
+    return response
+
+# 提交后台批量任务：action 为 update-list、update-record 或 update-cars，参数同对应的命令行任务
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    try:
+        data = request.get_json(force=True)
+        action = data.get('action')
+        params = {key: data.get(key) for key in ('new_list', 'index', 'value', 'updates') if key in data}
+        return submit_job(action, data.get('uids'), params, data)
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# 最近的后台任务
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    try:
+        limit = int(request.args.get('limit', 50))
+        return jsonify({
+            'success': True,
+            'data': {
+                'jobs': [
+                    {key: state[key] for key in ('id', 'action', 'status', 'created_at', 'finished_at', 'progress')}
+                    for state in job_runner.store.list(limit)
+                ],
+                'runner': job_runner.stats()
+            }
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# 后台任务状态：进度、吞吐量和失败的UID（最多 failures 条，默认100）
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    try:
+        state = job_runner.store.load(job_id)
+        if state is None:
+            return jsonify({'success': False, 'error': '任务不存在'}), 404
+        failures, failure_count = job_runner.store.failures(job_id, int(request.args.get('failures', 100)))
+        state['failures'] = failures
+        state['failure_count'] = failure_count
+        return jsonify({'success': True, 'data': state})
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# 查看或切换读缓存
+@app.route('/cache', methods=['GET', 'POST'])
+def cache_control():
+    try:
+        if request.method == 'POST':
+            data = request.get_json(force=True)
+            if data.get('enabled'):
+                manager.enable_cache(int(data.get('max_size', 10000)), float(data.get('ttl', 30)))
+            else:
+                manager.disable_cache()
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'enabled': manager.cache is not None,
+                'stats': manager.cache_stats(),
+                'single_flight': manager.single_flight_stats()
+            }
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+# 查看写回队列或立即写入排队的更新
+@app.route('/write-behind', methods=['GET', 'POST'])
+def write_behind_control():
+    try:
+        flushed = manager.flush_writes() if request.method == 'POST' else None
+        return jsonify({
+            'success': True,
+            'data': {
+                'enabled': manager.write_behind is not None,
+                'flushed': flushed,
+                'stats': manager.write_behind_stats()
+            }
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+# 健康检查：数据库可用性、本进程的连接池状态
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    result = manager.health()
+    return jsonify({'success': result['ok'], 'data': result}), 200 if result['ok'] else 503
+
+# Prometheus 指标
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    body = metrics.render_prometheus() if metrics else "# metrics disabled, set MONGO_METRICS=1\n"
+    body += render_gauges("sc_single_flight", manager.single_flight_stats(), "并发读取合并 ")
+    if admission_controller:
+        body += render_gauges("sc_admission", admission_controller.stats(), "数据库准入控制 ")
+    if manager.write_behind:
+        body += render_gauges("sc_write_behind", manager.write_behind_stats(), "写回队列 ")
+    if job_runner.created():
+        body += render_gauges("sc_jobs", job_runner.stats(), "后台任务 ")
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == '__main__':
+    # 单进程开发服务器；生产环境使用 python serve.py --workers N
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
@@ -0,0 +1,208 @@
+import os
+from quart import Quart, Response, request, jsonify, render_template
+from quart_cors import cors
+from metrics import MetricsRegistry, instrument_manager, render_gauges
+from http_codec import make_conditional_async
+from sc import QUERY_PARTS, BULK_WRITE_CHUNK_SIZE, RANK_INDEX_REFRESH_INTERVAL, parse_uid_field
+from sc_async import AsyncMongoDBManager
+from storage import get_async_client_factory
+
+# 异步版服务，接口与 app.py 一致，使用ASGI服务器运行：
+#   hypercorn app_async:app --bind 0.0.0.0:5002
+
+app = Quart(__name__)
+# 允许跨域请求；页面需要读取ETag并发送If-None-Match，缓存预检结果，与 app.py 一致
+app = cors(
+    app,
+    allow_origin="*",
+    allow_headers=["Content-Type", "If-None-Match"],
+    expose_headers=["ETag"],
+    max_age=600
+)
+
+# 设置模板文件夹为当前目录，方便渲染模板
+app.template_folder = os.path.abspath(os.getcwd())
+
+# 初始化异步 MongoDB 管理器实例，在服务启动时连接
+manager = AsyncMongoDBManager(
+    client_factory=get_async_client_factory(),
+    max_pool_size=int(os.environ.get('MONGO_MAX_POOL_SIZE', '0')) or None
+)
+cache_size = int(os.environ.get('MONGO_CACHE_SIZE', '0'))
+if cache_size > 0:
+    manager.enable_cache(cache_size, float(os.environ.get('MONGO_CACHE_TTL', '30')))
+# MONGO_RAW_BSON=1 时以原始BSON读取car_list，车辆分数只解码用到的字段
+if os.environ.get('MONGO_RAW_BSON') == '1':
+    manager.enable_raw_bson()
+# 通过环境变量开启管理器方法耗时统计
+metrics = MetricsRegistry() if os.environ.get('MONGO_METRICS') == '1' else None
+if metrics:
+    instrument_manager(manager, metrics)
+
+
+@app.before_serving
+async def connect_db():
+    await manager.connect()
+    # MONGO_RANK_INDEX=1 时在后台构建名次索引并定期重建，构建完成前或过期时名次为null
+    if os.environ.get('MONGO_RANK_INDEX') == '1':
+        max_age = os.environ.get('MONGO_RANK_INDEX_MAX_AGE')
+        app.add_background_task(
+            manager.refresh_rank_index,
+            float(os.environ.get('MONGO_RANK_INDEX_REFRESH', str(RANK_INDEX_REFRESH_INTERVAL))),
+            float(max_age) if max_age else None
+        )
+
+
+@app.after_serving
+async def close_db():
+    manager.close()
+
+
+@app.route('/')
+async def index():
+    # 根路由，返回模板文件 yc.html，作为首页
+    return await render_template('yc.html')
+
+
+# 查询用户排名和车辆分数
+@app.route('/query', methods=['GET'])
+async def query():
+    try:
+        uids = request.args.get('uids')
+        query_type = request.args.get('type', 'all')
+
+        if not uids:
+            return jsonify({'success': False, 'error': '缺少uids参数'})
+
+        uids = parse_uid_field(uids)
+
+        # 各批UID对两个集合的查询并发执行
+        parts = QUERY_PARTS if query_type == "all" else (query_type,)
+        bulk_data = await manager.get_users_bulk(uids, parts)
+        results = {str(uid): bulk_data[uid] for uid in uids}
+        # position=1 时附带全局名次，只从名次索引读取，索引未就绪时为null
+        if "user" in parts and request.args.get('position') in ('1', 'true'):
+            positions = await manager.get_user_positions(uids)
+            for uid in uids:
+                results[str(uid)]['position'] = positions[uid]
+
+        # 按响应体计算ETag，If-None-Match匹配时返回304
+        return await make_conditional_async(jsonify({'success': True, 'data': results}), request.headers.get('If-None-Match'))
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+# 排行榜，按rank_score降序分页，cursor为上一页返回的next
+@app.route('/leaderboard', methods=['GET'])
+async def leaderboard():
+    try:
+        limit = int(request.args.get('limit', 50))
+        result = await manager.get_leaderboard(limit, request.args.get('cursor'))
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+# 更新用户排名和分数
+@app.route('/update-user', methods=['POST'])
+async def update_user():
+    try:
+        data = await request.get_json(force=True)
+
+        uid = data.get('uid')
+        score = data.get('score')
+        level = data.get('level')
+
+        if not all([uid is not None, score is not None, level is not None]):
+            return jsonify({
+                'success': False,
+                'error': '参数不完整',
+                'data': {
+                    'uid': uid,
+                    'score': score,
+                    'level': level
+                }
+            }), 400
+
+        try:
+            uid = int(uid)
+            score = int(score)
+            level = int(level)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': '参数类型错误，uid、score和level必须为整数'
+            }), 400
+
+        result = await manager.update_user_rank(uid, score, level)
+        return jsonify({'success': True, 'data': result})
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'更新失败: {str(e)}'
+        }), 500
+
+
+# 修改车辆排位分和殿堂分
+@app.route('/car/batch-update-user-cars', methods=['POST'])
+async def batch_update_user_cars():
+    try:
+        data = await request.get_json(force=True)
+        uid = data.get('uid')
+        updates = data.get('updates')
+
+        if not uid or not updates:
+            return jsonify({'success': False, 'error': '缺少参数'})
+
+        result = await manager.batch_update_cars_for_user(uid, updates)
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+# 修改比赛排名
+@app.route('/rank-list/batch-update-list', methods=['POST'])
+async def batch_update_rank_list():
+    try:
+        data = await request.get_json(force=True)
+        uids = data.get('uids')
+        new_list = data.get('new_list')
+
+        if not uids or not new_list:
+            return jsonify({'success': False, 'error': '参数不完整'})
+
+        uids = parse_uid_field(uids)
+        if uids is None:
+            return jsonify({'success': False, 'error': 'uids 格式错误'})
+
+        # 各批bulk_write并发执行
+        chunk_size = int(data.get('chunk_size', BULK_WRITE_CHUNK_SIZE))
+        result = await manager.batch_update_recent_rank_list(uids, new_list, chunk_size)
+
+        return jsonify({'success': True, 'data': result})
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+# 健康检查：数据库可用性和耗时
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    result = await manager.health()
+    return jsonify({'success': result['ok'], 'data': result}), 200 if result['ok'] else 503
+
+
+# Prometheus 指标
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    body = metrics.render_prometheus() if metrics else "# metrics disabled, set MONGO_METRICS=1\n"
+    body += render_gauges("sc_single_flight", manager.single_flight_stats(), "并发读取合并 ")
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5002)
@@ -0,0 +1,119 @@
+import argparse
+import json
+import platform
+import random
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import bson
+
+import sc
+from lazy_bson import RAW_BSON_CODEC_OPTIONS
+from benchmarks.offline import time_calls
+from benchmarks.population import make_user_extra_info
+
+# car_garage 的解码基准：生成大车库的UserExtraInfo文档并编码为BSON（与驱动收到的批次相同），
+# 对比完整解码（dict）与原始BSON按需解码（RawBSONDocument + RawCarList）计算车辆分数的CPU耗时和内存：
+#   python -m benchmarks.bson_decode --users 100 --cars-per-user 400 --extra-car-fields 0,10,30
+# --extra-first 将其他字段放在分数字段之前，测试分数字段不在车辆文档开头时的逐字段查找
+
+
+def build_batch(args, extra_car_fields: int) -> bytes:
+    """生成users个文档，拼接为一个BSON批次"""
+    rng = random.Random(args.seed)
+    docs = []
+    for i in range(args.users):
+        doc = make_user_extra_info(i, rng, args.cars_per_user, args.rank_list_len, extra_car_fields=extra_car_fields)
+        if args.extra_first:
+            car_list = doc["car_garage"]["car_list"]
+            for car_id, car in car_list.items():
+                car_list[car_id] = dict(sorted(car.items(), key=lambda item: not item[0].startswith("attr_")))
+        docs.append(bson.encode(doc))
+    return b"".join(docs)
+
+
+def score_batch(batch: bytes, codec_options) -> List[Dict[str, Any]]:
+    """与 get_users_bulk 相同的处理：解码批次、提取car_list、计算车辆分数"""
+    docs = bson.decode_all(batch, codec_options)
+    return [sc.MongoDBManager._build_car_scores(sc.MongoDBManager._extract_car_list(doc)) for doc in docs]
+
+
+def cache_batch(batch: bytes, codec_options) -> List[Any]:
+    """读缓存中保存的值：每个用户的car_list"""
+    return [sc.MongoDBManager._extract_car_list(doc) for doc in bson.decode_all(batch, codec_options)]
+
+
+def measure_memory(call: Callable[[], Any]) -> Dict[str, int]:
+    """返回执行期间的内存峰值和执行后结果仍占用的内存（字节）"""
+    tracemalloc.start()
+    try:
+        result = call()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {'peak_bytes': peak, 'retained_bytes': retained}
+
+
+def bench_decoders(batch: bytes, iterations: int) -> Dict[str, Dict[str, Any]]:
+    decoders = {"full": bson.DEFAULT_CODEC_OPTIONS, "raw": RAW_BSON_CODEC_OPTIONS}
+    expected = score_batch(batch, decoders["full"])
+    results = {}
+    for name, codec_options in decoders.items():
+        if score_batch(batch, codec_options) != expected:
+            raise AssertionError(f"{name} 的车辆分数与完整解码不一致")
+        cpu_start = time.process_time()
+        stats = time_calls(lambda i: bool(score_batch(batch, codec_options)), iterations)
+        stats['cpu_ms'] = round((time.process_time() - cpu_start) * 1000 / iterations, 3)
+        stats.update(measure_memory(lambda: score_batch(batch, codec_options)))
+        stats['cached_bytes'] = measure_memory(lambda: cache_batch(batch, codec_options))['retained_bytes']
+        results[name] = stats
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="car_garage 完整解码与原始BSON按需解码基准")
+    parser.add_argument("--users", type=int, default=100, help="一个批次的文档数（一次 /query 的UID数量）")
+    parser.add_argument("--cars-per-user", type=int, default=400, help="每个用户的平均车辆数")
+    parser.add_argument("--rank-list-len", type=int, default=20, help="recent_rank_list长度")
+    parser.add_argument("--extra-car-fields", type=str, default="0,10,30",
+                        help="每辆车除分数外的字段数，逗号分隔的多个场景")
+    parser.add_argument("--extra-first", action="store_true", help="其他字段放在分数字段之前")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--iterations", type=int, default=5, help="每个场景的执行次数")
+    parser.add_argument("--output", type=str, default="bson_decode_results.json", help="结果写入的JSON文件")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'场景':<16}{'批次字节':>12}{'p50(ms)':>10}{'CPU(ms)':>10}{'峰值内存':>14}{'缓存占用':>14}")
+    for extra in (int(x) for x in args.extra_car_fields.split(",") if x.strip()):
+        batch = build_batch(args, extra)
+        scenario = bench_decoders(batch, args.iterations)
+        for name, stats in scenario.items():
+            stats['batch_bytes'] = len(batch)
+            print(f"{f'extra{extra}_{name}':<16}{len(batch):>12}{stats['p50_ms']:>10}{stats['cpu_ms']:>10}"
+                  f"{stats['peak_bytes']:>14}{stats['cached_bytes']:>14}")
+        results[f"extra_{extra}"] = scenario
+
+    report = {
+        'meta': {
+            'users': args.users,
+            'cars_per_user': args.cars_per_user,
+            'rank_list_len': args.rank_list_len,
+            'extra_first': args.extra_first,
+            'seed': args.seed,
+            'iterations': args.iterations,
+            'bson_c_extension': bson.has_c(),
+            'python': platform.python_version(),
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
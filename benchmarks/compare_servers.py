@@ -0,0 +1,97 @@
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+# 对比同步Flask服务(app.py)和异步ASGI服务(app_async.py)的/query延迟：
+#   python app.py                                   # 默认端口5001
+#   hypercorn app_async:app --bind 0.0.0.0:5002
+#   python -m benchmarks.compare_servers --uids 10001803,10001703 --concurrency 16 --requests 500
+# 对比单进程开发服务器和多进程部署（serve.py）的吞吐量：
+#   python app.py                                   # 单进程，端口5001
+#   python serve.py --workers 4 --bind 0.0.0.0:5003
+#   python -m benchmarks.compare_servers --target dev=http://127.0.0.1:5001 \
+#       --target prefork=http://127.0.0.1:5003 --uids 10001803,10001703 --concurrency 64
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def timed_get(url: str, timeout: float) -> float:
+    """发起一次GET请求并返回耗时（毫秒）"""
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        resp.read()
+    return (time.perf_counter() - start) * 1000
+
+
+def run_load(url: str, total: int, concurrency: int, timeout: float) -> Dict[str, Any]:
+    """以指定并发数发起total次请求，统计延迟分布和吞吐量"""
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(timed_get, url, timeout) for _ in range(total)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': total,
+        'errors': errors,
+        'concurrency': concurrency,
+        'mean_ms': round(statistics.mean(latencies), 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'ops_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步/异步服务/query延迟对比")
+    parser.add_argument("--sync-url", default="http://127.0.0.1:5001", help="同步服务地址")
+    parser.add_argument("--async-url", default="http://127.0.0.1:5002", help="异步服务地址")
+    parser.add_argument("--target", action="append", metavar="NAME=URL",
+                        help="要对比的服务，可重复指定；指定后忽略--sync-url和--async-url")
+    parser.add_argument("--uids", type=str, required=True, help="逗号分隔的UID列表")
+    parser.add_argument("--type", choices=["user", "car", "rank-list", "all"], default="all", help="查询类型")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--requests", type=int, default=200, help="每个服务的请求总数")
+    parser.add_argument("--timeout", type=float, default=30.0, help="单次请求超时（秒）")
+    parser.add_argument("--output", type=str, help="结果写入的JSON文件")
+    args = parser.parse_args()
+
+    if args.target:
+        targets = [tuple(target.split("=", 1)) for target in args.target]
+    else:
+        targets = [("sync", args.sync_url), ("async", args.async_url)]
+
+    results = {}
+    for name, base_url in targets:
+        url = f"{base_url}/query?uids={args.uids}&type={args.type}"
+        timed_get(url, args.timeout)  # 预热
+        results[name] = run_load(url, args.requests, args.concurrency, args.timeout)
+
+    print(f"{'服务':<12}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'ops/s':>10}{'错误':>6}")
+    for name, stats in results.items():
+        print(f"{name:<12}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+              f"{stats['ops_per_sec']:>10}{stats['errors']:>6}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
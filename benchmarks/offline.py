@@ -0,0 +1,245 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, Any, List, Callable
+from urllib.parse import urlparse
+
+from pymongo import MongoClient
+
+import sc
+from storage import MemoryClient
+from benchmarks.compare_servers import percentile
+from benchmarks.population import seed_population
+
+# 离线基准测试：在内存库（storage内存引擎或mongomock）或本地mongod中写入合成数据，
+# 测量 /query、各更新接口和命令行批量命令的延迟分布，结果写入JSON便于版本间对比：
+#   python -m benchmarks.offline --users 20000 --output bench.json
+#   python -m benchmarks.offline --backend mongomock --users 20000
+#   python -m benchmarks.offline --mongo-uri mongodb://127.0.0.1:27017 --users 100000
+
+QUERY_SIZES = (1, 10, 100, 1000)
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, Any]:
+    """汇总一组延迟（毫秒），字段与 compare_servers.run_load 一致"""
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'mean_ms': round(statistics.mean(latencies), 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'ops_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0.0
+    }
+
+
+def time_calls(call: Callable[[int], bool], iterations: int) -> Dict[str, Any]:
+    """
+    顺序执行call(i) iterations次，call返回False或抛出异常计为错误
+    传入序号便于每次写入不同的值，避免更新因数据未改变而被跳过
+    """
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        call_start = time.perf_counter()
+        try:
+            ok = call(i)
+        except Exception:
+            ok = False
+        if ok:
+            latencies.append((time.perf_counter() - call_start) * 1000)
+        else:
+            errors += 1
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def make_client_factory(mongo_uri: str, backend: str = "memory") -> Callable[..., Any]:
+    """
+    返回 MongoDBManager 使用的客户端工厂
+    未指定mongo_uri时使用内存引擎（storage.MemoryClient）或mongomock；所有管理器共享同一个客户端
+    """
+    if not mongo_uri:
+        if backend == "memory":
+            client = MemoryClient("benchmark")
+        else:
+            try:
+                import mongomock
+            except ImportError:
+                raise SystemExit("未安装mongomock，请执行 pip install mongomock 或使用 --backend memory")
+            client = mongomock.MongoClient()
+        return lambda *args, **kwargs: client
+
+    # 写入合成数据前会清空集合，只允许连接本地实例
+    if urlparse(mongo_uri).hostname not in LOCAL_HOSTS:
+        raise SystemExit(f"--mongo-uri 只允许本地地址: {mongo_uri}")
+    return MongoClient
+
+
+def bench_http(manager: sc.MongoDBManager, uids: List[int], iterations: int) -> Dict[str, Any]:
+    """通过Flask测试客户端测量各HTTP接口"""
+    import app as app_module
+
+    # 替换模块级管理器（懒加载，尚未创建时不会连接数据库），路由函数在调用时读取全局manager
+    if app_module.manager.created():
+        app_module.manager.close()
+    app_module.manager = manager
+    client = app_module.app.test_client()
+    rng = random.Random(0)
+    car_lists = {
+        doc["uid"]: list(doc["car_garage"]["car_list"])
+        for doc in manager.db["UserExtraInfo"].find(
+            {"uid": {"$in": uids[:100]}}, {"uid": 1, "car_garage.car_list": 1}
+        )
+    }
+    car_uids = list(car_lists)
+
+    def ok(resp) -> bool:
+        return resp.status_code == 200 and resp.get_json().get('success', False)
+
+    results = {}
+    for size in QUERY_SIZES:
+        if size > len(uids):
+            continue
+
+        def query(i, size=size):
+            sample = ",".join(str(uid) for uid in rng.sample(uids, size))
+            return ok(client.get(f"/query?uids={sample}&type=all"))
+        results[f"http_query_{size}"] = time_calls(query, iterations)
+
+    def update_user(i):
+        return ok(client.post("/update-user", json={
+            'uid': rng.choice(uids), 'score': i + 1, 'level': i % 30
+        }))
+    results["http_update_user"] = time_calls(update_user, iterations)
+
+    def update_cars(i):
+        uid = car_uids[i % len(car_uids)]
+        updates = {
+            car_id: {'rank_score': i + 1, 'season_best_rank_score': i + 1, 'palace_scores': [i] * 5}
+            for car_id in car_lists[uid][:3]
+        }
+        return ok(client.post("/car/batch-update-user-cars", json={'uid': uid, 'updates': updates}))
+    if car_uids:
+        results["http_batch_update_user_cars"] = time_calls(update_cars, iterations)
+
+    def update_rank_list(i):
+        return ok(client.post("/rank-list/batch-update-list", json={
+            'uids': rng.sample(uids, min(100, len(uids))), 'new_list': [i % 8 + 1] * 5
+        }))
+    results["http_batch_update_list_100"] = time_calls(update_rank_list, iterations)
+    return results
+
+
+def bench_cli(manager: sc.MongoDBManager, uids: List[int], iterations: int, batch_uids: int) -> Dict[str, Any]:
+    """在同一个管理器上执行 sc.main 测量命令行批量命令，命令输出被丢弃"""
+    work_dir = tempfile.mkdtemp(prefix="sc_bench_")
+    uid_file = os.path.join(work_dir, "uids.txt")
+    with open(uid_file, 'w') as f:
+        f.write("\n".join(str(uid) for uid in uids[:batch_uids]) + "\n")
+
+    def run(argv: List[str]) -> bool:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sc.main(argv, manager)
+        return True
+
+    commands = {
+        "cli_query_ndjson": lambda i: [
+            "query", "--file", uid_file, "--format", "ndjson",
+            "--output", os.path.join(work_dir, "query.ndjson")
+        ],
+        "cli_batch_update_list": lambda i: [
+            "rank-list", "batch-update-list", "--file", uid_file, "--new-list", json.dumps([i % 8 + 1] * 5)
+        ],
+        "cli_batch_update_record": lambda i: [
+            "rank-list", "batch-update-record", "--file", uid_file, "--index", "0", "--value", str(i % 8 + 1)
+        ],
+        "cli_job_update_list": lambda i: [
+            "job", "--file", uid_file, "--action", "update-list", "--new-list", json.dumps([i % 8 + 1] * 5),
+            "--restart", "--checkpoint", os.path.join(work_dir, "job.checkpoint.json"),
+            "--log", os.path.join(work_dir, "job.ndjson")
+        ],
+    }
+    results = {}
+    for name, build_argv in commands.items():
+        stats = time_calls(lambda i: run(build_argv(i)), iterations)
+        stats['uids'] = min(batch_uids, len(uids))
+        results[name] = stats
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试（内存库或本地mongod + 合成数据）")
+    parser.add_argument("--mongo-uri", type=str, help="本地mongod地址，不指定时使用--backend指定的内存库")
+    parser.add_argument("--backend", choices=["memory", "mongomock"], default="memory",
+                        help="内存库实现：memory为storage模块的内存引擎，mongomock需要单独安装")
+    parser.add_argument("--users", type=int, default=10000, help="合成用户数")
+    parser.add_argument("--cars-per-user", type=int, default=30, help="每个用户的平均车辆数")
+    parser.add_argument("--rank-list-len", type=int, default=20, help="recent_rank_list长度")
+    parser.add_argument("--string-uid-ratio", type=float, default=0.0,
+                        help="UserExtraInfo中以字符串保存uid的比例")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--iterations", type=int, default=50, help="每个HTTP场景的执行次数")
+    parser.add_argument("--cli-iterations", type=int, default=5, help="每个命令行场景的执行次数")
+    parser.add_argument("--cli-uids", type=int, default=1000, help="命令行批量命令使用的UID数量")
+    parser.add_argument("--cache-size", type=int, default=0, help="开启读缓存并指定最大条目数")
+    parser.add_argument("--skip-http", action="store_true", help="跳过HTTP接口")
+    parser.add_argument("--skip-cli", action="store_true", help="跳过命令行命令")
+    parser.add_argument("--output", type=str, default="benchmark_results.json", help="结果写入的JSON文件")
+    args = parser.parse_args()
+
+    manager = sc.MongoDBManager(
+        uid_normalized=args.string_uid_ratio == 0 or None,
+        uri=args.mongo_uri,
+        client_factory=make_client_factory(args.mongo_uri, args.backend)
+    )
+    if not manager.connect():
+        return
+    if args.cache_size > 0:
+        manager.enable_cache(args.cache_size)
+
+    seed_start = time.perf_counter()
+    uids = seed_population(
+        manager.db, args.users, args.cars_per_user, args.rank_list_len, args.string_uid_ratio, args.seed
+    )
+    print(f"已写入 {len(uids)} 个用户，耗时 {time.perf_counter() - seed_start:.1f}s")
+
+    results = {}
+    if not args.skip_http:
+        results.update(bench_http(manager, uids, args.iterations))
+    if not args.skip_cli:
+        results.update(bench_cli(manager, uids, args.cli_iterations, args.cli_uids))
+
+    print(f"{'场景':<32}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'ops/s':>10}{'错误':>6}")
+    for name, stats in results.items():
+        print(f"{name:<32}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+              f"{stats['ops_per_sec']:>10}{stats['errors']:>6}")
+
+    report = {
+        'meta': {
+            'backend': 'mongod' if args.mongo_uri else args.backend,
+            'users': args.users,
+            'cars_per_user': args.cars_per_user,
+            'rank_list_len': args.rank_list_len,
+            'string_uid_ratio': args.string_uid_ratio,
+            'seed': args.seed,
+            'cache_size': args.cache_size,
+            'python': platform.python_version(),
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
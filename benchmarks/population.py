@@ -0,0 +1,95 @@
+import random
+from typing import Dict, Any, List
+
+# 合成测试数据：结构与线上 UserInfo / UserExtraInfo 文档一致，
+# 车辆数量和比赛记录长度按参数随机生成，固定随机种子保证每次结果可比
+
+FIRST_UID = 10000000
+FIRST_CAR_ID = 1001
+
+
+def make_user_info(uid: int, rng: random.Random) -> Dict[str, Any]:
+    """生成一个UserInfo文档"""
+    return {
+        "uid": uid,
+        "racetrack_rank_data": {
+            "rank_score": rng.randint(0, 5000),
+            "rank_level": rng.randint(0, 30)
+        }
+    }
+
+
+def make_user_extra_info(
+        uid: int,
+        rng: random.Random,
+        cars_per_user: int,
+        rank_list_len: int,
+        string_uid: bool = False,
+        extra_car_fields: int = 0
+) -> Dict[str, Any]:
+    """
+    生成一个UserExtraInfo文档
+    车辆数在 [cars_per_user/2, cars_per_user*3/2] 内随机，每辆车5个殿堂分；
+    string_uid 为True时以字符串保存uid，模拟未规范化的历史数据；
+    extra_car_fields 为每辆车在分数字段之后追加的其他字段数（改装、外观等），不消耗随机数
+    """
+    car_count = rng.randint(max(1, cars_per_user // 2), max(1, cars_per_user * 3 // 2))
+    car_ids = rng.sample(range(FIRST_CAR_ID, FIRST_CAR_ID + car_count * 4), car_count)
+    car_list = {
+        str(car_id): {
+            "rank_score": rng.randint(0, 3000),
+            "season_best_rank_score": rng.randint(0, 3000),
+            "palace_score_list": [
+                {"score": rng.randint(0, 100), "protect_state": 0} for _ in range(5)
+            ]
+        }
+        for car_id in car_ids
+    }
+    for car in car_list.values():
+        car.update(make_car_attributes(extra_car_fields))
+    return {
+        "uid": str(uid) if string_uid else uid,
+        "car_garage": {"car_list": car_list},
+        "racetrack_match_data": {
+            "recent_rank_list": [rng.randint(1, 8) for _ in range(rank_list_len)]
+        }
+    }
+
+
+def make_car_attributes(count: int) -> Dict[str, Any]:
+    """生成车辆上与分数无关的字段，奇数项为嵌套文档"""
+    return {
+        f"attr_{i}": {"level": i % 10, "exp": i * 100, "parts": [i, i + 1, i + 2]} if i % 2 else i
+        for i in range(count)
+    }
+
+
+def seed_population(
+        db,
+        users: int,
+        cars_per_user: int = 30,
+        rank_list_len: int = 20,
+        string_uid_ratio: float = 0.0,
+        seed: int = 42,
+        batch_size: int = 1000
+) -> List[int]:
+    """
+    清空并写入合成数据，返回生成的UID列表
+    db: pymongo/mongomock 的 Database 对象
+    string_uid_ratio: UserExtraInfo 中以字符串保存uid的比例
+    """
+    rng = random.Random(seed)
+    db["UserInfo"].delete_many({})
+    db["UserExtraInfo"].delete_many({})
+
+    uids = list(range(FIRST_UID, FIRST_UID + users))
+    for start in range(0, users, batch_size):
+        batch = uids[start:start + batch_size]
+        db["UserInfo"].insert_many([make_user_info(uid, rng) for uid in batch])
+        db["UserExtraInfo"].insert_many([
+            make_user_extra_info(uid, rng, cars_per_user, rank_list_len, rng.random() < string_uid_ratio)
+            for uid in batch
+        ])
+    db["UserInfo"].create_index("uid")
+    db["UserExtraInfo"].create_index("uid")
+    return uids
@@ -0,0 +1,105 @@
+import argparse
+import json
+import platform
+import random
+import time
+from typing import Dict, Any, List, Callable
+
+import sc
+from storage import MemoryClient
+from http_codec import JSON_BACKENDS, COMPRESSORS, available_encodings
+from benchmarks.offline import time_calls
+from benchmarks.population import seed_population
+
+# /query 响应的序列化和压缩基准：在内存引擎中写入合成数据，构造与 /query 相同的响应体，
+# 对比Flask默认jsonify（标准库json、sort_keys）与各JSON编码器的耗时，以及各压缩算法的字节数和耗时：
+#   python -m benchmarks.serialization --users 2000 --cars-per-user 300 --query-size 100
+
+
+def build_query_payload(manager: sc.MongoDBManager, uids: List[int]) -> Dict[str, Any]:
+    """与 app.py /query?type=all&position=1 返回的结构一致"""
+    bulk_data = manager.get_users_bulk(uids, sc.QUERY_PARTS)
+    positions = manager.get_user_positions(uids)
+    results = {str(uid): bulk_data[uid] for uid in uids}
+    for uid in uids:
+        results[str(uid)]['position'] = positions[uid]
+    return {'success': True, 'data': results}
+
+
+def flask_default_dumps(obj: Any) -> bytes:
+    """Flask DefaultJSONProvider 在非调试模式下的输出方式"""
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def bench_encoders(payload: Dict[str, Any], iterations: int) -> Dict[str, Dict[str, Any]]:
+    encoders: Dict[str, Callable[[Any], bytes]] = {"flask_default": flask_default_dumps}
+    for name, codec_class in JSON_BACKENDS.items():
+        try:
+            encoders[name] = codec_class().dumps
+        except ImportError as e:
+            print(f"跳过 {name}: {e}")
+
+    results = {}
+    for name, dumps in encoders.items():
+        stats = time_calls(lambda i: bool(dumps(payload)), iterations)
+        stats['bytes'] = len(dumps(payload))
+        results[f"encode_{name}"] = stats
+    return results
+
+
+def bench_compression(body: bytes, iterations: int) -> Dict[str, Dict[str, Any]]:
+    results = {"compress_identity": {'bytes': len(body), 'ratio': 1.0}}
+    for encoding in available_encodings():
+        compress = COMPRESSORS[encoding]
+        stats = time_calls(lambda i: bool(compress(body)), iterations)
+        stats['bytes'] = len(compress(body))
+        stats['ratio'] = round(stats['bytes'] / len(body), 4) if body else 0.0
+        results[f"compress_{encoding}"] = stats
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/query 响应序列化和压缩基准（内存引擎 + 合成数据）")
+    parser.add_argument("--users", type=int, default=2000, help="合成用户数")
+    parser.add_argument("--cars-per-user", type=int, default=300, help="每个用户的平均车辆数")
+    parser.add_argument("--rank-list-len", type=int, default=20, help="recent_rank_list长度")
+    parser.add_argument("--query-size", type=int, default=100, help="一次 /query 的UID数量")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--iterations", type=int, default=20, help="每个场景的执行次数")
+    parser.add_argument("--output", type=str, default="serialization_results.json", help="结果写入的JSON文件")
+    args = parser.parse_args()
+
+    manager = sc.MongoDBManager(uid_normalized=True, uri="serialization", client_factory=MemoryClient)
+    manager.connect()
+    uids = seed_population(manager.db, args.users, args.cars_per_user, args.rank_list_len, 0.0, args.seed)
+    manager.build_rank_index()
+    sample = random.Random(args.seed).sample(uids, min(args.query_size, len(uids)))
+    payload = build_query_payload(manager, sample)
+
+    results = bench_encoders(payload, args.iterations)
+    body = JSON_BACKENDS["json"]().dumps(payload)
+    results.update(bench_compression(body, args.iterations))
+
+    print(f"{'场景':<28}{'p50(ms)':>10}{'p95(ms)':>10}{'字节数':>14}")
+    for name, stats in results.items():
+        print(f"{name:<28}{stats.get('p50_ms', 0.0):>10}{stats.get('p95_ms', 0.0):>10}{stats['bytes']:>14}")
+
+    report = {
+        'meta': {
+            'users': args.users,
+            'cars_per_user': args.cars_per_user,
+            'rank_list_len': args.rank_list_len,
+            'query_size': len(sample),
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
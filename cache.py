@@ -0,0 +1,245 @@
+import asyncio
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+# 缓存未命中时的返回值，与缓存的None区分
+MISSING = object()
+
+
+class Generations:
+    """
+    按key计数的修改代数：数据被修改时递增，读取前记录、读取后比较，判断读取期间是否有写入
+    计数按key的哈希分段存放，占用内存固定；不同key落在同一段时只会多判断为已修改
+    """
+
+    def __init__(self, stripes: int = 4096):
+        self._counts = [0] * stripes
+        self._lock = threading.Lock()
+
+    def bump(self, key: Hashable) -> None:
+        with self._lock:
+            self._counts[hash(key) % len(self._counts)] += 1
+
+    def get(self, key: Hashable) -> int:
+        return self._counts[hash(key) % len(self._counts)]
+
+    def stamp(self, keys: Iterable[Hashable]) -> int:
+        """
+        多个key的代数之和，作为批量读取的合并标记（SingleFlight.do 的stamp）；
+        计数只增不减，任一key被修改后结果都会变化
+        """
+        return sum(self.get(key) for key in keys)
+
+
+class LRUTTLCache:
+    """线程安全的LRU缓存，容量有上限，每个条目有独立的过期时间"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30.0):
+        """
+        max_size: 最多缓存的条目数，超出时淘汰最久未使用的条目
+        ttl: 条目的有效期（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+
+    def get(self, key: Hashable) -> Any:
+        """读取缓存，未命中或已过期时返回MISSING"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+        # 返回副本，避免调用方修改缓存中的数据
+        return copy.deepcopy(value)
+
+    def set(self, key: Hashable, value: Any, valid: Optional[Callable[[], bool]] = None) -> None:
+        """
+        写入缓存；valid在持有锁时调用，返回False表示读取期间数据已被修改，不写入
+        调用方在数据修改后先使valid失效、再调用invalidate，写入和删除不会交错出旧值
+        """
+        value = copy.deepcopy(value)
+        with self._lock:
+            if valid is not None and not valid():
+                self.stale_sets += 1
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """删除指定条目"""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale_sets': self.stale_sets
+            }
+
+
+class _Flight:
+    """一次正在执行的调用，等待者共享其结果或异常"""
+
+    __slots__ = ("done", "result", "error", "waiters", "stamp")
+
+    def __init__(self, stamp: Any = None):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        self.stamp = stamp
+
+
+class SingleFlight:
+    """
+    合并并发的相同读取：同一个key同时只执行一次fn，
+    执行期间到达的调用等待并得到结果的副本（异常同样传递给所有等待者）
+    stamp 为调用时数据的修改代数（见 Generations），与正在执行的调用不同时说明其开始后数据已被修改，
+    不再加入而是重新执行，新到达的调用加入新的执行
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], stamp: Any = None) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None or flight.stamp != stamp
+            if leader:
+                flight = self._flights[key] = _Flight(stamp)
+                self.calls += 1
+            else:
+                flight.waiters += 1
+                self.shared += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # 每个等待者得到独立的副本，避免调用方修改共享结果
+            return copy.deepcopy(flight.result)
+
+        result = None
+        try:
+            result = fn()
+            return result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                # 数据被修改后同一key可能已开始新的执行
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            # 移出后不会再有新的等待者；调用方拿到结果前保存一份副本供等待者复制
+            if flight.waiters and flight.error is None:
+                flight.result = copy.deepcopy(result)
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回合并统计：calls为实际执行次数，shared为被合并（节省）的调用次数"""
+        with self._lock:
+            total = self.calls + self.shared
+            return {
+                'in_flight': len(self._flights),
+                'calls': self.calls,
+                'shared': self.shared,
+                'shared_rate': round(self.shared / total, 4) if total else 0.0
+            }
+
+
+class _AsyncFlight:
+    __slots__ = ("future", "waiters", "stamp")
+
+    def __init__(self, future: asyncio.Future, stamp: Any):
+        self.future = future
+        self.waiters = 0
+        self.stamp = stamp
+
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight 的 asyncio 版本，只能在同一个事件循环中使用"""
+
+    def __init__(self):
+        super().__init__()
+        self._futures: Dict[Hashable, _AsyncFlight] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], stamp: Any = None) -> Any:
+        flight = self._futures.get(key)
+        if flight is not None and flight.stamp == stamp:
+            flight.waiters += 1
+            self.shared += 1
+            # shield：某个等待者被取消时不影响正在执行的调用
+            result = await asyncio.shield(flight.future)
+            return copy.deepcopy(result)
+
+        future = asyncio.get_running_loop().create_future()
+        flight = self._futures[key] = _AsyncFlight(future, stamp)
+        # 没有等待者时也取出异常，避免事件循环报告未处理的异常
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.calls += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            # 等待者在调用方之后才恢复执行，保存副本避免读到被调用方修改的结果
+            future.set_result(copy.deepcopy(result) if flight.waiters else result)
+            return result
+        finally:
+            if self._futures.get(key) is flight:
+                del self._futures[key]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.calls + self.shared
+        return {
+            'in_flight': len(self._futures),
+            'calls': self.calls,
+            'shared': self.shared,
+            'shared_rate': round(self.shared / total, 4) if total else 0.0
+        }
@@ -0,0 +1,269 @@
+import dataclasses
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, Optional
+
+# HTTP响应的JSON编码和压缩：
+#   JSON_BACKEND=orjson|json   JSON编码器，默认安装了orjson时使用orjson
+#   HTTP_COMPRESSION=off       关闭响应压缩
+#   HTTP_COMPRESS_MIN_SIZE     响应体超过该字节数时按Accept-Encoding压缩（br优先，其次gzip）
+
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+# 客户端q值相同时的优先顺序
+ENCODING_PREFERENCE = ("br", "gzip")
+
+
+def _default(obj: Any) -> Any:
+    """标准库和orjson都无法直接编码的类型（如ObjectId）转换为可编码的值"""
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+class StdJSONCodec:
+    """标准库json，紧凑格式输出UTF-8"""
+
+    name = "json"
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(",", ":"), default=_default, sort_keys=sort_keys
+        ).encode("utf-8")
+
+    def loads(self, data: Any) -> Any:
+        return json.loads(data)
+
+
+class ORJSONCodec:
+    """
+    orjson编码器，需要安装orjson；允许非字符串的字典键（如整数UID）
+    orjson无法编码的值（如超过64位的整数）改用标准库编码
+    """
+
+    name = "orjson"
+
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError:
+            raise ImportError("未安装orjson，请执行 pip install orjson 或设置 JSON_BACKEND=json")
+        self._orjson = orjson
+        self._option = orjson.OPT_NON_STR_KEYS
+        self._fallback = StdJSONCodec()
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        option = self._option | self._orjson.OPT_SORT_KEYS if sort_keys else self._option
+        try:
+            return self._orjson.dumps(obj, default=_default, option=option)
+        except self._orjson.JSONEncodeError:
+            return self._fallback.dumps(obj, sort_keys)
+
+    def loads(self, data: Any) -> Any:
+        return self._orjson.loads(data)
+
+
+JSON_BACKENDS: Dict[str, Callable[[], Any]] = {
+    "json": StdJSONCodec,
+    "orjson": ORJSONCodec,
+}
+
+
+def get_json_codec(name: Optional[str] = None):
+    """
+    按名称创建JSON编码器，未指定时读取环境变量JSON_BACKEND；
+    都未指定时优先使用orjson，未安装则使用标准库
+    """
+    name = name or os.environ.get("JSON_BACKEND")
+    if name:
+        if name not in JSON_BACKENDS:
+            raise ValueError(f"未知的JSON编码器: {name}，可选: {', '.join(JSON_BACKENDS)}")
+        return JSON_BACKENDS[name]()
+    try:
+        return ORJSONCodec()
+    except ImportError:
+        return StdJSONCodec()
+
+
+# ==================== 响应压缩 ====================
+def _brotli_compress(body: bytes) -> bytes:
+    import brotli
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+def _gzip_compress(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "br": _brotli_compress,
+    "gzip": _gzip_compress,
+}
+
+
+def available_encodings() -> tuple:
+    """当前环境支持的压缩算法，br需要安装brotli"""
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return tuple(enc for enc in ENCODING_PREFERENCE if enc != "br")
+    return ENCODING_PREFERENCE
+
+
+def negotiate_encoding(accept_encoding: Optional[str], encodings: tuple = ENCODING_PREFERENCE) -> Optional[str]:
+    """
+    根据Accept-Encoding（支持q值和*）从encodings中选出压缩算法，不可压缩时返回None
+    q值相同时按encodings的顺序选择
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        token, _, params = item.strip().partition(";")
+        token = token.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            weights[token] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    return COMPRESSORS[encoding](body)
+
+
+# ==================== 条件请求 ====================
+def body_etag(body: bytes) -> str:
+    """根据已序列化的响应体计算强ETag，不需要重新编码"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _etag_base(tag: str) -> str:
+    """去掉弱标记W/和压缩时追加的编码后缀，得到未压缩响应体的ETag"""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for encoding in COMPRESSORS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """If-None-Match（按弱比较）包含etag时返回匹配到的客户端ETag，否则返回None"""
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or _etag_base(tag) == etag:
+            return tag if tag != "*" else etag
+    return None
+
+
+def make_conditional(response, if_none_match: Optional[str]):
+    """
+    为200的JSON响应加上ETag，If-None-Match匹配时改为不带响应体的304
+    304沿用客户端持有的ETag（可能带有压缩编码后缀）
+    """
+    if response.status_code != 200 or response.is_streamed:
+        return response
+    return _apply_etag(response, response.get_data(), if_none_match)
+
+
+async def make_conditional_async(response, if_none_match: Optional[str]):
+    """make_conditional 的Quart版本，Quart响应体需要await读取"""
+    if response.status_code != 200:
+        return response
+    return _apply_etag(response, await response.get_data(), if_none_match)
+
+
+def _apply_etag(response, body: bytes, if_none_match: Optional[str]):
+    etag = body_etag(body)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    matched = etag_matches(if_none_match, etag)
+    if matched:
+        response.status_code = 304
+        response.set_data(b"")
+        response.headers["ETag"] = matched
+        for header in ("Content-Type", "Content-Length"):
+            response.headers.pop(header, None)
+    return response
+
+
+# ==================== Flask集成 ====================
+def install_flask(app, codec=None, min_size: Optional[int] = None) -> None:
+    """
+    替换app的JSON编码器（jsonify和request.get_json都会使用），
+    并在min_size不为None时压缩超过min_size字节的响应；
+    不传参数时按环境变量JSON_BACKEND、HTTP_COMPRESSION、HTTP_COMPRESS_MIN_SIZE配置
+    """
+    from flask import request
+    from flask.json.provider import DefaultJSONProvider
+
+    codec = codec or get_json_codec()
+    if min_size is None and os.environ.get("HTTP_COMPRESSION", "on") != "off":
+        min_size = int(os.environ.get("HTTP_COMPRESS_MIN_SIZE", COMPRESS_MIN_SIZE))
+
+    class CodecJSONProvider(DefaultJSONProvider):
+        # 默认不排序键（Flask默认排序），需要稳定的键顺序时设置 app.json.sort_keys = True
+        sort_keys = False
+
+        def dumps(self, obj: Any, **kwargs) -> str:
+            return codec.dumps(obj, kwargs.get("sort_keys", self.sort_keys)).decode("utf-8")
+
+        def loads(self, s: Any, **kwargs) -> Any:
+            return codec.loads(s)
+
+        def response(self, *args, **kwargs):
+            # 直接使用编码器输出的bytes，不经过str转换
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(codec.dumps(obj, self.sort_keys), mimetype=self.mimetype)
+
+    app.json = CodecJSONProvider(app)
+    if min_size is None:
+        return
+
+    encodings = available_encodings()
+
+    @app.after_request
+    def _compress_response(response):
+        if response.status_code == 304:
+            response.vary.add("Accept-Encoding")
+            return response
+        if (response.direct_passthrough or response.is_streamed
+                or not 200 <= response.status_code < 300 or "Content-Encoding" in response.headers):
+            return response
+        response.vary.add("Accept-Encoding")
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        encoding = negotiate_encoding(request.headers.get("Accept-Encoding"), encodings)
+        if encoding:
+            response.set_data(compress(body, encoding))
+            response.headers["Content-Encoding"] = encoding
+            # 压缩后的表示与原响应体不同，强ETag追加编码后缀
+            etag = response.headers.get("ETag")
+            if etag and not etag.startswith("W/"):
+                response.headers["ETag"] = etag[:-1] + f'-{encoding}"'
+        return response
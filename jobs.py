@@ -0,0 +1,547 @@
+import hashlib
+import json
+import math
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Dict, Any, List, Tuple, Iterator, Callable, Set
+
+
+def iter_uid_chunks(file_path: str, chunk_size: int) -> Iterator[Tuple[int, List[int], List[str]]]:
+    """
+    流式读取UID文件，按chunk_size分块
+    每次返回 (块序号, UID列表, 无法解析的行)，不会一次性读入整个文件
+    """
+    index, uids, invalid = 0, [], []
+    with open(file_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.isdigit():
+                uids.append(int(line))
+            else:
+                invalid.append(line)
+            if len(uids) >= chunk_size:
+                yield index, uids, invalid
+                index, uids, invalid = index + 1, [], []
+    if uids or invalid:
+        yield index, uids, invalid
+
+
+def file_signature(file_path: str) -> Dict[str, Any]:
+    """
+    文件的标识：绝对路径、大小和修改时间（纳秒）
+    同一路径的文件被替换或修改后标识不同，断点不再适用
+    """
+    stat = os.stat(file_path)
+    return {'path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class JobCheckpoint:
+    """记录已完成的块序号，任务参数一致时重新执行会跳过这些块"""
+
+    def __init__(self, path: str, signature: Dict[str, Any], restart: bool = False):
+        """
+        path: 断点文件路径
+        signature: 任务参数，与断点文件中的不一致时视为新任务
+        restart: 忽略已有断点从头开始
+        """
+        self.path = path
+        self.signature = signature
+        self.done: Set[int] = set()
+        if not restart and os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json.load(f)
+            if state.get('signature') == signature:
+                self.done = set(state.get('done', []))
+
+    def mark_done(self, index: int) -> None:
+        """标记一个块已完成，先写临时文件再替换，避免中断时写坏断点文件"""
+        self.done.add(index)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'signature': self.signature, 'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        """任务全部完成后删除断点文件"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class NDJSONLog:
+    """线程安全的NDJSON日志，每条记录一行"""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def run_chunked_job(
+        chunks: Iterator[Tuple[int, List[int], List[str]]],
+        process_chunk: Callable[[List[int]], Dict[int, Dict[str, Any]]],
+        workers: int = 4,
+        checkpoint: Optional[JobCheckpoint] = None,
+        log: Optional[NDJSONLog] = None,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    在有界线程池上逐块执行任务
+    chunks: iter_uid_chunks 返回的块
+    process_chunk: 处理一个块，返回 {uid: {'success': bool, 'error': ...}}
+    同时提交的块不超过 workers * 2，避免大文件一次性全部入队；
+    块完成后写断点，失败的UID以 type=error 的记录写入日志
+    """
+    summary = {
+        'chunks': 0, 'skipped_chunks': 0, 'uids': 0,
+        'success': 0, 'failed': 0, 'invalid_lines': 0
+    }
+    start = time.perf_counter()
+
+    def record(entry: Dict[str, Any]) -> None:
+        if log:
+            log.write(entry)
+
+    def finish(index: int, uids: List[int], chunk_start: float, future) -> None:
+        try:
+            results = future.result()
+        except Exception as e:
+            results = {uid: {'success': False, 'error': str(e)} for uid in uids}
+        failed = [(uid, r.get('error')) for uid, r in results.items() if not r.get('success')]
+        for uid, error in failed:
+            record({'type': 'error', 'chunk': index, 'uid': uid, 'error': error})
+
+        elapsed = time.perf_counter() - chunk_start
+        summary['chunks'] += 1
+        summary['uids'] += len(uids)
+        summary['success'] += len(results) - len(failed)
+        summary['failed'] += len(failed)
+        total_elapsed = time.perf_counter() - start
+        summary['elapsed'] = round(total_elapsed, 3)
+        summary['uids_per_sec'] = round(summary['uids'] / total_elapsed, 2) if total_elapsed else 0.0
+        record({
+            'type': 'chunk', 'chunk': index, 'uids': len(uids), 'failed': len(failed),
+            'elapsed': round(elapsed, 3), 'uids_per_sec': summary['uids_per_sec']
+        })
+        if checkpoint:
+            checkpoint.mark_done(index)
+        if on_progress:
+            on_progress(summary)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for index, uids, invalid in chunks:
+            if checkpoint and index in checkpoint.done:
+                summary['skipped_chunks'] += 1
+                continue
+            for line in invalid:
+                summary['invalid_lines'] += 1
+                record({'type': 'error', 'chunk': index, 'line': line, 'error': '无效UID'})
+            if not uids:
+                if checkpoint:
+                    checkpoint.mark_done(index)
+                continue
+
+            # 在途块达到上限时等待任一块完成
+            while len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(*pending.pop(future), future)
+            pending[pool.submit(process_chunk, uids)] = (index, uids, time.perf_counter())
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(*pending.pop(future), future)
+
+    total_elapsed = time.perf_counter() - start
+    summary['elapsed'] = round(total_elapsed, 3)
+    summary['uids_per_sec'] = round(summary['uids'] / total_elapsed, 2) if total_elapsed else 0.0
+    record({'type': 'summary', **summary})
+    return summary
+
+
+# ==================== 后台任务 ====================
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+# 进程重启后需要继续执行的状态；interrupted 表示执行过程中出现了块处理以外的异常（如进程退出）
+RESUMABLE_STATUSES = ("queued", "running", "interrupted")
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    """先写临时文件再替换，读取方不会读到写了一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+
+class JobStore:
+    """
+    任务持久化在本地目录，服务重启或多进程部署时各进程共享：
+      <id>.json             任务参数、状态和进度
+      <id>.uids             待处理的UID，每行一个（由 iter_uid_chunks 流式读取）
+      <id>.checkpoint.json  已完成的块（JobCheckpoint）
+      <id>.ndjson           块进度和失败UID（NDJSONLog）
+      <id>.lock             正在执行该任务的进程号
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{job_id}{suffix}")
+
+    @staticmethod
+    def new_id(idempotency_key: Optional[str] = None) -> str:
+        """生成任务ID；指定幂等键时ID由幂等键决定，客户端重试提交不会创建重复任务"""
+        if idempotency_key:
+            return hashlib.blake2b(idempotency_key.encode("utf-8"), digest_size=16).hexdigest()
+        return uuid.uuid4().hex
+
+    def create(
+            self,
+            job_id: str,
+            action: str,
+            params: Dict[str, Any],
+            uids: List[int],
+            chunk_size: int
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        写入UID文件和任务状态，返回 (任务状态, 是否新建)
+        相同ID的任务已存在时（包括其他进程同时创建）返回已有任务
+        """
+        existing = self.load(job_id)
+        if existing:
+            return existing, False
+        uids = list(dict.fromkeys(uids))
+        uid_path = self.path(job_id, ".uids")
+        tmp_path = f"{uid_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(f"{uid}\n" for uid in uids)
+        os.replace(tmp_path, uid_path)
+
+        state = {
+            'id': job_id,
+            'action': action,
+            'params': params,
+            'chunk_size': chunk_size,
+            'status': 'queued',
+            'error': None,
+            'created_at': _now(),
+            'started_at': None,
+            'finished_at': None,
+            'progress': {
+                'uids_total': len(uids),
+                'chunks_total': math.ceil(len(uids) / chunk_size),
+                'chunks_done': 0,
+                'processed': 0,
+                'success': 0,
+                'failed': 0,
+                'percent': 0.0 if uids else 100.0,
+                'elapsed': 0.0,
+                'uids_per_sec': 0.0,
+                'eta_sec': None
+            }
+        }
+        # 临时文件以硬链接方式发布，目标已存在时失败，保证同一ID只创建一次
+        path = self.path(job_id, ".json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, ensure_ascii=False, default=str)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            return self.load(job_id), False
+        finally:
+            os.remove(tmp_path)
+        return state, True
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """读取任务状态，任务不存在或ID格式错误时返回None"""
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self.path(job_id, ".json"), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state: Dict[str, Any]) -> None:
+        _write_json(self.path(state['id'], ".json"), state)
+
+    def list(self, limit: Optional[int] = 50) -> List[Dict[str, Any]]:
+        """按创建时间倒序返回最近的任务，limit为None时返回全部"""
+        states = []
+        for name in os.listdir(self.directory):
+            job_id, _, suffix = name.partition(".")
+            if suffix == "json":
+                state = self.load(job_id)
+                if state:
+                    states.append(state)
+        states.sort(key=lambda state: state['created_at'], reverse=True)
+        return states if limit is None else states[:limit]
+
+    def failures(self, job_id: str, limit: int = 100) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        从任务日志读取失败的UID，返回 (最多limit条失败记录, 失败UID总数)
+        重启后重新执行的块可能重复记录同一UID，只保留最后一条
+        """
+        failures: Dict[Any, Dict[str, Any]] = {}
+        try:
+            with open(self.path(job_id, ".ndjson"), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get('type') == 'error':
+                        key = record.get('uid', record.get('line'))
+                        failures.pop(key, None)
+                        failures[key] = {'uid': key, 'error': record.get('error')}
+        except FileNotFoundError:
+            pass
+        return list(failures.values())[:limit], len(failures)
+
+    def claim(self, job_id: str) -> bool:
+        """
+        以当前进程执行任务：锁文件不存在或持有锁的进程已退出时获取成功，
+        其他存活进程正在执行时返回False
+        """
+        lock_path = self.path(job_id, ".lock")
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+            except FileExistsError:
+                try:
+                    with open(lock_path, 'r') as f:
+                        pid = int(f.read().strip() or 0)
+                except (FileNotFoundError, ValueError):
+                    pid = 0
+                if pid and _pid_alive(pid):
+                    return False
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def release(self, job_id: str) -> None:
+        try:
+            os.remove(self.path(job_id, ".lock"))
+        except FileNotFoundError:
+            pass
+
+
+class JobRunner:
+    """
+    后台任务执行器：最多max_jobs个任务同时执行，每个任务由 run_chunked_job 按块并发处理（workers个块并发），
+    每完成一块更新持久化的进度；进程重启后 resume() 从断点继续执行未完成的任务
+    make_processor(action, params) 返回处理一个UID块的函数，参数无效时抛出ValueError
+    """
+
+    def __init__(
+            self,
+            store: JobStore,
+            make_processor: Callable[[str, Dict[str, Any]], Callable[[List[int]], Dict[int, Dict[str, Any]]]],
+            max_jobs: int = 2,
+            workers: int = 4
+    ):
+        self.store = store
+        self.make_processor = make_processor
+        self.max_jobs = max_jobs
+        self.workers = workers
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._active: Set[str] = set()
+        self.finished = {'completed': 0, 'failed': 0, 'interrupted': 0}
+
+    def submit(
+            self,
+            action: str,
+            params: Dict[str, Any],
+            uids: List[int],
+            chunk_size: int,
+            idempotency_key: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        创建任务并排队执行，立即返回 (任务状态, 是否新建)
+        参数在提交时校验，无效时抛出ValueError；幂等键相同的任务已存在时直接返回该任务
+        """
+        self.make_processor(action, params)
+        state, created = self.store.create(
+            self.store.new_id(idempotency_key), action, params, uids, chunk_size
+        )
+        if created:
+            self._enqueue(state['id'])
+        return state, created
+
+    def resume(self) -> int:
+        """继续执行未完成且没有其他存活进程在执行的任务，返回排队的任务数"""
+        count = 0
+        for state in reversed(self.store.list(limit=None)):
+            if state['status'] in RESUMABLE_STATUSES and self._enqueue(state['id']):
+                count += 1
+        return count
+
+    def _enqueue(self, job_id: str) -> bool:
+        with self._lock:
+            if job_id in self._active or not self.store.claim(job_id):
+                return False
+            self._active.add(job_id)
+            if len(self._threads) < self.max_jobs:
+                thread = threading.Thread(target=self._worker, name=f"job-runner-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        self._queue.put(job_id)
+        return True
+
+    def _worker(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                # 执行线程不能退出：记录错误并结束该任务，继续处理后续任务
+                print(f"执行任务失败(ID:{job_id}): {e}")
+                self._abort(job_id, e)
+            finally:
+                with self._lock:
+                    self._active.discard(job_id)
+                self.store.release(job_id)
+
+    def _abort(self, job_id: str, e: Exception) -> None:
+        """
+        _run 中块处理以外的异常（任务状态、断点或日志文件的读写）：
+        文件读写错误（OSError）可能是暂时的，标记为interrupted，重启后继续；其余（如断点文件损坏）标记为failed
+        """
+        status = 'interrupted' if isinstance(e, OSError) else 'failed'
+        self._count(status)
+        try:
+            state = self.store.load(job_id)
+            if state is None:
+                return
+            state.update(status=status, error=str(e))
+            if status == 'failed':
+                state['finished_at'] = _now()
+            self.store.save(state)
+        except Exception as save_error:
+            print(f"保存任务状态失败(ID:{job_id}): {save_error}")
+
+    @staticmethod
+    def _progress(
+            base: Dict[str, Any],
+            summary: Dict[str, Any],
+            chunks_done: int
+    ) -> Dict[str, Any]:
+        """合并之前执行（重启前）和本次执行的进度"""
+        total = base['uids_total']
+        processed = base['processed'] + summary['uids']
+        rate = summary.get('uids_per_sec', 0.0)
+        return {
+            'uids_total': total,
+            'chunks_total': base['chunks_total'],
+            'chunks_done': chunks_done,
+            'processed': processed,
+            'success': base['success'] + summary['success'],
+            'failed': base['failed'] + summary['failed'],
+            'percent': round(processed * 100 / total, 1) if total else 100.0,
+            'elapsed': round(base['elapsed'] + summary.get('elapsed', 0.0), 3),
+            'uids_per_sec': rate,
+            'eta_sec': round((total - processed) / rate, 1) if rate else None
+        }
+
+    def _run(self, job_id: str) -> None:
+        state = self.store.load(job_id)
+        if state is None or state['status'] not in RESUMABLE_STATUSES:
+            return
+        try:
+            process_chunk = self.make_processor(state['action'], state['params'])
+        except ValueError as e:
+            state.update(status='failed', error=str(e), finished_at=_now())
+            self.store.save(state)
+            self._count('failed')
+            return
+
+        base = dict(state['progress'])
+        state.update(status='running', error=None, started_at=state['started_at'] or _now())
+        self.store.save(state)
+        checkpoint = JobCheckpoint(
+            self.store.path(job_id, ".checkpoint.json"), {'id': job_id, 'chunk_size': state['chunk_size']}
+        )
+        log = NDJSONLog(self.store.path(job_id, ".ndjson"))
+
+        def on_progress(summary):
+            state['progress'] = self._progress(base, summary, len(checkpoint.done))
+            self.store.save(state)
+
+        try:
+            summary = run_chunked_job(
+                iter_uid_chunks(self.store.path(job_id, ".uids"), state['chunk_size']),
+                process_chunk,
+                workers=self.workers,
+                checkpoint=checkpoint,
+                log=log,
+                on_progress=on_progress
+            )
+        except Exception as e:
+            # 块处理的异常已记为UID失败，这里是文件读写、线程池关闭等异常，保留断点以便重启后继续
+            state.update(status='interrupted', error=str(e))
+            self.store.save(state)
+            self._count('interrupted')
+            return
+        finally:
+            log.close()
+
+        state['progress'] = self._progress(base, summary, len(checkpoint.done))
+        state['progress']['eta_sec'] = 0.0
+        state.update(status='completed', finished_at=_now())
+        self.store.save(state)
+        checkpoint.remove()
+        self._count('completed')
+
+    def _count(self, status: str) -> None:
+        with self._lock:
+            self.finished[status] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'max_jobs': self.max_jobs,
+                'workers': self.workers,
+                'running': len(self._active) - self._queue.qsize(),
+                'queued': self._queue.qsize(),
+                **self.finished
+            }
@@ -0,0 +1,198 @@
+import re
+import struct
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+# 按需解码UserExtraInfo的原始BSON：
+#   查询时以 RAW_BSON_CODEC_OPTIONS 读取，驱动只切分文档不解码字段；
+#   RawCarList 只保存car_list的字节，计算车辆分数时从每辆车中截取
+#   rank_score、season_best_rank_score 和 palace_score_list 三个元素拼成精简文档，一次解码，其余字段不解码；
+#   按车辆ID访问时才完整解码该车辆
+# 字节格式参见 https://bsonspec.org/spec.html
+
+RAW_BSON_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+# 车辆分数只用到的字段
+SCORE_FIELDS = (b"rank_score", b"season_best_rank_score", b"palace_score_list")
+# 车辆文档以这三个字段（按此顺序，数值类型）开头时，一次匹配即可确定它们的字节范围；
+# 从车辆文档的第一个元素开始锚定匹配，每个分支恰好覆盖一个完整元素
+_SCORE_PREFIX = re.compile(
+    rb"(?:\x10rank_score\x00.{4}|[\x01\x12]rank_score\x00.{8})"
+    rb"(?:\x10season_best_rank_score\x00.{4}|[\x01\x12]season_best_rank_score\x00.{8})"
+    rb"\x04palace_score_list\x00",
+    re.DOTALL
+)
+
+_unpack_int32 = struct.Struct("<i").unpack_from
+_pack_int32 = struct.Struct("<i").pack
+
+_DOCUMENT = 0x03
+_ARRAY = 0x04
+# 定长类型的值字节数：double、ObjectId、bool、datetime、null、int32、timestamp、int64、decimal128、min/max key
+_FIXED_SIZES = {
+    0x01: 8, 0x06: 0, 0x07: 12, 0x08: 1, 0x09: 8, 0x0A: 0,
+    0x10: 4, 0x11: 8, 0x12: 8, 0x13: 16, 0x7F: 0, 0xFF: 0,
+}
+
+
+def _value_end(data: bytes, kind: int, pos: int) -> int:
+    """返回从pos开始、类型为kind的值之后的偏移"""
+    size = _FIXED_SIZES.get(kind)
+    if size is not None:
+        return pos + size
+    if kind in (_DOCUMENT, _ARRAY, 0x0F):
+        return pos + _unpack_int32(data, pos)[0]
+    if kind in (0x02, 0x0D, 0x0E):
+        return pos + 4 + _unpack_int32(data, pos)[0]
+    if kind == 0x05:
+        return pos + 5 + _unpack_int32(data, pos)[0]
+    if kind == 0x0B:
+        return data.index(0, data.index(0, pos) + 1) + 1
+    if kind == 0x0C:
+        return pos + 4 + _unpack_int32(data, pos)[0] + 12
+    raise bson.InvalidBSON(f"未知的BSON类型: {kind:#04x}")
+
+
+def _as_bytes(data: Any) -> bytes:
+    """decode_all 返回的原始文档可能引用批次的memoryview"""
+    return data if isinstance(data, bytes) else bytes(data)
+
+
+def _elements(data: bytes, start: int) -> Iterator[Tuple[int, bytes, int]]:
+    """遍历start处文档的顶层元素，返回 (类型, 键, 值偏移)，不解码值"""
+    end = start + _unpack_int32(data, start)[0] - 1
+    pos = start + 4
+    while pos < end:
+        kind = data[pos]
+        key_end = data.index(0, pos + 1)
+        yield kind, data[pos + 1:key_end], key_end + 1
+        pos = _value_end(data, kind, key_end + 1)
+
+
+def _decode_value(data: bytes, kind: int, pos: int) -> Any:
+    """解码单个值：包装为单字段文档交给bson解码"""
+    element = bytes((kind,)) + b"v\x00" + data[pos:_value_end(data, kind, pos)]
+    return bson.decode(_pack_int32(len(element) + 5) + element + b"\x00")["v"]
+
+
+def _find_path(data: bytes, keys: Tuple[str, ...]) -> Optional[Tuple[int, int]]:
+    """按键路径查找嵌套字段，返回 (类型, 值偏移)，不存在时返回None"""
+    start = 0
+    kind = _DOCUMENT
+    for key in keys:
+        if kind != _DOCUMENT:
+            return None
+        target = key.encode("utf-8")
+        for kind, name, pos in _elements(data, start):
+            if name == target:
+                start = pos
+                break
+        else:
+            return None
+    return kind, start
+
+
+def decode_path(data: Any, keys: Tuple[str, ...], default: Any = None) -> Any:
+    """完整解码原始文档中指定路径的字段，不存在时返回default"""
+    data = _as_bytes(data)
+    found = _find_path(data, keys)
+    if found is None:
+        return default
+    return _decode_value(data, *found)
+
+
+def _score_elements(data: bytes, start: int) -> bytes:
+    """返回一辆车的原始文档中分数字段的元素字节（类型、键和值），其余字段被跳过"""
+    pos = start + 4
+    match = _SCORE_PREFIX.match(data, pos)
+    if match:
+        end = match.end()
+        return data[pos:end + _unpack_int32(data, end)[0]]
+    elements = []
+    for kind, name, value_pos in _elements(data, start):
+        if name in SCORE_FIELDS:
+            elements.append(data[value_pos - len(name) - 2:_value_end(data, kind, value_pos)])
+            if len(elements) == len(SCORE_FIELDS):
+                break
+    return b"".join(elements)
+
+
+class RawCarList(Mapping):
+    """
+    car_list的只读视图，只保存原始字节（不引用所在的整个文档）
+    按车辆ID访问时解码该车辆，score_fields() 只解码分数字段；
+    可作为 get_car_list 的返回值和缓存值，修改前需先复制单辆车的数据
+    """
+
+    __slots__ = ("raw", "_offsets")
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self._offsets: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_document(cls, document: RawBSONDocument) -> "RawCarList":
+        """从投影了car_garage.car_list的原始UserExtraInfo文档中提取，字段不存在时为空"""
+        data = _as_bytes(document.raw)
+        found = _find_path(data, ("car_garage", "car_list"))
+        if found is None or found[0] != _DOCUMENT:
+            return cls(b"\x05\x00\x00\x00\x00")
+        start = found[1]
+        return cls(data[start:start + _unpack_int32(data, start)[0]])
+
+    def _index(self) -> Dict[str, int]:
+        """车辆ID到文档偏移的索引，首次访问时建立；值不是文档的车辆被忽略"""
+        if self._offsets is None:
+            self._offsets = {
+                name.decode("utf-8"): pos
+                for kind, name, pos in _elements(self.raw, 0) if kind == _DOCUMENT
+            }
+        return self._offsets
+
+    def __getitem__(self, car_id: str) -> Dict[str, Any]:
+        start = self._index()[car_id]
+        return bson.decode(self.raw[start:start + _unpack_int32(self.raw, start)[0]])
+
+    def __contains__(self, car_id: object) -> bool:
+        return car_id in self._index()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index())
+
+    def __len__(self) -> int:
+        return len(self._index())
+
+    def __repr__(self) -> str:
+        return f"RawCarList({len(self)} cars, {len(self.raw)} bytes)"
+
+    def __deepcopy__(self, memo: Dict) -> "RawCarList":
+        # 只读视图，复制时可共享字节
+        return self
+
+    def score_fields(self) -> Dict[str, Dict[str, Any]]:
+        """
+        只解码分数字段的car_list：{车辆ID: {rank_score, season_best_rank_score, palace_score_list}}
+        各车辆的分数元素拼接为一个文档后一次解码，缺少的字段不出现在结果中
+        """
+        raw = self.raw
+        cars = []
+        end = len(raw) - 1
+        pos = 4
+        # 逐个车辆截取分数元素，车辆的类型和键字节原样保留
+        while pos < end:
+            kind = raw[pos]
+            value_pos = raw.index(0, pos + 1) + 1
+            if kind == _DOCUMENT:
+                body = _score_elements(raw, value_pos)
+                cars.append(raw[pos:value_pos] + _pack_int32(len(body) + 5) + body + b"\x00")
+            pos = _value_end(raw, kind, value_pos)
+        body = b"".join(cars)
+        return bson.decode(_pack_int32(len(body) + 5) + body + b"\x00")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """完整解码"""
+        return bson.decode(self.raw)
@@ -0,0 +1,327 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from pymongo import monitoring
+
+# 延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 不需要计时的管理器方法（连接与缓存管理）
+SKIP_METHODS = {
+    "connect", "close", "enable_cache", "disable_cache", "cache_stats",
+    "enable_write_behind", "disable_write_behind", "write_behind_stats", "single_flight_stats", "health",
+    "enable_raw_bson", "disable_raw_bson"
+}
+
+
+def result_size(result: Any) -> int:
+    """返回结果包含的条目数：dict/list取长度，None为0，其它为1"""
+    if result is None:
+        return 0
+    if isinstance(result, (dict, list, tuple)):
+        return len(result)
+    return 1
+
+
+def is_failure(result: Any) -> bool:
+    """管理器方法内部捕获异常后以 {'success': False} 返回，同样计为错误"""
+    return isinstance(result, dict) and result.get('success') is False
+
+
+class _OperationStats:
+    """单个操作的计数、错误数、延迟直方图和结果大小"""
+
+    __slots__ = ("count", "errors", "db_errors", "latency_sum", "buckets", "size_sum")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.db_errors = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.size_sum = 0
+
+    def quantile(self, q: float) -> float:
+        """根据直方图桶线性插值估算分位数（秒）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, upper in enumerate(LATENCY_BUCKETS):
+            in_bucket = self.buckets[i]
+            if seen + in_bucket >= target:
+                return lower + (upper - lower) * ((target - seen) / in_bucket if in_bucket else 0.0)
+            seen += in_bucket
+            lower = upper
+        return LATENCY_BUCKETS[-1]
+
+
+class MetricsRegistry:
+    """
+    线程安全的指标注册表，按 (kind, operation) 记录：
+    kind 为 "manager"（MongoDBManager 方法）或 "http"（Flask 路由）
+    """
+
+    def __init__(self):
+        self._ops: Dict[Tuple[str, str], _OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, kind: str, operation: str) -> _OperationStats:
+        key = (kind, operation)
+        stats = self._ops.get(key)
+        if stats is None:
+            stats = self._ops.setdefault(key, _OperationStats())
+        return stats
+
+    def observe(self, kind: str, operation: str, seconds: float, size: int = 0, error: bool = False) -> None:
+        """记录一次调用"""
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            stats = self._stats(kind, operation)
+            stats.count += 1
+            stats.latency_sum += seconds
+            stats.buckets[index] += 1
+            stats.size_sum += size
+            if error:
+                stats.errors += 1
+
+    def count_db_error(self, operation: str) -> None:
+        """记录一次 _handle_db_error 报告的数据库错误"""
+        with self._lock:
+            self._stats("db", operation).db_errors += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._ops.clear()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """返回各操作的汇总数据，用于表格和JSON输出"""
+        with self._lock:
+            items = sorted(self._ops.items())
+            rows = []
+            for (kind, operation), stats in items:
+                rows.append({
+                    'kind': kind,
+                    'operation': operation,
+                    'count': stats.count,
+                    'errors': stats.errors + stats.db_errors,
+                    'mean_ms': round(stats.latency_sum / stats.count * 1000, 2) if stats.count else 0.0,
+                    'p50_ms': round(stats.quantile(0.5) * 1000, 2),
+                    'p95_ms': round(stats.quantile(0.95) * 1000, 2),
+                    'p99_ms': round(stats.quantile(0.99) * 1000, 2),
+                    'size_sum': stats.size_sum
+                })
+            return rows
+
+    def render_prometheus(self) -> str:
+        """以Prometheus文本格式输出全部指标"""
+        lines = [
+            "# HELP sc_operation_duration_seconds 操作耗时",
+            "# TYPE sc_operation_duration_seconds histogram",
+        ]
+        counters = {
+            "sc_operation_errors_total": ("# HELP sc_operation_errors_total 抛出异常或返回失败的调用数", []),
+            "sc_db_errors_total": ("# HELP sc_db_errors_total _handle_db_error 报告的数据库错误数", []),
+            "sc_operation_result_size_total": (
+                "# HELP sc_operation_result_size_total 返回结果大小之和（manager为条目数，http为响应字节数）", []
+            ),
+        }
+        with self._lock:
+            for (kind, operation), stats in sorted(self._ops.items()):
+                labels = f'kind="{kind}",operation="{operation}"'
+                if stats.db_errors:
+                    counters["sc_db_errors_total"][1].append(f"sc_db_errors_total{{{labels}}} {stats.db_errors}")
+                if not stats.count:
+                    continue
+                cumulative = 0
+                for upper, in_bucket in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += in_bucket
+                    lines.append(f'sc_operation_duration_seconds_bucket{{{labels},le="{upper}"}} {cumulative}')
+                lines.append(f'sc_operation_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                lines.append(f"sc_operation_duration_seconds_sum{{{labels}}} {stats.latency_sum:.6f}")
+                lines.append(f"sc_operation_duration_seconds_count{{{labels}}} {stats.count}")
+                counters["sc_operation_errors_total"][1].append(
+                    f"sc_operation_errors_total{{{labels}}} {stats.errors}")
+                counters["sc_operation_result_size_total"][1].append(
+                    f"sc_operation_result_size_total{{{labels}}} {stats.size_sum}")
+
+        for name, (help_line, samples) in counters.items():
+            lines.append(help_line)
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def format_table(self) -> str:
+        """以表格形式输出汇总，用于命令行结束时打印"""
+        header = f"{'类型':<8}{'操作':<36}{'次数':>8}{'错误':>6}{'平均(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"
+        lines = [header]
+        for row in self.snapshot():
+            if not row['count'] and not row['errors']:
+                continue
+            lines.append(
+                f"{row['kind']:<8}{row['operation']:<36}{row['count']:>8}{row['errors']:>6}"
+                f"{row['mean_ms']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            )
+        return "\n".join(lines)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    通过pymongo的连接池（CMAP）事件统计连接池状态，创建客户端时传入 event_listeners=[monitor]
+    open 为已建立的连接数，in_use 为被检出使用中的连接数，waiting 为正在等待检出的请求数
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pools = 0
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.clears = 0
+
+    def _add(self, **deltas: int) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event) -> None:
+        self._add(pools=1)
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        self._add(clears=1)
+
+    def pool_closed(self, event) -> None:
+        self._add(pools=-1)
+
+    def connection_created(self, event) -> None:
+        self._add(open=1)
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        self._add(open=-1)
+
+    def connection_check_out_started(self, event) -> None:
+        self._add(waiting=1)
+
+    def connection_check_out_failed(self, event) -> None:
+        self._add(waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event) -> None:
+        self._add(waiting=-1, in_use=1, checkouts=1)
+
+    def connection_checked_in(self, event) -> None:
+        self._add(in_use=-1)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'pools': self.pools,
+                'open': self.open,
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'clears': self.clears
+            }
+
+
+def render_gauges(prefix: str, values: Dict[str, Any], help_text: str = "") -> str:
+    """将一组数值（如写回队列统计）以Prometheus gauge格式输出，非数值字段被忽略"""
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        name = f"{prefix}_{key}"
+        lines.append(f"# HELP {name} {help_text}{key}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def _wrap(registry: MetricsRegistry, operation: str, method):
+    """按方法类型（普通函数、生成器、协程）包装计时逻辑"""
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+            except Exception:
+                registry.observe("manager", operation, time.perf_counter() - start, error=True)
+                raise
+            registry.observe("manager", operation, time.perf_counter() - start,
+                             result_size(result), is_failure(result))
+            return result
+        return async_wrapper
+
+    if inspect.isgeneratorfunction(method):
+        # 生成器在迭代完成时才记录，耗时包含整个遍历过程
+        @functools.wraps(method)
+        def generator_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            count = 0
+            try:
+                for item in method(*args, **kwargs):
+                    count += 1
+                    yield item
+            except Exception:
+                registry.observe("manager", operation, time.perf_counter() - start, count, error=True)
+                raise
+            registry.observe("manager", operation, time.perf_counter() - start, count)
+        return generator_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            registry.observe("manager", operation, time.perf_counter() - start, error=True)
+            raise
+        registry.observe("manager", operation, time.perf_counter() - start,
+                         result_size(result), is_failure(result))
+        return result
+    return wrapper
+
+
+def instrument_manager(manager, registry: MetricsRegistry):
+    """
+    为管理器实例的公开方法加上计时，并让 _handle_db_error 计入错误数
+    只替换实例属性，未开启时类方法不受影响，没有额外开销
+    """
+    for name, method in inspect.getmembers(manager, inspect.ismethod):
+        if name.startswith("_") or name in SKIP_METHODS:
+            continue
+        setattr(manager, name, _wrap(registry, name, method))
+    manager.metrics = registry
+    return manager
+
+
+def instrument_flask(app, registry: MetricsRegistry) -> None:
+    """通过请求钩子记录每个Flask路由的耗时、状态和响应字节数"""
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_start():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _metrics_record(response):
+        start = g.pop('metrics_start', None)
+        if start is not None and request.endpoint != 'metrics_endpoint':
+            size = 0 if response.is_streamed else (response.calculate_content_length() or 0)
+            registry.observe("http", request.endpoint or request.path, time.perf_counter() - start,
+                             size, response.status_code >= 400)
+        return response
@@ -0,0 +1,139 @@
+import bisect
+import threading
+from typing import Optional, Dict, List, Tuple, Iterable
+
+# 排名键：(-rank_score, -rank_level, uid)，与排行榜的排序（LEADERBOARD_SORT）一致
+RankKey = Tuple[float, float, int]
+
+
+def rank_key(uid: int, score: float, level: Optional[float]) -> RankKey:
+    """rank_level 缺失（None）时按0处理"""
+    return -score, -(level or 0), uid
+
+
+class _Fenwick:
+    """树状数组，维护各分段长度的前缀和"""
+
+    def __init__(self, sizes: List[int]):
+        self.n = len(sizes)
+        self.tree = [0] * (self.n + 1)
+        for i, size in enumerate(sizes, 1):
+            self.tree[i] += size
+            parent = i + (i & -i)
+            if parent <= self.n:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index: int) -> int:
+        """前index个分段的长度之和"""
+        total, i = 0, index
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+class RankIndex:
+    """
+    内存中的顺序统计索引，查询某个UID的全局名次为 O(log n)
+    键按分段有序列表存放（每段不超过load个），树状数组维护各段长度的前缀和；
+    分段拆分或删空时重建树状数组，代价为 O(n/load)，很少发生
+    """
+
+    def __init__(self, load: int = 1000):
+        self.load = load
+        self._lists: List[List[RankKey]] = []
+        self._maxes: List[RankKey] = []
+        self._fenwick = _Fenwick([])
+        self._keys: Dict[int, RankKey] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, uid: int) -> bool:
+        return uid in self._keys
+
+    def build(self, entries: Iterable[Tuple[int, float, float]]) -> None:
+        """由 (uid, rank_score, rank_level) 批量构建，同一UID出现多次时以最后一次为准"""
+        keys = {}
+        for uid, score, level in entries:
+            keys[uid] = rank_key(uid, score, level)
+        ordered = sorted(keys.values())
+        lists = [ordered[i:i + self.load] for i in range(0, len(ordered), self.load)]
+        with self._lock:
+            self._keys = keys
+            self._lists = lists
+            self._reindex()
+
+    def _reindex(self) -> None:
+        self._maxes = [sub[-1] for sub in self._lists]
+        self._fenwick = _Fenwick([len(sub) for sub in self._lists])
+
+    def _insert(self, key: RankKey) -> None:
+        if not self._lists:
+            self._lists.append([key])
+            self._reindex()
+            return
+        pos = min(bisect.bisect_left(self._maxes, key), len(self._lists) - 1)
+        sub = self._lists[pos]
+        bisect.insort(sub, key)
+        self._maxes[pos] = sub[-1]
+        if len(sub) > self.load * 2:
+            # 分段过长时对半拆分
+            self._lists[pos:pos + 1] = [sub[:self.load], sub[self.load:]]
+            self._reindex()
+        else:
+            self._fenwick.add(pos, 1)
+
+    def _delete(self, key: RankKey) -> None:
+        pos = bisect.bisect_left(self._maxes, key)
+        sub = self._lists[pos]
+        del sub[bisect.bisect_left(sub, key)]
+        if sub:
+            self._maxes[pos] = sub[-1]
+            self._fenwick.add(pos, -1)
+        else:
+            del self._lists[pos]
+            self._reindex()
+
+    def update(self, uid: int, score: float, level: float) -> None:
+        """写入或更新一个UID的排名数据"""
+        key = rank_key(uid, score, level)
+        with self._lock:
+            old = self._keys.get(uid)
+            if old == key:
+                return
+            if old is not None:
+                self._delete(old)
+            self._insert(key)
+            self._keys[uid] = key
+
+    def remove(self, uid: int) -> None:
+        with self._lock:
+            old = self._keys.pop(uid, None)
+            if old is not None:
+                self._delete(old)
+
+    def _position(self, key: RankKey) -> int:
+        pos = bisect.bisect_left(self._maxes, key)
+        return self._fenwick.prefix(pos) + bisect.bisect_left(self._lists[pos], key) + 1
+
+    def position(self, uid: int) -> Optional[int]:
+        """返回UID的全局名次（从1开始），不在索引中时返回None"""
+        with self._lock:
+            key = self._keys.get(uid)
+            return self._position(key) if key is not None else None
+
+    def positions(self, uids: Iterable[int]) -> Dict[int, Optional[int]]:
+        """批量查询名次，整批只加一次锁"""
+        with self._lock:
+            return {
+                uid: self._position(self._keys[uid]) if uid in self._keys else None
+                for uid in uids
+            }
@@ -1,19 +1,115 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
+from cache import LRUTTLCache, MISSING, SingleFlight, Generations
+from metrics import MetricsRegistry, PoolMonitor, instrument_manager
+from storage import BACKENDS, MemoryClient, get_client_factory
+from rank_index import RankIndex
+from jobs import file_signature, iter_uid_chunks, JobCheckpoint, NDJSONLog, run_chunked_job
+from write_behind import WriteBehindQueue, QueuedWrite, PendingWrite, set_path
+from lazy_bson import RAW_BSON_CODEC_OPTIONS, RawCarList, decode_path
+from admission import is_timeout
 import argparse
+import bisect
+import contextvars
+import csv
+import os
+import sys
+import threading
+import time
 import pprint
 import json
-from typing import Optional, Dict, Any, List, Union, Tuple
-
-
-class MongoDBManager:
-    """MongoDB 数据管理工具类，封装了用户排名、车辆数据和比赛记录的操作"""
-
-    def __init__(self):
-        """初始化 MongoDB 连接和打印工具"""
+from typing import Optional, Dict, Any, List, Union, Tuple, Iterator, TextIO, Callable
+
+# 数据库名称
+DB_NAME = "desertsafari_api_v3"
+# 批量查询支持的数据类型
+QUERY_PARTS = ("user", "car", "rank-list")
+# 单次$in查询包含的UID数量上限
+BULK_QUERY_CHUNK_SIZE = 1000
+# 单次bulk_write包含的更新操作数量上限
+BULK_WRITE_CHUNK_SIZE = 1000
+# 写回队列中过滤条件未匹配的写入，按数据类型报告的错误信息
+WRITE_BEHIND_UNMATCHED = {"user": "用户不存在", "car": "用户无车辆数据或车辆ID无效"}
+# 批量查询UserInfo时的投影
+USER_BULK_PROJECTION = {"_id": 0, "uid": 1, "racetrack_rank_data.rank_score": 1, "racetrack_rank_data.rank_level": 1}
+# get_extra_info 返回结果中各数据类型对应的键
+EXTRA_RESULT_KEYS = {"car": "car_list", "rank-list": "rank_list"}
+# 工具元数据集合及UID规范化标记
+META_COLLECTION = "ToolMeta"
+UID_NORMALIZED_KEY = "UserExtraInfo.uid_normalized"
+# UserExtraInfo 中各数据类型对应的字段路径
+EXTRA_INFO_FIELDS = {
+    "car": "car_garage.car_list",
+    "rank-list": "racetrack_match_data.recent_rank_list",
+}
+
+# 排行榜：按rank_score降序、rank_level降序、uid升序排列，uid保证顺序唯一以便键集分页
+LEADERBOARD_SORT = [
+    ("racetrack_rank_data.rank_score", -1),
+    ("racetrack_rank_data.rank_level", -1),
+    ("uid", 1),
+]
+LEADERBOARD_INDEX_NAME = "leaderboard_rank_score_level_uid"
+# 快照缓存排行榜前若干名，有效期内翻页不再查询数据库
+LEADERBOARD_SNAPSHOT_SIZE = 1000
+LEADERBOARD_SNAPSHOT_TTL = 5.0
+LEADERBOARD_MAX_LIMIT = 500
+# 构建名次索引时流式扫描UserInfo的批大小
+RANK_INDEX_SCAN_BATCH = 5000
+# 名次索引的定期重建间隔（秒），其他进程的写入只在重建后反映到本进程的索引
+RANK_INDEX_REFRESH_INTERVAL = 300
+# 分数分布统计流式扫描UserExtraInfo的批大小，及统计结果缓存的默认有效期（秒）
+STATS_SCAN_BATCH = 2000
+STATS_CACHE_MAX_AGE = 3600.0
+
+
+class BaseMongoDBManager:
+    """
+    MongoDBManager 和 AsyncMongoDBManager 共用的部分：连接参数、查询条件、读缓存、名次索引、
+    文档解析和结果组装；不包含访问数据库的方法，由同步版和异步版各自实现
+    """
+
+    def __init__(
+            self,
+            uid_normalized: Optional[bool] = None,
+            uri: Optional[str] = None,
+            client_factory: Callable[..., Any] = MongoClient,
+            max_pool_size: Optional[int] = None
+    ):
+        """
+        初始化 MongoDB 连接和打印工具
+        uid_normalized: UserExtraInfo的UID是否已全部转换为整数；
+                        为None时首次使用前从ToolMeta集合读取标记
+        uri: 连接串，未指定时依次使用环境变量MONGO_URI和默认集群地址
+        client_factory: 创建客户端的函数，默认使用pymongo；
+                        基准测试时可传入内存实现（如 mongomock.MongoClient）
+        max_pool_size: 客户端连接池上限（maxPoolSize），未指定时使用驱动默认值
+        """
         self.client = None
+        self.client_factory = client_factory
+        self.max_pool_size = max_pool_size
+        self.pool_monitor = None
         self.db = None
+        self.uid_normalized = uid_normalized
+        self.cache = None
+        self.single_flight = SingleFlight()
+        self.generations = Generations()
+        self.write_behind = None
+        self.raw_bson = False
+        self.metrics = None
+        self._leaderboard_index_ready = False
+        self._leaderboard_snapshot = None
+        self._leaderboard_lock = threading.Lock()
+        self.rank_index = None
+        self._rank_index_pending = None
+        self._rank_index_lock = threading.Lock()
+        self.rank_index_built_at = None
+        self.rank_index_max_age = None
+        self._rank_index_stop = threading.Event()
         self.pp = pprint.PrettyPrinter(indent=2)
-        self.uri = (
+        self.uri = uri or os.environ.get("MONGO_URI") or (
             "mongodb://wp_dev_vnm:SrJ5gZwoLVl2@"
             "weplay-vnm.db.wepieoa.com:32201/"
             "desertsafari_api_v3?"
@@ -21,92 +117,939 @@ class MongoDBManager:
             "directConnection=true"
         )
 
+    def _client_options(self) -> Dict[str, Any]:
+        """创建客户端的参数；使用pymongo时附带连接池上限和连接池事件统计"""
+        options = {"serverSelectionTimeoutMS": 5000}
+        if self.max_pool_size:
+            options["maxPoolSize"] = self.max_pool_size
+        if self.client_factory is MongoClient:
+            self.pool_monitor = PoolMonitor()
+            options["event_listeners"] = [self.pool_monitor]
+        return options
+
+    def _health_info(self) -> Dict[str, Any]:
+        pool_options = getattr(getattr(self.client, "options", None), "pool_options", None)
+        return {
+            'ok': False,
+            'pid': os.getpid(),
+            'backend': type(self.client).__name__ if self.client else None,
+            'latency_ms': None,
+            'error': None,
+            'max_pool_size': pool_options.max_pool_size if pool_options else self.max_pool_size,
+            'pool': self.pool_monitor.stats() if self.pool_monitor else None
+        }
+
+    def close(self):
+        """停止名次索引刷新并关闭数据库连接"""
+        self._rank_index_stop.set()
+        if self.client:
+            self.client.close()
+    # ==================== 通用工具方法 ====================
+    def _is_uid_normalized(self) -> bool:
+        """UserExtraInfo的UID是否已规范化为整数；基类只使用已知的标记，未知时按未规范化处理"""
+        return bool(self.uid_normalized)
+
+    def _get_user_filter(self, uid: int) -> Dict:
+        """获取用户查询条件，UID未规范化时同时支持字符串和整数类型"""
+        if self._is_uid_normalized():
+            return {"uid": uid}
+        return {"$or": [{"uid": uid}, {"uid": str(uid)}]}
+
+    def _get_users_filter(self, uids: List[int]) -> Dict:
+        """获取批量用户查询条件，UID未规范化时同时匹配字符串和整数类型"""
+        if self._is_uid_normalized():
+            return {"uid": {"$in": list(uids)}}
+        values = []
+        for uid in uids:
+            values.extend([uid, str(uid)])
+        return {"uid": {"$in": values}}
+
+    @staticmethod
+    def _get_extra_projection(parts: Tuple[str, ...]) -> Dict[str, int]:
+        """根据数据类型构造UserExtraInfo的投影，多个类型合并为一次查询"""
+        projection = {"_id": 0}
+        for part in parts:
+            if part in EXTRA_INFO_FIELDS:
+                projection[EXTRA_INFO_FIELDS[part]] = 1
+        return projection
+
+    def _log_db_error(self, operation: str, uid: int, e: Exception) -> None:
+        """记录数据库错误，不抛出；用于写回队列等不属于某个请求的写入"""
+        print(f"{operation}失败(UID:{uid}): {e}")
+        if self.metrics:
+            self.metrics.count_db_error(operation)
+
+    def _handle_db_error(self, operation: str, uid: int, e: Exception) -> None:
+        """统一处理数据库错误；超时和请求截止时间已过（is_timeout）记录后重新抛出，由调用方中断整个请求"""
+        self._log_db_error(operation, uid, e)
+        if is_timeout(e):
+            raise e
+    # ==================== 读缓存 ====================
+    def enable_cache(self, max_size: int = 10000, ttl: float = 30.0) -> None:
+        """开启进程内读缓存，缓存get_user_rank、get_car_list和get_recent_rank_list的结果"""
+        self.cache = LRUTTLCache(max_size, ttl)
+
+    def disable_cache(self) -> None:
+        """关闭读缓存"""
+        self.cache = None
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """返回缓存统计信息，未开启缓存时返回None"""
+        return self.cache.stats() if self.cache else None
+
+    def single_flight_stats(self) -> Dict[str, Any]:
+        """返回并发读取合并的统计信息，shared为节省的数据库调用次数"""
+        return self.single_flight.stats()
+
+    def _cache_get(self, part: str, uid: int) -> Any:
+        """读取缓存，未开启缓存或未命中时返回MISSING"""
+        return self.cache.get((part, uid)) if self.cache else MISSING
+
+    def _cache_set(self, part: str, uid: int, value: Any, generation: Optional[int] = None) -> None:
+        """写入缓存；generation为读取前记录的修改代数，读取期间数据被修改时不写入"""
+        if self.cache:
+            key = (part, uid)
+            valid = None if generation is None else lambda: self.generations.get(key) == generation
+            self.cache.set(key, value, valid)
+
+    def _read_generations(self, parts: Tuple[str, ...], uids: List[int]) -> Dict[Tuple[str, int], int]:
+        """读取数据库前记录各 (数据类型, uid) 的修改代数，用于缓存写入和合并读取的判断"""
+        return {(part, uid): self.generations.get((part, uid)) for uid in uids for part in parts}
+
+    def _invalidate(self, part: str, uid: int) -> None:
+        """数据被修改后递增修改代数并删除对应的缓存，之前开始的读取结果不再写入缓存或分享给新的调用"""
+        self.generations.bump((part, uid))
+        if self.cache:
+            self.cache.invalidate((part, uid))
+    # ==================== 原始BSON读取 ====================
+    def enable_raw_bson(self) -> None:
+        """
+        查询car_list时以原始BSON读取UserExtraInfo：车辆分数只解码rank_score、season_best_rank_score和
+        palace_score_list，get_car_list返回RawCarList（按车辆ID访问时才解码），缓存中保存原始字节
+        车辆文档包含较多其他字段时可明显降低 /query 的CPU和内存开销；内存引擎不支持时照常读取
+        """
+        self.raw_bson = True
+
+    def disable_raw_bson(self) -> None:
+        self.raw_bson = False
+
+    def _extra_info_collection(self, parts: Tuple[str, ...]):
+        """读取UserExtraInfo的集合对象，开启原始BSON读取且需要car_list时使用RawBSONDocument"""
+        collection = self.db["UserExtraInfo"]
+        if self.raw_bson and "car" in parts and hasattr(collection, "with_options"):
+            return collection.with_options(codec_options=RAW_BSON_CODEC_OPTIONS)
+        return collection
+    # ==================== 文档解析方法 ====================
+    @staticmethod
+    def _extract_user_rank(data: Optional[Dict]) -> Optional[Dict[str, Any]]:
+        """从UserInfo文档中提取排名数据"""
+        if not data:
+            return None
+        return {
+            "rank_score": data["racetrack_rank_data"]["rank_score"],
+            "rank_level": data["racetrack_rank_data"]["rank_level"]
+        }
+
+    @staticmethod
+    def _extract_car_list(data: Optional[Dict]) -> Dict[str, Any]:
+        """从UserExtraInfo文档中提取car_list，原始BSON文档返回RawCarList"""
+        if isinstance(data, RawBSONDocument):
+            return RawCarList.from_document(data)
+        return data.get("car_garage", {}).get("car_list", {}) if data else {}
+
+    @staticmethod
+    def _extract_recent_rank_list(data: Optional[Dict]) -> List[Union[Dict[str, Any], int]]:
+        """从UserExtraInfo文档中提取recent_rank_list"""
+        if isinstance(data, RawBSONDocument):
+            return decode_path(data.raw, ("racetrack_match_data", "recent_rank_list"), [])
+        return data.get("racetrack_match_data", {}).get("recent_rank_list", []) if data else []
+
+    def _extract_extra_part(self, part: str, data: Optional[Dict]) -> Any:
+        """按数据类型从UserExtraInfo文档中提取数据"""
+        if part == "car":
+            return self._extract_car_list(data)
+        return self._extract_recent_rank_list(data)
+
+    @staticmethod
+    def _build_car_scores(car_list: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """将car_list转换为分数信息"""
+        if isinstance(car_list, RawCarList):
+            car_list = car_list.score_fields()
+        return {
+            car_id: {
+                'rank_score': car_data.get('rank_score', 'N/A'),
+                'season_best_rank_score': car_data.get('season_best_rank_score', 'N/A'),
+                'palace_score_list': [
+                    car_data.get('palace_score_list', [{}] * 5)[i].get('score', -1) for i in range(5)
+                ]
+            }
+            for car_id, car_data in car_list.items()
+        }
+    # ==================== UserExtraInfo 集合操作 ====================
+    def _plan_car_updates(self, uid: int, car_updates: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        构造批量更新车辆的$set字段、过滤条件和投影
+        car_conditions 只校验车辆存在；conditions 额外要求palace_score_list至少5项以便按位置更新
+        """
+        for updates in car_updates.values():
+            if 'palace_scores' in updates:
+                new_scores = updates['palace_scores']
+                if not isinstance(new_scores, list) or len(new_scores) != 5:
+                    return {'error': 'palace_scores必须是长度为5的列表'}
+
+        update_fields = {}
+        # 在过滤条件中校验车辆存在，不再预先读取整个car_list
+        car_conditions = [self._get_user_filter(uid)] + [
+            {f"car_garage.car_list.{car_id}": {"$exists": True}} for car_id in car_updates
+        ]
+        conditions = list(car_conditions)
+        for car_id, updates in car_updates.items():
+            prefix = f"car_garage.car_list.{car_id}"
+            if 'rank_score' in updates:
+                update_fields[f"{prefix}.rank_score"] = updates['rank_score']
+            if 'season_best_rank_score' in updates:
+                update_fields[f"{prefix}.season_best_rank_score"] = updates['season_best_rank_score']
+            if 'palace_scores' in updates:
+                # 按位置更新score和invalid，保留原有的protect_state
+                conditions.append({f"{prefix}.palace_score_list.4": {"$exists": True}})
+                for i, score in enumerate(updates['palace_scores']):
+                    update_fields[f"{prefix}.palace_score_list.{i}.score"] = score
+                    update_fields[f"{prefix}.palace_score_list.{i}.invalid"] = False
+
+        if not update_fields:
+            return {'error': '无有效更新字段'}
+
+        return {
+            'error': None,
+            'fields': update_fields,
+            'car_conditions': car_conditions,
+            'conditions': conditions,
+            'projection': {"_id": 0, **{f"car_garage.car_list.{car_id}": 1 for car_id in car_updates}}
+        }
+
+    def _check_car_fallback(
+            self,
+            current_cars: Dict[str, Any],
+            car_updates: Dict[str, Dict[str, Any]],
+            update_fields: Dict[str, Any]
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        按位置更新未匹配时根据当前车辆数据判断原因
+        返回 (错误信息, 需要重试的$set字段)，两者都为None表示数据未改变
+        """
+        if not current_cars:
+            return '用户无车辆数据', None
+
+        invalid_cars = [cid for cid in car_updates if cid not in current_cars]
+        if invalid_cars:
+            return f'无效车辆ID: {", ".join(invalid_cars)}', None
+
+        short_palace = any(
+            len(current_cars[car_id].get('palace_score_list', [])) < 5
+            for car_id, updates in car_updates.items() if 'palace_scores' in updates
+        )
+        if short_palace:
+            return None, self._build_full_palace_fields(current_cars, car_updates, update_fields)
+        return None, None
+
+    def _car_update_result(self, data: Optional[Dict], car_updates: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """根据更新后的文档生成批量更新车辆的结果"""
+        if data:
+            updated_data = self._build_car_scores(self._extract_car_list(data))
+            return {
+                'success': True,
+                'data': {car_id: updated_data.get(car_id) for car_id in car_updates}
+            }
+        else:
+            return {'success': False, 'error': '数据未改变'}
+
+    @staticmethod
+    def _build_full_palace_fields(
+            current_cars: Dict[str, Any],
+            car_updates: Dict[str, Dict[str, Any]],
+            update_fields: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """将按位置更新的palace分数替换为完整的palace_score_list，用于原列表不足5项的情况"""
+        fields = {k: v for k, v in update_fields.items() if ".palace_score_list." not in k}
+        for car_id, updates in car_updates.items():
+            if 'palace_scores' not in updates:
+                continue
+            # 获取当前的palace_score_list，不足5项时补齐
+            current_list = current_cars[car_id].get('palace_score_list', [])
+            current_list = current_list + [{}] * (5 - len(current_list))
+            fields[f"car_garage.car_list.{car_id}.palace_score_list"] = [
+                {
+                    "score": updates['palace_scores'][i],
+                    "protect_state": current_list[i].get("protect_state", 0),
+                    "invalid": False
+                }
+                for i in range(5)
+            ]
+        return fields
+    # ==================== 组合更新 ====================
+    def _plan_combo_updates(
+            self,
+            chunk: List[int],
+            current: Dict[int, Tuple[Optional[Dict], List]],
+            car_id: str,
+            car_fields: Dict[str, Any],
+            rank_list: List[Union[Dict[str, Any], int]]
+    ) -> Tuple[List[Tuple[int, str]], List[UpdateOne]]:
+        """只为存在且数据确实不同的用户生成更新，返回 ([(uid, "car"|"rank-list")], 操作列表)"""
+        prefix = f"car_garage.car_list.{car_id}"
+        new_scores = list(car_fields.values())
+        keys, operations = [], []
+        for uid in chunk:
+            if uid not in current:
+                continue
+            car, current_list = current[uid]
+            if car is not None and [car.get("rank_score"), car.get("season_best_rank_score")] != new_scores:
+                keys.append((uid, "car"))
+                operations.append(UpdateOne(
+                    {**self._get_user_filter(uid), prefix: {"$exists": True}}, {"$set": car_fields}
+                ))
+            if current_list != rank_list:
+                keys.append((uid, "rank-list"))
+                operations.append(UpdateOne(
+                    self._get_user_filter(uid), {"$set": {"racetrack_match_data.recent_rank_list": rank_list}}
+                ))
+        return keys, operations
+
+    @staticmethod
+    def _combo_results(
+            chunk: List[int],
+            current: Dict[int, Tuple[Optional[Dict], List]],
+            written: set,
+            failed: Dict[Tuple[int, str], str],
+            car_id: str,
+            rank_score: int,
+            season_best_rank_score: int,
+            rank_list: List[Union[Dict[str, Any], int]]
+    ) -> Dict[int, Dict[str, Any]]:
+        """根据预查询和写入结果生成每个UID的组合更新结果"""
+        results = {}
+        for uid in chunk:
+            outcomes = {}
+            for part in ("car", "rank-list"):
+                key = (uid, part)
+                modified = key in written and key not in failed
+                if modified:
+                    error = None
+                elif key in failed:
+                    error = failed[key]
+                elif uid not in current:
+                    error = '用户不存在'
+                elif part == "car" and current[uid][0] is None:
+                    error = f'车辆 {car_id} 不存在'
+                else:
+                    error = '数据未改变'
+                outcomes[part] = {'success': modified, 'error': error}
+            outcomes["car"]['data'] = {
+                car_id: {'rank_score': rank_score, 'season_best_rank_score': season_best_rank_score}
+            }
+            outcomes["rank-list"]['data'] = rank_list
+            results[uid] = {
+                'success': outcomes["car"]['success'] and outcomes["rank-list"]['success'],
+                'car': outcomes["car"],
+                'rank_list': outcomes["rank-list"]
+            }
+        return results
+    # ==================== recent_rank_list 操作 ====================
+    @staticmethod
+    def _plan_rank_list_updates(
+            chunk: List[int],
+            current: Dict[int, List],
+            new_list: List[Union[Dict[str, Any], int]]
+    ) -> Dict[int, Tuple[Dict, Dict]]:
+        """只为存在且列表确实不同的用户生成更新"""
+        return {
+            uid: ({}, {"racetrack_match_data.recent_rank_list": new_list})
+            for uid in chunk if uid in current and current[uid] != new_list
+        }
+
+    @staticmethod
+    def _rank_list_results(
+            chunk: List[int],
+            current: Dict[int, List],
+            updates: Dict[int, Tuple[Dict, Dict]],
+            failed: Dict[int, str],
+            new_list: List[Union[Dict[str, Any], int]]
+    ) -> Dict[int, Dict[str, Any]]:
+        """根据预查询和写入结果生成每个UID的更新结果"""
+        results = {}
+        for uid in chunk:
+            modified = uid in updates and uid not in failed
+            if modified:
+                error = None
+            elif uid in failed:
+                error = failed[uid]
+            elif uid not in current:
+                error = '用户不存在'
+            else:
+                error = '数据未改变'
+            results[uid] = {
+                'success': modified,
+                'data': new_list,
+                'error': error,
+                'matched': int(uid in current),
+                'modified': int(modified)
+            }
+        return results
+
+    @staticmethod
+    def _chunk_error_results(chunk: List[int], e: Exception) -> Dict[int, Dict[str, Any]]:
+        """整批执行失败时每个UID的结果"""
+        return {uid: {'success': False, 'error': str(e), 'matched': 0, 'modified': 0} for uid in chunk}
+
+    @staticmethod
+    def _plan_record_updates(
+            chunk: List[int],
+            current: Dict[int, List],
+            index: int,
+            new_value: Union[Dict[str, Any], int]
+    ) -> Dict[int, Tuple[Dict, Dict]]:
+        """只为索引在范围内且值确实不同的用户生成按位置更新"""
+        field = f"racetrack_match_data.recent_rank_list.{index}"
+        return {
+            uid: ({field: {"$exists": True}}, {field: new_value})
+            for uid in chunk
+            if 0 <= index < len(current.get(uid, [])) and current[uid][index] != new_value
+        }
+
+    @staticmethod
+    def _record_results(
+            chunk: List[int],
+            current: Dict[int, List],
+            updates: Dict[int, Tuple[Dict, Dict]],
+            failed: Dict[int, str],
+            index: int,
+            new_value: Union[Dict[str, Any], int]
+    ) -> Dict[int, Dict[str, Any]]:
+        """根据预查询和写入结果生成每个UID的单记录更新结果"""
+        results = {}
+        for uid in chunk:
+            current_list = current.get(uid, [])
+            if not 0 <= index < len(current_list):
+                results[uid] = {
+                    'success': False,
+                    'error': f'索引 {index} 超出范围（0-{len(current_list) - 1}）',
+                    'matched': 0,
+                    'modified': 0
+                }
+                continue
+            modified = uid in updates and uid not in failed
+            if modified:
+                current_list[index] = new_value
+            results[uid] = {
+                'success': modified,
+                'data': current_list,
+                'error': None if modified else failed.get(uid, '数据未改变'),
+                'matched': 1,
+                'modified': int(modified)
+            }
+        return results
+    # ==================== 批量查询 ====================
+    def _export_values(
+            self,
+            docs: List[Dict],
+            parts: Tuple[str, ...],
+            extra_parts: Tuple[str, ...]
+    ) -> Dict[int, Dict[str, Any]]:
+        """解析一批主游标文档，返回 {uid: {数据类型: 值}}，UID无效或重复的文档被跳过"""
+        values = {}
+        for doc in docs:
+            try:
+                uid = int(doc["uid"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if uid in values:
+                continue
+            values[uid] = {}
+            if "user" in parts:
+                try:
+                    values[uid]["user"] = self._extract_user_rank(doc)
+                except Exception as e:
+                    self._handle_db_error("查询UserInfo", uid, e)
+                    values[uid]["user"] = None
+            else:
+                for part in extra_parts:
+                    values[uid][part] = self._extract_extra_part(part, doc)
+        return values
+
+    def _cached_values(self, uids: List[int], parts: Tuple[str, ...]) -> Dict[int, Dict[str, Any]]:
+        """先从缓存读取，只查询未命中的部分"""
+        values = {uid: {} for uid in uids}
+        for uid in uids:
+            for part in parts:
+                cached = self._cache_get(part, uid)
+                if cached is not MISSING:
+                    values[uid][part] = cached
+        return values
+
+    @staticmethod
+    def _missing_uids(values: Dict[int, Dict[str, Any]], chunk: List[int], parts: Tuple[str, ...]) -> List[int]:
+        """返回本批中仍缺少任一数据类型的UID"""
+        return [uid for uid in chunk if any(part not in values[uid] for part in parts)]
+
+    @staticmethod
+    def _fill_failed_values(values: Dict[int, Dict[str, Any]], missing: List[int], parts: Tuple[str, ...]) -> None:
+        """查询失败时填充默认值，与单个查询失败时的返回值一致"""
+        defaults = {"user": None, "car": {}, "rank-list": None}
+        for uid in missing:
+            for part in parts:
+                values[uid].setdefault(part, defaults[part])
+
+    def _store_user_docs(
+            self,
+            values: Dict[int, Dict[str, Any]],
+            missing: List[int],
+            docs: List[Dict],
+            generations: Dict[Tuple[str, int], int]
+    ) -> None:
+        """解析批量查询到的UserInfo文档并写入缓存，generations为查询前记录的修改代数"""
+        user_docs = {}
+        for doc in docs:
+            user_docs.setdefault(doc["uid"], doc)
+        for uid in missing:
+            try:
+                values[uid]["user"] = self._extract_user_rank(user_docs.get(uid))
+                self._cache_set("user", uid, values[uid]["user"], generations[("user", uid)])
+            except Exception as e:
+                self._handle_db_error("查询UserInfo", uid, e)
+                values[uid]["user"] = None
+
+    def _store_extra_docs(
+            self,
+            values: Dict[int, Dict[str, Any]],
+            missing: List[int],
+            parts: Tuple[str, ...],
+            docs: List[Dict],
+            generations: Dict[Tuple[str, int], int]
+    ) -> None:
+        """解析批量查询到的UserExtraInfo文档并写入缓存，generations为查询前记录的修改代数"""
+        extra_docs = {}
+        for doc in docs:
+            extra_docs.setdefault(int(doc["uid"]), doc)
+        for uid in missing:
+            for part in parts:
+                if part not in values[uid]:
+                    values[uid][part] = self._extract_extra_part(part, extra_docs.get(uid))
+                    self._cache_set(part, uid, values[uid][part], generations[(part, uid)])
+
+    def _assemble_bulk_results(
+            self,
+            uids: List[int],
+            parts: Tuple[str, ...],
+            values: Dict[int, Dict[str, Any]]
+    ) -> Dict[int, Dict[str, Any]]:
+        """组装与/query一致的每个UID的返回结构"""
+        results = {}
+        for uid in uids:
+            user_data = {}
+            if "user" in parts:
+                user_data["user_rank"] = values[uid]["user"]
+            if "car" in parts:
+                user_data["car_scores"] = self._build_car_scores(values[uid]["car"])
+            if "rank-list" in parts:
+                user_data["rank_list"] = values[uid]["rank-list"]
+            results[uid] = user_data
+        return results
+    # ==================== 排行榜 ====================
+    @staticmethod
+    def _leaderboard_filter(after: Optional[Tuple[int, int, int]]) -> Dict:
+        """
+        键集分页条件：排在after之后的用户
+        只统计rank_score为数字的文档，缺少排名数据的用户不进入排行榜
+        """
+        score_field, level_field, _ = (field for field, _ in LEADERBOARD_SORT)
+        query = {score_field: {"$type": "number"}}
+        if after is None:
+            return query
+        score, level, uid = after
+        return {**query, "$or": [
+            {score_field: {"$lt": score}},
+            {score_field: score, level_field: {"$lt": level}},
+            {score_field: score, level_field: level, "uid": {"$gt": uid}},
+        ]}
+
+    @staticmethod
+    def _leaderboard_entries(docs: List[Dict], start_rank: int) -> List[Dict[str, Any]]:
+        """将UserInfo文档转换为排行榜条目，rank从start_rank+1开始"""
+        return [
+            {
+                "rank": start_rank + i + 1,
+                "uid": doc["uid"],
+                "rank_score": doc["racetrack_rank_data"]["rank_score"],
+                "rank_level": doc["racetrack_rank_data"].get("rank_level", 0)
+            }
+            for i, doc in enumerate(docs)
+        ]
+
+    @staticmethod
+    def _leaderboard_key(entry: Dict[str, Any]) -> Tuple:
+        """条目在排行榜中的排序键，与LEADERBOARD_SORT一致"""
+        return -entry["rank_score"], -entry["rank_level"], entry["uid"]
+
+    @staticmethod
+    def encode_leaderboard_cursor(entry: Dict[str, Any]) -> str:
+        """分页游标：最后一个条目的 rank_score:rank_level:uid:rank"""
+        return f"{entry['rank_score']}:{entry['rank_level']}:{entry['uid']}:{entry['rank']}"
+
+    @staticmethod
+    def decode_leaderboard_cursor(cursor: Optional[str]) -> Tuple[Optional[Tuple[int, int, int]], int]:
+        """解析分页游标，返回 ((rank_score, rank_level, uid), 已返回的名次)"""
+        if not cursor:
+            return None, 0
+        try:
+            score, level, uid, rank = (int(part) for part in cursor.split(":"))
+        except ValueError:
+            raise ValueError(f"无效的分页游标: {cursor}")
+        return (score, level, uid), rank
+
+    def _fresh_snapshot(self) -> Optional[List[Dict[str, Any]]]:
+        """返回未过期的快照，不存在或已过期时返回None"""
+        snapshot = self._leaderboard_snapshot
+        if snapshot and snapshot[0] > time.monotonic():
+            return snapshot[1]
+        return None
+
+    def _page_from_snapshot(
+            self,
+            entries: List[Dict[str, Any]],
+            after: Optional[Tuple[int, int, int]],
+            limit: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """在快照中定位after之后的一页，快照不足一页且不是完整排行榜时返回None"""
+        start = 0
+        if after is not None:
+            score, level, uid = after
+            keys = [self._leaderboard_key(entry) for entry in entries]
+            start = bisect.bisect_right(keys, (-score, -level, uid))
+        if start + limit <= len(entries) or len(entries) < LEADERBOARD_SNAPSHOT_SIZE:
+            return entries[start:start + limit]
+        return None
+
+    def _leaderboard_result(self, entries: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+        """生成排行榜返回结果，满页时附带下一页游标"""
+        return {
+            'success': True,
+            'data': {
+                'entries': entries,
+                'next': self.encode_leaderboard_cursor(entries[-1]) if len(entries) == limit else None
+            },
+            'error': None
+        }
+    # ==================== 全局名次 ====================
+    def _start_rank_index_build(self) -> None:
+        """开始构建前记录期间的更新，构建完成后补写"""
+        with self._rank_index_lock:
+            self._rank_index_pending = {}
+
+    def _finish_rank_index_build(self, index: RankIndex) -> None:
+        """补写构建期间的更新后启用新索引"""
+        with self._rank_index_lock:
+            for uid, (score, level) in self._rank_index_pending.items():
+                index.update(uid, score, level)
+            self._rank_index_pending = None
+            self.rank_index = index
+            self.rank_index_built_at = time.monotonic()
+
+    def _fresh_rank_index(self) -> Optional[RankIndex]:
+        """返回可用的名次索引；未构建或超过 rank_index_max_age 未重建时返回None"""
+        index = self.rank_index
+        if index is None:
+            return None
+        if self.rank_index_max_age is not None and time.monotonic() - self.rank_index_built_at > self.rank_index_max_age:
+            return None
+        return index
+
+    def _update_rank_index(self, uid: int, rank: Dict[str, Any]) -> None:
+        """update_user_rank 成功后同步更新名次索引"""
+        with self._rank_index_lock:
+            if self._rank_index_pending is not None:
+                self._rank_index_pending[uid] = (rank["rank_score"], rank["rank_level"])
+            index = self.rank_index
+        if index is not None:
+            index.update(uid, rank["rank_score"], rank["rank_level"])
+
+    @staticmethod
+    def _position_filter(rank: Dict[str, Any], uid: int) -> Dict:
+        """排在该用户之前的用户，与LEADERBOARD_SORT的顺序一致"""
+        score_field, level_field, _ = (field for field, _ in LEADERBOARD_SORT)
+        score, level = rank["rank_score"], rank["rank_level"]
+        return {"$or": [
+            {score_field: {"$gt": score}},
+            {score_field: score, level_field: {"$gt": level}},
+            {score_field: score, level_field: level, "uid": {"$lt": uid}},
+        ]}
+
+
+class MongoDBManager(BaseMongoDBManager):
+    """MongoDB 数据管理工具类，封装了用户排名、车辆数据和比赛记录的操作"""
+
     def connect(self) -> bool:
         """连接 MongoDB 数据库"""
         try:
-            self.client = MongoClient(self.uri, serverSelectionTimeoutMS=5000)
-            self.db = self.client["desertsafari_api_v3"]
+            self.client = self.client_factory(self.uri, **self._client_options())
+            self.db = self.client[DB_NAME]
             return True
         except Exception as e:
             print(f"连接失败: {e}")
             return False
 
-    def close(self):
-        """关闭数据库连接"""
-        if self.client:
-            self.client.close()
+    def health(self) -> Dict[str, Any]:
+        """
+        健康检查：执行一次轻量查询，返回是否可用、耗时、进程号和连接池状态
+        连接池状态只在使用pymongo时提供
+        """
+        result = self._health_info()
+        if self.db is None:
+            result['error'] = '未连接'
+            return result
+        start = time.perf_counter()
+        try:
+            self.db[META_COLLECTION].find_one({"_id": UID_NORMALIZED_KEY})
+            result['ok'] = True
+        except Exception as e:
+            result['error'] = str(e)
+        result['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return result
 
+    def close(self):
+        """关闭数据库连接，开启写回队列时先写入排队的更新"""
+        self.disable_write_behind()
+        super().close()
     # ==================== 通用工具方法 ====================
-    def _get_user_filter(self, uid: int) -> Dict:
-        """获取用户查询条件，支持字符串和整数类型的UID"""
-        return {"$or": [{"uid": uid}, {"uid": str(uid)}]}
+    def _is_uid_normalized(self) -> bool:
+        """UserExtraInfo的UID是否已规范化为整数，未指定时读取一次标记"""
+        if self.uid_normalized is None:
+            try:
+                meta = self.db[META_COLLECTION].find_one({"_id": UID_NORMALIZED_KEY})
+                self.uid_normalized = bool(meta and meta.get("value"))
+            except Exception as e:
+                print(f"读取UID规范化标记失败: {e}")
+                return False
+        return self.uid_normalized
+
+    def _set_if_changed(
+            self,
+            collection: str,
+            conditions: List[Dict],
+            fields: Dict[str, Any],
+            projection: Dict[str, int]
+    ) -> Optional[Dict]:
+        """
+        一次往返执行$set并返回更新后的文档（按projection投影）
+        过滤条件要求至少一个字段的值会发生变化，文档不存在、条件不满足或数据未改变时返回None
+        """
+        changed = {"$or": [{field: {"$ne": value}} for field, value in fields.items()]}
+        return self.db[collection].find_one_and_update(
+            {"$and": conditions + [changed]},
+            {"$set": fields},
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+    # ==================== 写回队列 ====================
+    def enable_write_behind(self, window: float = 0.05, max_pending: int = 1000) -> None:
+        """
+        开启写回模式：update_user_rank 和 batch_update_cars_for_user 的更新进入队列，
+        同一文档在window秒内的多次$set合并为一次，按集合批量bulk_write写入
+        写回模式下更新立即返回排队后的值，不再区分“数据未改变”，提交时不读取数据库，
+        UID或车辆不存在等错误在写入时通过写入凭证（PendingWrite.error）报告；
+        需要确认写入时调用 flush_writes，close 时自动写入剩余更新
+        """
+        self.disable_write_behind()
+        self.write_behind = WriteBehindQueue(self._flush_write_behind, window, max_pending)
 
-    def _handle_db_error(self, operation: str, uid: int, e: Exception) -> None:
-        """统一处理数据库错误"""
-        print(f"{operation}失败(UID:{uid}): {e}")
+    def disable_write_behind(self) -> None:
+        """写入排队的更新并关闭写回模式"""
+        if self.write_behind:
+            queue, self.write_behind = self.write_behind, None
+            queue.close()
 
+    def _confirm_write(self, key: Tuple[str, int], ticket: PendingWrite) -> PendingWrite:
+        """
+        立即写入key对应文档的排队更新，返回时ticket已被确认
+        其他文档的更新仍由后台线程写入；写入在空的上下文中执行，不受当前请求的截止时间和驱动超时限制
+        """
+        if self.write_behind:
+            contextvars.Context().run(self.write_behind.flush, [key])
+        return ticket
+
+    def flush_writes(self) -> int:
+        """同步写入排队的全部更新并等待确认，返回写入成功的文档数；未开启写回模式时返回0"""
+        return self.write_behind.flush() if self.write_behind else 0
+
+    def write_behind_stats(self) -> Optional[Dict[str, Any]]:
+        """返回写回队列统计信息（队列深度、合并次数、写入批次等），未开启时返回None"""
+        return self.write_behind.stats() if self.write_behind else None
+
+    def _flush_write_behind(self, entries: List[QueuedWrite]) -> Dict[int, str]:
+        """
+        写回队列的批量写入：按集合分组，每BULK_WRITE_CHUNK_SIZE个文档一次无序bulk_write
+        entry.key 为 (数据类型, uid)，写入后删除对应缓存；过滤条件未匹配的文档计为失败；
+        写入成功的排名更新同步到名次索引；返回写入失败的 {下标: 错误信息}
+        """
+        failed = {}
+        by_collection = {}
+        for i, entry in enumerate(entries):
+            by_collection.setdefault(entry.collection, []).append(i)
+
+        for collection, indexes in by_collection.items():
+            for start in range(0, len(indexes), BULK_WRITE_CHUNK_SIZE):
+                chunk = indexes[start:start + BULK_WRITE_CHUNK_SIZE]
+                operations = [UpdateOne(entries[i].query, {"$set": entries[i].fields}) for i in chunk]
+                matched = None
+                try:
+                    matched = self.db[collection].bulk_write(operations, ordered=False).matched_count
+                except BulkWriteError as e:
+                    for err in e.details.get("writeErrors", []):
+                        failed[chunk[err["index"]]] = err.get("errmsg", str(e))
+                    matched = e.details.get("nMatched", 0)
+                except Exception as e:
+                    # 超时也只记为本批失败，继续写入其余批次
+                    self._log_db_error(f"合并写入{collection}", entries[chunk[0]].key[1], e)
+                    failed.update({i: str(e) for i in chunk})
+                finally:
+                    for i in chunk:
+                        self._invalidate(*entries[i].key)
+                written = [i for i in chunk if i not in failed]
+                if matched is not None and matched < len(written):
+                    failed.update(self._unmatched_writes(collection, entries, written))
+
+        for i, entry in enumerate(entries):
+            if i not in failed and entry.key[0] == "user":
+                self._update_rank_index(entry.key[1], {
+                    "rank_score": entry.fields["racetrack_rank_data.rank_score"],
+                    "rank_level": entry.fields["racetrack_rank_data.rank_level"]
+                })
+        return failed
+
+    def _unmatched_writes(self, collection: str, entries: List[QueuedWrite], indexes: List[int]) -> Dict[int, str]:
+        """
+        bulk_write匹配的文档数少于请求数时，逐个确认过滤条件，返回未匹配的 {下标: 错误信息}
+        车辆更新未匹配时按 _retry_car_write 判断原因或重试
+        """
+        failed = {}
+        for i in indexes:
+            entry = entries[i]
+            try:
+                if self.db[collection].count_documents(entry.query, limit=1):
+                    continue
+                error = self._retry_car_write(entry) if entry.key[0] == "car" else WRITE_BEHIND_UNMATCHED[entry.key[0]]
+            except Exception as e:
+                self._log_db_error(f"重试写入{collection}", entry.key[1], e)
+                error = str(e)
+            if error:
+                failed[i] = error
+        return failed
     # ==================== UserInfo 集合操作 ====================
     def get_user_rank(self, uid: int) -> Optional[Dict[str, Any]]:
         """查询用户排名数据（修改版：使用racetrack_rank_data.rank_level）"""
+        cached = self._cache_get("user", uid)
+        if cached is not MISSING:
+            return cached
+        generation = self.generations.get(("user", uid))
         try:
-            data = self.db["UserInfo"].find_one(
+            # 同一UID并发的查询合并为一次数据库调用
+            data = self.single_flight.do(("UserInfo", uid), lambda: self.db["UserInfo"].find_one(
                 {"uid": uid},
                 {"_id": 0, "racetrack_rank_data.rank_score": 1, "racetrack_rank_data.rank_level": 1}
-            )
-            return {
-                "rank_score": data["racetrack_rank_data"]["rank_score"],
-                "rank_level": data["racetrack_rank_data"]["rank_level"]  # 修改这里
-            } if data else None
+            ), generation)
+            result = self._extract_user_rank(data)
         except Exception as e:
             self._handle_db_error("查询UserInfo", uid, e)
             return None
+        self._cache_set("user", uid, result, generation)
+        return result
+
+    def update_user_rank(self, uid: int, score: int, level: int, sync: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        更新用户排名数据（修改版：使用racetrack_rank_data.rank_level）
+        写回模式下更新进入队列，直接返回排队后的排名数据，写入确认后才更新名次索引；
+        sync=True 时立即写入并等待确认，写入失败（如UID不存在）时抛出WriteFailed
+        """
+        fields = {
+            "racetrack_rank_data.rank_score": score,
+            "racetrack_rank_data.rank_level": level  # 修改这里
+        }
+        if self.write_behind:
+            # 名次索引在写入确认后更新，UID不存在时写入计为失败
+            ticket = self.write_behind.submit("UserInfo", ("user", uid), {"uid": uid}, fields)
+            self._invalidate("user", uid)
+            if sync:
+                self._confirm_write(("user", uid), ticket).result()
+            return {"rank_score": score, "rank_level": level}
 
-    def update_user_rank(self, uid: int, score: int, level: int) -> Optional[Dict[str, Any]]:
-        """更新用户排名数据（修改版：使用racetrack_rank_data.rank_level）"""
         try:
-            result = self.db["UserInfo"].update_one(
-                {"uid": uid},
-                {"$set": {
-                    "racetrack_rank_data.rank_score": score,
-                    "racetrack_rank_data.rank_level": level  # 修改这里
-                }}
+            data = self._set_if_changed(
+                "UserInfo",
+                [{"uid": uid}],
+                fields,
+                {"_id": 0, "racetrack_rank_data.rank_score": 1, "racetrack_rank_data.rank_level": 1}
             )
-            return self.get_user_rank(uid) if result.modified_count > 0 else None
+            self._invalidate("user", uid)
+            rank = self._extract_user_rank(data)
+            if rank:
+                self._update_rank_index(uid, rank)
+            return rank
         except Exception as e:
             self._handle_db_error("更新UserInfo", uid, e)
+            self._invalidate("user", uid)
             return None
-
     # ==================== UserExtraInfo 集合操作 ====================
+    def get_extra_info(self, uid: int, parts: Tuple[str, ...] = ("car", "rank-list")) -> Dict[str, Any]:
+        """
+        一次查询同时获取car_list和recent_rank_list
+        返回格式：
+            {
+                "car_list": {...},   # parts包含"car"时
+                "rank_list": [...]   # parts包含"rank-list"时，查询失败为None
+            }
+        """
+        parts = tuple(part for part in EXTRA_INFO_FIELDS if part in parts)
+        values = {}
+        for part in parts:
+            cached = self._cache_get(part, uid)
+            if cached is not MISSING:
+                values[part] = cached
+
+        missing = tuple(part for part in parts if part not in values)
+        if missing:
+            generations = self._read_generations(missing, [uid])
+            try:
+                data = self.single_flight.do(
+                    ("UserExtraInfo", uid, missing),
+                    lambda: self._extra_info_collection(missing).find_one(
+                        self._get_user_filter(uid),
+                        self._get_extra_projection(missing)
+                    ),
+                    self.generations.stamp(generations)
+                )
+            except Exception as e:
+                self._handle_db_error("查询UserExtraInfo", uid, e)
+                for part in missing:
+                    values[part] = {} if part == "car" else None
+            else:
+                for part in missing:
+                    values[part] = self._extract_extra_part(part, data)
+                    self._cache_set(part, uid, values[part], generations[(part, uid)])
+
+        return {EXTRA_RESULT_KEYS[part]: values[part] for part in parts}
+
     def get_car_list(self, uid: int) -> Dict[str, Any]:
         """获取用户的car_list数据"""
-        try:
-            data = self.db["UserExtraInfo"].find_one(
-                self._get_user_filter(uid),
-                {"_id": 0, "car_garage.car_list": 1}
-            )
-            return data.get("car_garage", {}).get("car_list", {}) if data else {}
-        except Exception as e:
-            self._handle_db_error("获取车辆列表", uid, e)
-            return {}
+        return self.get_extra_info(uid, ("car",))["car_list"]
 
     def get_car_scores(self, uid: int) -> Dict[str, Dict[str, Any]]:
         """获取所有车辆的分数信息，包含rank_score、season_best_rank_score和palace_score_list的score"""
-        car_list = self.get_car_list(uid)
-        return {
-            car_id: {
-                'rank_score': car_data.get('rank_score', 'N/A'),
-                'season_best_rank_score': car_data.get('season_best_rank_score', 'N/A'),
-                'palace_score_list': [
-                    car_data.get('palace_score_list', [{}] * 5)[i].get('score', -1) for i in range(5)
-                ]
-            }
-            for car_id, car_data in car_list.items()
-        }
+        return self._build_car_scores(self.get_car_list(uid))
 
     def batch_update_cars_for_user(
             self,
             uid: int,
-            car_updates: Dict[str, Dict[str, Any]]
+            car_updates: Dict[str, Dict[str, Any]],
+            sync: bool = False
     ) -> Dict[str, Any]:
         """
         批量更新车辆分数和宫殿分数（不再处理recent_palace_score）
@@ -118,68 +1061,118 @@ class MongoDBManager:
                     "palace_scores": [int, int, int, int, int]  # 可选，五个分数
                 }
             }
+        写回模式下 sync=True 时立即写入并等待确认，写入失败时返回错误信息
         """
-        try:
-            current_cars = self.get_car_list(uid)
-            if not current_cars:
-                return {'success': False, 'error': '用户无车辆数据'}
-
-            invalid_cars = [cid for cid in car_updates if cid not in current_cars]
-            if invalid_cars:
-                return {'success': False, 'error': f'无效车辆ID: {", ".join(invalid_cars)}'}
-
-            update_fields = {}
-            for car_id, updates in car_updates.items():
-                if 'rank_score' in updates:
-                    update_fields[f"car_garage.car_list.{car_id}.rank_score"] = updates['rank_score']
-                if 'season_best_rank_score' in updates:
-                    update_fields[f"car_garage.car_list.{car_id}.season_best_rank_score"] = updates[
-                        'season_best_rank_score']
-
-                if 'palace_scores' in updates:
-                    new_scores = updates['palace_scores']
-                    if not isinstance(new_scores, list) or len(new_scores) != 5:
-                        return {'success': False, 'error': 'palace_scores必须是长度为5的列表'}
-
-                    # 获取当前的palace_score_list，如果不存在则初始化为空列表
-                    current_list = current_cars[car_id].get('palace_score_list', [{}] * 5)
-                    # 确保current_list长度为5
-                    if len(current_list) < 5:
-                        current_list.extend([{}] * (5 - len(current_list)))
-
-                    updated_list = []
-                    for i in range(5):
-                        # 如果有新的分数，则使用新分数；否则保留原分数
-                        score = new_scores[i] if 'palace_scores' in updates and i < len(new_scores) else current_list[
-                            i].get('score', -1)
-                        # 将invalid设置为true
-                        updated_list.append({
-                            "score": score,
-                            "protect_state": current_list[i].get("protect_state", 0),
-                            "invalid": False  # 设置为true
-                        })
-                    update_fields[f"car_garage.car_list.{car_id}.palace_score_list"] = updated_list
-
-            if not update_fields:
-                return {'success': False, 'error': '无有效更新字段'}
+        plan = self._plan_car_updates(uid, car_updates)
+        if plan['error']:
+            return {'success': False, 'error': plan['error']}
+        if self.write_behind:
+            result, ticket = self._queue_car_updates(uid, car_updates, plan)
+            if sync and self._confirm_write(("car", uid), ticket).error is not None:
+                return {'success': False, 'error': ticket.error}
+            return result
 
-            result = self.db["UserExtraInfo"].update_one(
-                self._get_user_filter(uid),
-                {"$set": update_fields}
-            )
-
-            if result.modified_count > 0:
-                updated_data = self.get_car_scores(uid)
-                return {
-                    'success': True,
-                    'data': {car_id: updated_data.get(car_id) for car_id in car_updates}
-                }
-            else:
-                return {'success': False, 'error': '数据未改变'}
+        try:
+            data = self._set_if_changed("UserExtraInfo", plan['conditions'], plan['fields'], plan['projection'])
+            if data is None:
+                # 未匹配时读取车辆数据，区分失败原因；palace_score_list不足5项时整体写入
+                self._invalidate("car", uid)
+                error, retry_fields = self._check_car_fallback(self.get_car_list(uid), car_updates, plan['fields'])
+                if error:
+                    return {'success': False, 'error': error}
+                if retry_fields:
+                    data = self._set_if_changed(
+                        "UserExtraInfo", plan['car_conditions'], retry_fields, plan['projection']
+                    )
+            self._invalidate("car", uid)
+            return self._car_update_result(data, car_updates)
         except Exception as e:
             self._handle_db_error("批量更新用户车辆", uid, e)
+            self._invalidate("car", uid)
             return {'success': False, 'error': str(e)}
 
+    def _queue_car_updates(
+            self,
+            uid: int,
+            car_updates: Dict[str, Dict[str, Any]],
+            plan: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], PendingWrite]:
+        """
+        写回模式下的车辆更新：不读取当前数据，直接进入队列，返回 (结果, 写入凭证)
+        车辆是否存在、palace_score_list是否满5项由写入时的过滤条件校验，未匹配时见 _retry_car_write；
+        返回本次提交的分数，未提交的字段为N/A或-1
+        """
+        query = {}
+        for condition in plan['conditions']:
+            query.update(condition)
+        ticket = self.write_behind.submit("UserExtraInfo", ("car", uid), query, plan['fields'])
+        self._invalidate("car", uid)
+
+        cars = {
+            car_id: {"palace_score_list": [{} for _ in range(5)]} if 'palace_scores' in updates else {}
+            for car_id, updates in car_updates.items()
+        }
+        prefix = EXTRA_INFO_FIELDS["car"] + "."
+        for path, value in plan['fields'].items():
+            set_path(cars, path[len(prefix):], value)
+        return {
+            'success': True,
+            'queued': True,
+            'data': self._build_car_scores(cars)
+        }, ticket
+
+    @staticmethod
+    def _queued_car_updates(fields: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """由写回队列中合并后的$set字段还原 batch_update_cars_for_user 的参数格式"""
+        car_updates = {}
+        prefix = EXTRA_INFO_FIELDS["car"] + "."
+        for path, value in fields.items():
+            car_id, _, field = path[len(prefix):].partition(".")
+            updates = car_updates.setdefault(car_id, {})
+            if field.startswith("palace_score_list."):
+                _, i, name = field.split(".")
+                if name == "score":
+                    updates.setdefault('palace_scores', [None] * 5)[int(i)] = value
+            else:
+                updates[field] = value
+        return car_updates
+
+    def _retry_car_write(self, entry: QueuedWrite) -> Optional[str]:
+        """
+        写回队列中的车辆更新未匹配时读取车辆数据判断原因，与同步模式的 _check_car_fallback 一致：
+        无效车辆ID只让提交了这些车辆的写入失败，其余车辆的字段重新写入；
+        palace_score_list不足5项时改为整体写入。返回其余写入的错误信息，写入成功时返回None
+        """
+        uid = entry.key[1]
+        prefix = EXTRA_INFO_FIELDS["car"] + "."
+        car_updates = self._queued_car_updates(entry.fields)
+        data = self.db["UserExtraInfo"].find_one(self._get_user_filter(uid), self._get_extra_projection(("car",)))
+        current_cars = self._extract_car_list(data)
+        invalid = [car_id for car_id in car_updates if car_id not in current_cars]
+        if current_cars and invalid:
+            for ticket in entry.tickets:
+                ticket_invalid = [car_id for car_id in invalid if prefix + car_id in ticket.query]
+                if ticket_invalid:
+                    ticket.resolve(f'无效车辆ID: {", ".join(ticket_invalid)}')
+            if len(invalid) == len(car_updates):
+                return f'无效车辆ID: {", ".join(invalid)}'
+            car_updates = {car_id: updates for car_id, updates in car_updates.items() if car_id not in invalid}
+
+        fields = {
+            path: value for path, value in entry.fields.items()
+            if path[len(prefix):].partition(".")[0] in car_updates
+        }
+        error, retry_fields = self._check_car_fallback(current_cars, car_updates, fields)
+        if error:
+            return error
+        query = {
+            field: value for field, value in entry.query.items()
+            if not field.endswith(".palace_score_list.4") and field[len(prefix):] not in invalid
+        }
+        result = self.db["UserExtraInfo"].update_one(query, {"$set": retry_fields or fields})
+        self._invalidate("car", uid)
+        return None if result.matched_count else WRITE_BEHIND_UNMATCHED["car"]
+
     def update_car_scores(
             self,
             uid: int,
@@ -188,47 +1181,121 @@ class MongoDBManager:
             season_best_rank_score: int
     ) -> Dict[str, Any]:
         """更新指定车辆的分数"""
+        prefix = f"car_garage.car_list.{car_id}"
         try:
-            car_list = self.get_car_list(uid)
-            if not car_list or car_id not in car_list:
-                return {'success': False, 'error': f'车辆 {car_id} 不存在'}
-
-            result = self.db["UserExtraInfo"].update_one(
-                self._get_user_filter(uid),
-                {"$set": {
-                    f"car_garage.car_list.{car_id}.rank_score": rank_score,
-                    f"car_garage.car_list.{car_id}.season_best_rank_score": season_best_rank_score
-                }}
+            data = self._set_if_changed(
+                "UserExtraInfo",
+                [self._get_user_filter(uid), {prefix: {"$exists": True}}],
+                {
+                    f"{prefix}.rank_score": rank_score,
+                    f"{prefix}.season_best_rank_score": season_best_rank_score
+                },
+                {"_id": 0, f"{prefix}.rank_score": 1, f"{prefix}.season_best_rank_score": 1}
             )
+            self._invalidate("car", uid)
 
-            if result.modified_count == 1:
-                updated_data = self.get_car_list(uid)
+            if data:
+                car_data = self._extract_car_list(data)[car_id]
                 return {
                     'success': True,
                     'data': {
                         car_id: {
-                            'rank_score': updated_data[car_id].get('rank_score'),
-                            'season_best_rank_score': updated_data[car_id].get('season_best_rank_score')
+                            'rank_score': car_data.get('rank_score'),
+                            'season_best_rank_score': car_data.get('season_best_rank_score')
                         }
                     }
                 }
+            # 未匹配时读取一次，区分车辆不存在和数据未改变
+            if car_id not in self.get_car_list(uid):
+                return {'success': False, 'error': f'车辆 {car_id} 不存在'}
             return {'success': False, 'error': '数据未改变'}
         except Exception as e:
             self._handle_db_error("更新车辆分数", uid, e)
+            self._invalidate("car", uid)
             return {'success': False, 'error': str(e)}
-
+    # ==================== 组合更新 ====================
+    def combo_update_bulk(
+            self,
+            uids: List[int],
+            car_id: str,
+            rank_score: int,
+            season_best_rank_score: int,
+            rank_list: List[Union[Dict[str, Any], int]],
+            chunk_size: int = BULK_WRITE_CHUNK_SIZE
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        批量更新多个用户的指定车辆分数和整个recent_rank_list
+        每批chunk_size个UID：一次$in查询确定各用户需要的修改，
+        车辆和比赛记录的更新合并为一次无序bulk_write，车辆更新的过滤条件中校验车辆存在
+        返回格式：
+            {uid: {'success': 两项都成功, 'car': {...}, 'rank_list': {...}}}
+        """
+        uids = list(dict.fromkeys(uids))
+        car_fields = {
+            f"car_garage.car_list.{car_id}.rank_score": rank_score,
+            f"car_garage.car_list.{car_id}.season_best_rank_score": season_best_rank_score
+        }
+        results = {}
+        for start in range(0, len(uids), chunk_size):
+            chunk = uids[start:start + chunk_size]
+            try:
+                current = self._fetch_combo_state(chunk, car_id)
+                keys, operations = self._plan_combo_updates(chunk, current, car_id, car_fields, rank_list)
+                failed = self._bulk_write_extra(keys, operations) if operations else {}
+            except Exception as e:
+                self._handle_db_error("批量组合更新", chunk[0], e)
+                error = self._chunk_error_results(chunk, e)
+                results.update({uid: {'success': False, 'car': error[uid], 'rank_list': error[uid]} for uid in chunk})
+                continue
+            results.update(self._combo_results(
+                chunk, current, set(keys), failed, car_id, rank_score, season_best_rank_score, rank_list
+            ))
+        return results
+
+    def _fetch_combo_state(self, uids: List[int], car_id: str) -> Dict[int, Tuple[Optional[Dict], List]]:
+        """一次$in查询获取指定车辆的分数和recent_rank_list，返回 {uid: (车辆数据或None, 比赛记录)}"""
+        prefix = f"car_garage.car_list.{car_id}"
+        state = {}
+        for doc in self.db["UserExtraInfo"].find(
+                self._get_users_filter(uids),
+                {
+                    "_id": 0, "uid": 1,
+                    f"{prefix}.rank_score": 1,
+                    f"{prefix}.season_best_rank_score": 1,
+                    "racetrack_match_data.recent_rank_list": 1
+                }
+        ):
+            state.setdefault(int(doc["uid"]), (
+                self._extract_car_list(doc).get(car_id),
+                self._extract_recent_rank_list(doc)
+            ))
+        return state
+
+    def _bulk_write_extra(self, keys: List[Tuple[int, str]], operations: List[UpdateOne]) -> Dict[Tuple[int, str], str]:
+        """
+        以一次无序bulk_write执行UserExtraInfo上的多个更新
+        keys 与 operations 一一对应，为 (uid, 数据类型)；返回写入失败的 {key: 错误信息}
+        """
+        try:
+            self.db["UserExtraInfo"].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return {keys[err["index"]]: err.get("errmsg", str(e)) for err in e.details.get("writeErrors", [])}
+        finally:
+            for uid, part in keys:
+                self._invalidate(part, uid)
+        return {}
     # ==================== recent_rank_list 操作 ====================
     def get_recent_rank_list(self, uid: int) -> Optional[List[Union[Dict[str, Any], int]]]:
         """获取用户的最近比赛排名列表"""
-        try:
-            data = self.db["UserExtraInfo"].find_one(
-                self._get_user_filter(uid),
-                {"_id": 0, "racetrack_match_data.recent_rank_list": 1}
-            )
-            return data.get("racetrack_match_data", {}).get("recent_rank_list", []) if data else []
-        except Exception as e:
-            self._handle_db_error("获取比赛记录", uid, e)
-            return None
+        return self.get_extra_info(uid, ("rank-list",))["rank_list"]
+
+    def get_car_scores_and_rank_list(self, uid: int) -> Dict[str, Any]:
+        """一次查询同时获取车辆分数和比赛记录"""
+        extra = self.get_extra_info(uid)
+        return {
+            "car_scores": self._build_car_scores(extra["car_list"]),
+            "rank_list": extra["rank_list"]
+        }
 
     def update_recent_rank_list(
             self,
@@ -241,6 +1308,7 @@ class MongoDBManager:
                 self._get_user_filter(uid),
                 {"$set": {"racetrack_match_data.recent_rank_list": new_list}}
             )
+            self._invalidate("rank-list", uid)
             return {
                 'success': result.modified_count == 1,
                 'data': new_list,
@@ -248,15 +1316,63 @@ class MongoDBManager:
             }
         except Exception as e:
             self._handle_db_error("更新比赛记录", uid, e)
+            self._invalidate("rank-list", uid)
             return {'success': False, 'error': str(e)}
 
+    def _fetch_rank_lists(self, uids: List[int]) -> Dict[int, List[Union[Dict[str, Any], int]]]:
+        """一次$in查询获取多个用户当前的recent_rank_list，不存在的用户不出现在结果中"""
+        rank_lists = {}
+        for doc in self.db["UserExtraInfo"].find(
+                self._get_users_filter(uids),
+                {"_id": 0, "uid": 1, "racetrack_match_data.recent_rank_list": 1}
+        ):
+            rank_lists.setdefault(int(doc["uid"]), self._extract_recent_rank_list(doc))
+        return rank_lists
+
+    def _bulk_write_rank_lists(self, updates: Dict[int, Tuple[Dict, Dict]]) -> Dict[int, str]:
+        """
+        以一次无序bulk_write执行多个用户的更新
+        updates: {uid: (追加的过滤条件, $set内容)}
+        返回写入失败的 {uid: 错误信息}
+        """
+        uids = list(updates)
+        operations = [
+            UpdateOne({**self._get_user_filter(uid), **updates[uid][0]}, {"$set": updates[uid][1]})
+            for uid in uids
+        ]
+        try:
+            self.db["UserExtraInfo"].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return {uids[err["index"]]: err.get("errmsg", str(e)) for err in e.details.get("writeErrors", [])}
+        finally:
+            for uid in uids:
+                self._invalidate("rank-list", uid)
+        return {}
+
     def batch_update_recent_rank_list(
             self,
             uids: List[int],
-            new_list: List[Union[Dict[str, Any], int]]
+            new_list: List[Union[Dict[str, Any], int]],
+            chunk_size: int = BULK_WRITE_CHUNK_SIZE
     ) -> Dict[int, Dict[str, Any]]:
-        """批量更新多个用户的比赛排名列表"""
-        return {uid: self.update_recent_rank_list(uid, new_list) for uid in uids}
+        """
+        批量更新多个用户的比赛排名列表
+        每批chunk_size个UID：一次$in查询确定需要修改的用户，一次无序bulk_write写入
+        """
+        uids = list(dict.fromkeys(uids))
+        results = {}
+        for start in range(0, len(uids), chunk_size):
+            chunk = uids[start:start + chunk_size]
+            try:
+                current = self._fetch_rank_lists(chunk)
+                updates = self._plan_rank_list_updates(chunk, current, new_list)
+                failed = self._bulk_write_rank_lists(updates) if updates else {}
+            except Exception as e:
+                self._handle_db_error("批量更新比赛记录", chunk[0], e)
+                results.update(self._chunk_error_results(chunk, e))
+                continue
+            results.update(self._rank_list_results(chunk, current, updates, failed, new_list))
+        return results
 
     def update_single_record(
             self,
@@ -264,38 +1380,410 @@ class MongoDBManager:
             index: int,
             new_value: Union[Dict[str, Any], int]
     ) -> Dict[str, Any]:
-        """更新单个比赛记录"""
+        """
+        更新单个比赛记录
+        在服务端按位置$set单个元素，过滤条件中校验索引范围，一次往返完成且没有读改写竞争
+        """
+        field = f"racetrack_match_data.recent_rank_list.{index}"
         try:
+            data = None
+            if index >= 0:
+                data = self.db["UserExtraInfo"].find_one_and_update(
+                    {**self._get_user_filter(uid), field: {"$exists": True, "$ne": new_value}},
+                    {"$set": {field: new_value}},
+                    projection={"_id": 0, "racetrack_match_data.recent_rank_list": 1},
+                    return_document=ReturnDocument.AFTER
+                )
+            self._invalidate("rank-list", uid)
+            if data:
+                return {
+                    'success': True,
+                    'data': self._extract_recent_rank_list(data),
+                    'error': None
+                }
+
+            # 未匹配时再读取一次，区分索引越界和数据未改变
             current_list = self.get_recent_rank_list(uid) or []
             if not 0 <= index < len(current_list):
                 return {
                     'success': False,
                     'error': f'索引 {index} 超出范围（0-{len(current_list) - 1}）'
                 }
-
-            current_list[index] = new_value
-            result = self.db["UserExtraInfo"].update_one(
-                self._get_user_filter(uid),
-                {"$set": {"racetrack_match_data.recent_rank_list": current_list}}
-            )
-
-            return {
-                'success': result.modified_count == 1,
-                'data': current_list,
-                'error': None if result.modified_count == 1 else '数据未改变'
-            }
+            return {'success': False, 'data': current_list, 'error': '数据未改变'}
         except Exception as e:
             self._handle_db_error("更新比赛记录项", uid, e)
+            self._invalidate("rank-list", uid)
             return {'success': False, 'error': str(e)}
 
     def batch_update_single_record(
             self,
             uids: List[int],
             index: int,
-            new_value: Union[Dict[str, Any], int]
+            new_value: Union[Dict[str, Any], int],
+            chunk_size: int = BULK_WRITE_CHUNK_SIZE
     ) -> Dict[int, Dict[str, Any]]:
-        """批量更新多个用户的单个比赛记录"""
-        return {uid: self.update_single_record(uid, index, new_value) for uid in uids}
+        """
+        批量更新多个用户的单个比赛记录
+        每批chunk_size个UID：一次$in查询校验索引范围，一次无序bulk_write按位置写入
+        """
+        uids = list(dict.fromkeys(uids))
+        results = {}
+        for start in range(0, len(uids), chunk_size):
+            chunk = uids[start:start + chunk_size]
+            try:
+                current = self._fetch_rank_lists(chunk)
+                updates = self._plan_record_updates(chunk, current, index, new_value)
+                failed = self._bulk_write_rank_lists(updates) if updates else {}
+            except Exception as e:
+                self._handle_db_error("批量更新比赛记录项", chunk[0], e)
+                results.update(self._chunk_error_results(chunk, e))
+                continue
+            results.update(self._record_results(chunk, current, updates, failed, index, new_value))
+        return results
+    # ==================== UID 规范化 ====================
+    def normalize_uid_batch(
+            self,
+            last_id: Any = None,
+            batch_size: int = 1000
+    ) -> Dict[str, Any]:
+        """
+        将一批字符串类型的UID转换为整数，按_id顺序扫描
+        返回格式：
+            {
+                "last_id": 本批最后一个文档的_id（无剩余文档时为None）,
+                "scanned": 扫描数, "converted": 转换数,
+                "skipped": [无法转换的UID], "errors": 写入失败数
+            }
+        """
+        query = {"uid": {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = list(
+            self.db["UserExtraInfo"].find(query, {"_id": 1, "uid": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        result = {
+            "last_id": docs[-1]["_id"] if docs else None,
+            "scanned": len(docs),
+            "converted": 0,
+            "skipped": [],
+            "errors": 0
+        }
+
+        operations = []
+        for doc in docs:
+            if doc["uid"].isdigit():
+                # 过滤条件带上原值，避免覆盖扫描后被修改的文档
+                operations.append(UpdateOne(
+                    {"_id": doc["_id"], "uid": doc["uid"]},
+                    {"$set": {"uid": int(doc["uid"])}}
+                ))
+            else:
+                result["skipped"].append(doc["uid"])
+
+        if operations:
+            try:
+                write_result = self.db["UserExtraInfo"].bulk_write(operations, ordered=False)
+                result["converted"] = write_result.modified_count
+            except BulkWriteError as e:
+                result["converted"] = e.details.get("nModified", 0)
+                result["errors"] = len(e.details.get("writeErrors", []))
+        return result
+
+    def count_string_uids(self) -> int:
+        """统计UserExtraInfo中仍为字符串类型的UID数量"""
+        return self.db["UserExtraInfo"].count_documents({"uid": {"$type": "string"}})
+
+    def mark_uid_normalized(self, value: bool = True) -> None:
+        """写入UID规范化标记，之后的查询使用整数等值条件"""
+        self.db[META_COLLECTION].update_one(
+            {"_id": UID_NORMALIZED_KEY},
+            {"$set": {"value": value}},
+            upsert=True
+        )
+        self.uid_normalized = value
+    # ==================== 批量查询 ====================
+    def get_users_bulk(
+            self,
+            uids: List[int],
+            parts: Tuple[str, ...] = QUERY_PARTS
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        批量查询多个用户的数据，每个集合每批只发起一次$in查询
+        parts 可选值: "user"、"car"、"rank-list"
+        返回格式：
+            {
+                uid: {
+                    "user_rank": {...},    # parts包含"user"时
+                    "car_scores": {...},   # parts包含"car"时
+                    "rank_list": [...]     # parts包含"rank-list"时
+                }
+            }
+        """
+        uids = list(dict.fromkeys(uids))
+        parts = tuple(part for part in QUERY_PARTS if part in parts)
+        user_parts = tuple(part for part in parts if part == "user")
+        extra_parts = tuple(part for part in parts if part in EXTRA_INFO_FIELDS)
+        values = self._cached_values(uids, parts)
+
+        for start in range(0, len(uids), BULK_QUERY_CHUNK_SIZE):
+            chunk = uids[start:start + BULK_QUERY_CHUNK_SIZE]
+
+            missing = self._missing_uids(values, chunk, user_parts)
+            if missing:
+                generations = self._read_generations(user_parts, missing)
+                try:
+                    docs = self.single_flight.do(
+                        ("UserInfo", tuple(sorted(missing))),
+                        lambda: list(self.db["UserInfo"].find({"uid": {"$in": missing}}, USER_BULK_PROJECTION)),
+                        self.generations.stamp(generations)
+                    )
+                except Exception as e:
+                    self._handle_db_error("批量查询UserInfo", missing[0], e)
+                    self._fill_failed_values(values, missing, user_parts)
+                else:
+                    self._store_user_docs(values, missing, docs, generations)
+
+            missing = self._missing_uids(values, chunk, extra_parts)
+            if missing:
+                generations = self._read_generations(extra_parts, missing)
+                try:
+                    docs = self.single_flight.do(
+                        ("UserExtraInfo", tuple(sorted(missing)), extra_parts),
+                        lambda: list(self._extra_info_collection(extra_parts).find(
+                            self._get_users_filter(missing),
+                            {**self._get_extra_projection(extra_parts), "uid": 1}
+                        )),
+                        self.generations.stamp(generations)
+                    )
+                except Exception as e:
+                    self._handle_db_error("批量查询UserExtraInfo", missing[0], e)
+                    self._fill_failed_values(values, missing, extra_parts)
+                else:
+                    self._store_extra_docs(values, missing, extra_parts, docs, generations)
+
+        return self._assemble_bulk_results(uids, parts, values)
+
+    def iter_users(
+            self,
+            parts: Tuple[str, ...] = QUERY_PARTS,
+            batch_size: int = BULK_QUERY_CHUNK_SIZE
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        以服务端游标遍历全部用户，逐个返回 (uid, 与get_users_bulk一致的数据)
+        有"user"时以UserInfo为主游标，否则以UserExtraInfo为主游标；
+        每攒够batch_size个文档，再用一次$in查询另一个集合，不经过读缓存
+        """
+        parts = tuple(part for part in QUERY_PARTS if part in parts)
+        extra_parts = tuple(part for part in parts if part in EXTRA_INFO_FIELDS)
+        extra_projection = {**self._get_extra_projection(extra_parts), "uid": 1}
+        if "user" in parts:
+            cursor = self.db["UserInfo"].find({}, USER_BULK_PROJECTION)
+        else:
+            cursor = self._extra_info_collection(extra_parts).find({}, extra_projection)
+        cursor = cursor.batch_size(batch_size)
+
+        batch = []
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield from self._export_batch(batch, parts, extra_parts, extra_projection)
+                batch = []
+        if batch:
+            yield from self._export_batch(batch, parts, extra_parts, extra_projection)
+
+    def _export_batch(
+            self,
+            docs: List[Dict],
+            parts: Tuple[str, ...],
+            extra_parts: Tuple[str, ...],
+            extra_projection: Dict[str, int]
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """组装一批主游标文档，需要时补查另一个集合"""
+        values = self._export_values(docs, parts, extra_parts)
+        uids = list(values)
+        if "user" in parts and extra_parts and uids:
+            extra_docs = {}
+            try:
+                for doc in self._extra_info_collection(extra_parts).find(self._get_users_filter(uids), extra_projection):
+                    extra_docs.setdefault(int(doc["uid"]), doc)
+            except Exception as e:
+                self._handle_db_error("批量查询UserExtraInfo", uids[0], e)
+                self._fill_failed_values(values, uids, extra_parts)
+            else:
+                for uid in uids:
+                    for part in extra_parts:
+                        values[uid][part] = self._extract_extra_part(part, extra_docs.get(uid))
+
+        yield from self._assemble_bulk_results(uids, parts, values).items()
+    # ==================== 排行榜 ====================
+    def ensure_leaderboard_index(self) -> None:
+        """确保UserInfo上存在排行榜复合索引，每个实例只创建一次"""
+        if not self._leaderboard_index_ready:
+            self.db["UserInfo"].create_index(LEADERBOARD_SORT, name=LEADERBOARD_INDEX_NAME)
+            self._leaderboard_index_ready = True
+
+    def _get_leaderboard_snapshot(self) -> List[Dict[str, Any]]:
+        """排行榜前LEADERBOARD_SNAPSHOT_SIZE名的快照，过期后由一个线程重新查询"""
+        entries = self._fresh_snapshot()
+        if entries is not None:
+            return entries
+        with self._leaderboard_lock:
+            entries = self._fresh_snapshot()
+            if entries is None:
+                self.ensure_leaderboard_index()
+                docs = list(
+                    self.db["UserInfo"].find(self._leaderboard_filter(None), USER_BULK_PROJECTION)
+                    .sort(LEADERBOARD_SORT)
+                    .limit(LEADERBOARD_SNAPSHOT_SIZE)
+                )
+                entries = self._leaderboard_entries(docs, 0)
+                self._leaderboard_snapshot = (time.monotonic() + LEADERBOARD_SNAPSHOT_TTL, entries)
+        return entries
+
+    def get_leaderboard(self, limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        按rank_score（相同时按rank_level）降序返回排行榜
+        cursor 为上一页返回的next，前LEADERBOARD_SNAPSHOT_SIZE名从快照读取，之后按复合索引键集分页
+        返回格式：
+            {'success': bool, 'data': {'entries': [{rank, uid, rank_score, rank_level}], 'next': 游标或None}}
+        """
+        limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+        try:
+            after, start_rank = self.decode_leaderboard_cursor(cursor)
+        except ValueError as e:
+            return {'success': False, 'data': None, 'error': str(e)}
+        try:
+            entries = self._page_from_snapshot(self._get_leaderboard_snapshot(), after, limit)
+            if entries is None:
+                docs = list(
+                    self.db["UserInfo"].find(self._leaderboard_filter(after), USER_BULK_PROJECTION)
+                    .sort(LEADERBOARD_SORT)
+                    .limit(limit)
+                )
+                entries = self._leaderboard_entries(docs, start_rank)
+            return self._leaderboard_result(entries, limit)
+        except Exception as e:
+            self._handle_db_error("查询排行榜", 0, e)
+            return {'success': False, 'data': None, 'error': str(e)}
+    # ==================== 全局名次 ====================
+    def start_rank_index_refresh(self, interval: float = RANK_INDEX_REFRESH_INTERVAL,
+                                 max_age: Optional[float] = None) -> threading.Thread:
+        """
+        在后台线程中立即构建名次索引，之后每interval秒重建一次
+        max_age 为索引的最长使用时间（默认两个间隔），重建连续失败超过该时间后名次返回None
+        """
+        self.rank_index_max_age = max_age if max_age is not None else interval * 2
+        self._rank_index_stop.clear()
+
+        def refresh():
+            while not self._rank_index_stop.is_set():
+                try:
+                    self.build_rank_index()
+                except Exception as e:
+                    print(f"构建名次索引失败: {e}")
+                self._rank_index_stop.wait(interval)
+
+        thread = threading.Thread(target=refresh, name='rank-index-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    def build_rank_index(self, batch_size: int = RANK_INDEX_SCAN_BATCH) -> int:
+        """
+        流式扫描UserInfo构建内存名次索引，返回索引中的用户数
+        构建完成前 get_user_positions 返回None，构建期间 update_user_rank 的更新在完成后补写
+        """
+        self._start_rank_index_build()
+        cursor = self.db["UserInfo"].find(self._leaderboard_filter(None), USER_BULK_PROJECTION)
+        index = RankIndex()
+        index.build(
+            (doc["uid"], doc["racetrack_rank_data"]["rank_score"], doc["racetrack_rank_data"].get("rank_level"))
+            for doc in cursor.batch_size(batch_size)
+        )
+        self._finish_rank_index_build(index)
+        return len(index)
+
+    def _count_positions(self, uids: List[int]) -> Dict[int, Optional[int]]:
+        """名次索引中没有的UID：先$in查询排名数据，再逐个在复合索引上计数"""
+        positions = {uid: None for uid in uids}
+        docs = self.db["UserInfo"].find({"uid": {"$in": uids}}, USER_BULK_PROJECTION)
+        ranks = {doc["uid"]: self._extract_user_rank(doc) for doc in docs if doc.get("racetrack_rank_data")}
+        for uid, rank in ranks.items():
+            if isinstance(rank["rank_score"], (int, float)):
+                positions[uid] = self.db["UserInfo"].count_documents(self._position_filter(rank, uid)) + 1
+        return positions
+
+    def get_user_positions(self, uids: List[int], count_missing: bool = False) -> Dict[int, Optional[int]]:
+        """
+        批量查询全局名次（从1开始，排序与排行榜一致），不存在或没有排名数据的用户为None
+        只从名次索引读取（O(log n) 内存查询），索引未构建或已过期时全部为None；
+        count_missing=True 时索引中没有的UID再逐个计数查询，每个UID扫描一次复合索引，不用于请求路径
+        """
+        uids = list(dict.fromkeys(uids))
+        index = self._fresh_rank_index()
+        positions = index.positions(uids) if index is not None else {uid: None for uid in uids}
+        missing = [uid for uid, position in positions.items() if position is None] if count_missing else []
+        if missing:
+            try:
+                positions.update(self._count_positions(missing))
+            except Exception as e:
+                self._handle_db_error("查询全局名次", missing[0], e)
+        return positions
+
+    def get_user_position(self, uid: int) -> Optional[int]:
+        """查询单个用户的全局名次"""
+        return self.get_user_positions([uid])[uid]
+    # ==================== 分数分布统计 ====================
+    def iter_car_lists(self, batch_size: int = STATS_SCAN_BATCH) -> Iterator[Dict[str, Any]]:
+        """以最小投影流式遍历所有用户的car_list"""
+        cursor = self.db["UserExtraInfo"].find({}, {"_id": 0, "car_garage.car_list": 1})
+        for doc in cursor.batch_size(batch_size):
+            yield self._extract_car_list(doc)
+
+    def get_population_stats(
+            self,
+            percentiles: Optional[List[float]] = None,
+            bins: Optional[int] = None,
+            cache_file: Optional[str] = None,
+            max_age: float = STATS_CACHE_MAX_AGE,
+            car_ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        统计全体用户及每个车辆ID的rank_score、season_best_rank_score和五个殿堂分的分布
+        cache_file 不为空时，文档数和参数一致且快照未超过max_age秒则直接返回缓存结果
+        car_ids 只影响返回的per_car，缓存中保存全部车辆
+        返回格式：{'success': bool, 'data': stats.compute_stats的结果及snapshot_time, 'error': ...}
+        """
+        # numpy只在统计时需要，其余命令不依赖
+        from stats import (
+            DEFAULT_BINS, DEFAULT_PERCENTILES, CarScoreColumns, compute_stats, load_cached_stats, save_cached_stats
+        )
+        percentiles = list(percentiles or DEFAULT_PERCENTILES)
+        bins = bins or DEFAULT_BINS
+        try:
+            key = {
+                "documents": self.db["UserExtraInfo"].estimated_document_count(),
+                "percentiles": percentiles,
+                "bins": bins
+            }
+            result = load_cached_stats(cache_file, key, max_age)
+            if result is None:
+                snapshot_time = time.time()
+                columns = CarScoreColumns()
+                for car_list in self.iter_car_lists():
+                    columns.add_user(car_list)
+                result = compute_stats(columns, percentiles, bins)
+                result['snapshot_time'] = snapshot_time
+                if cache_file:
+                    save_cached_stats(cache_file, key, snapshot_time, result)
+            result.pop('key', None)
+            if car_ids:
+                result['per_car'] = {car_id: result['per_car'][car_id] for car_id in car_ids if car_id in result['per_car']}
+            return {'success': True, 'data': result, 'error': None}
+        except Exception as e:
+            self._handle_db_error("统计车辆分数分布", 0, e)
+            return {'success': False, 'data': None, 'error': str(e)}
 
 
 def format_rank_list(rank_list: List[Union[Dict[str, Any], int]]) -> str:
@@ -336,6 +1824,69 @@ def parse_uids(uids_str: str = None, file_path: str = None) -> Tuple[List[int],
     return [], "无UID输入"
 
 
+
+def parse_uid_field(uids) -> Optional[List[int]]:
+    """解析HTTP请求中的uids：逗号分隔的字符串、列表或单个UID，格式错误时返回None"""
+    if isinstance(uids, int):
+        return [uids]
+    if isinstance(uids, str):
+        return [int(x.strip()) for x in uids.split(',') if x.strip().isdigit()]
+    if isinstance(uids, list):
+        return [int(x) for x in uids if isinstance(x, int) or (isinstance(x, str) and x.isdigit())]
+    return None
+
+# CSV导出的列，每辆车一行，没有车辆数据的用户输出一行
+CSV_COLUMNS = [
+    "uid", "rank_score", "rank_level", "car_id", "car_rank_score",
+    "season_best_rank_score", "palace_scores", "rank_list"
+]
+
+
+def user_to_ndjson(uid: int, user_data: Dict[str, Any]) -> str:
+    """将一个用户的查询结果转换为一行NDJSON"""
+    return json.dumps({"uid": uid, **user_data}, ensure_ascii=False) + "\n"
+
+
+def user_to_csv_rows(uid: int, user_data: Dict[str, Any]) -> List[List[Any]]:
+    """将一个用户的查询结果转换为CSV行，列表字段以JSON字符串输出"""
+    user_rank = user_data.get("user_rank") or {}
+    rank_list = user_data.get("rank_list")
+    base = [
+        uid,
+        user_rank.get("rank_score", ""),
+        user_rank.get("rank_level", ""),
+    ]
+    tail = [json.dumps(rank_list) if rank_list is not None else ""]
+    car_scores = user_data.get("car_scores") or {}
+    if not car_scores:
+        return [base + ["", "", "", ""] + tail]
+    return [
+        base + [
+            car_id,
+            scores.get("rank_score", ""),
+            scores.get("season_best_rank_score", ""),
+            json.dumps(scores.get("palace_score_list", []))
+        ] + tail
+        for car_id, scores in car_scores.items()
+    ]
+
+
+def write_users(rows: Iterator[Tuple[int, Dict[str, Any]]], fmt: str, out: TextIO) -> int:
+    """以ndjson或csv格式写出查询结果，返回写出的用户数"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(CSV_COLUMNS)
+        for uid, user_data in rows:
+            writer.writerows(user_to_csv_rows(uid, user_data))
+            count += 1
+    else:
+        for uid, user_data in rows:
+            out.write(user_to_ndjson(uid, user_data))
+            count += 1
+    return count
+
+
 def setup_arg_parser() -> argparse.ArgumentParser:
     """设置命令行参数解析器"""
     parser = argparse.ArgumentParser(description="MongoDB数据管理工具")
@@ -448,16 +1999,42 @@ def print_result(title: str, result: Any, formatter=None) -> None:
     print("=" * 50)
 
 
+def iter_query_results(args, manager, parts: Tuple[str, ...]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """按命令行参数逐个返回查询结果，UID文件分块流式读取"""
+    if args.file:
+        for _, uids, _ in iter_uid_chunks(args.file, BULK_QUERY_CHUNK_SIZE):
+            bulk_data = manager.get_users_bulk(uids, parts)
+            for uid in uids:
+                yield uid, bulk_data[uid]
+    else:
+        bulk_data = manager.get_users_bulk(args.uids, parts)
+        for uid in args.uids:
+            yield uid, bulk_data[uid]
+
+
 def handle_query(args, manager):
     """处理查询命令"""
-    for uid in args.uids:
+    parts = QUERY_PARTS if args.type == "all" else (args.type,)
+    rows = iter_query_results(args, manager, parts)
+
+    if args.format != "pretty":
+        # 机器可读格式：带缓冲写入文件或标准输出
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='', buffering=1 << 16) as out:
+                count = write_users(rows, args.format, out)
+            print(f"已导出 {count} 个用户到 {args.output}")
+        else:
+            write_users(rows, args.format, sys.stdout)
+        return
+
+    for uid, user_data in rows:
         results = {}
-        if args.type in ["user", "all"]:
-            results["用户排名"] = manager.get_user_rank(uid)
-        if args.type in ["car", "all"]:
-            results["车辆分数"] = manager.get_car_scores(uid)
-        if args.type in ["rank-list", "all"]:
-            results["比赛记录"] = manager.get_recent_rank_list(uid)
+        if "user_rank" in user_data:
+            results["用户排名"] = user_data["user_rank"]
+        if "car_scores" in user_data:
+            results["车辆分数"] = user_data["car_scores"]
+        if "rank_list" in user_data:
+            results["比赛记录"] = user_data["rank_list"]
 
         def format_car_scores(data: Dict[str, Dict[str, Any]]) -> str:
             """自定义格式化车辆分数数据"""
@@ -475,13 +2052,74 @@ def handle_query(args, manager):
 def setup_arg_parser() -> argparse.ArgumentParser:
     """设置命令行参数解析器"""
     parser = argparse.ArgumentParser(description="MongoDB数据管理工具")
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help="开启读缓存并指定最大条目数（0表示不开启）")
+    parser.add_argument("--cache-ttl", type=float, default=30.0, help="读缓存条目有效期（秒）")
+    parser.add_argument("--metrics", action="store_true", help="记录各操作耗时，结束时打印汇总表")
+    parser.add_argument("--raw-bson", action="store_true",
+                        help="以原始BSON读取car_list，车辆分数只解码用到的字段")
+    parser.add_argument("--backend", choices=list(BACKENDS),
+                        help="存储后端，默认读取环境变量MONGO_BACKEND，未设置时为mongo")
+    parser.add_argument("--memory-seed", type=int, default=0,
+                        help="memory后端启动时写入的合成用户数，用于本地调试")
     subparsers = parser.add_subparsers(dest='command', required=True)
 
     # 查询命令
     query_parser = subparsers.add_parser('query', help='查询数据')
-    query_parser.add_argument("--uids", type=int, nargs="+", required=True, help="用户ID列表")
+    query_uid_group = query_parser.add_mutually_exclusive_group(required=True)
+    query_uid_group.add_argument("--uids", type=int, nargs="+", help="用户ID列表")
+    query_uid_group.add_argument("--file", type=str, help="包含UID列表的文件路径，分块流式读取")
     query_parser.add_argument("--type", choices=["user", "car", "rank-list", "all"],
                               default="all", help="查询类型")
+    query_parser.add_argument("--format", choices=["pretty", "ndjson", "csv"], default="pretty",
+                              help="输出格式：pretty为逐个格式化打印，ndjson/csv为机器可读格式")
+    query_parser.add_argument("--output", type=str, help="ndjson/csv输出文件路径，默认输出到标准输出")
+
+    # 大批量任务命令
+    job_parser = subparsers.add_parser('job', help='流式分块执行大批量UID更新，支持并发和断点续跑')
+    job_parser.add_argument("--file", type=str, required=True, help="包含UID列表的文件路径，每行一个UID")
+    job_parser.add_argument("--action", choices=["update-list", "update-record"], required=True,
+                            help="update-list: 更新整个recent_rank_list；update-record: 更新单个记录")
+    job_parser.add_argument("--new-list", type=json.loads, help='update-list的新列表（JSON格式）')
+    job_parser.add_argument("--index", type=int, help="update-record的记录索引")
+    job_parser.add_argument("--value", type=json.loads, help='update-record的新值（JSON格式）')
+    job_parser.add_argument("--chunk-size", type=int, default=BULK_WRITE_CHUNK_SIZE, help="每块的UID数量")
+    job_parser.add_argument("--workers", type=int, default=4, help="并发处理的块数")
+    job_parser.add_argument("--checkpoint", type=str, help="断点文件路径，默认为<UID文件>.checkpoint.json")
+    job_parser.add_argument("--log", type=str, help="NDJSON日志路径，默认为<UID文件>.job.ndjson")
+    job_parser.add_argument("--restart", action="store_true", help="忽略断点文件从头开始")
+
+    # UID 规范化命令
+    normalize_parser = subparsers.add_parser('normalize-uids',
+                                             help='将UserExtraInfo中字符串类型的UID转换为整数')
+    normalize_parser.add_argument("--batch-size", type=int, default=1000, help="每批处理的文档数")
+    normalize_parser.add_argument("--checkpoint", type=str, default="normalize_uids.checkpoint.json",
+                                  help="断点文件路径，中断后重新执行会从断点继续")
+    normalize_parser.add_argument("--restart", action="store_true", help="忽略断点文件从头开始")
+
+    # 排行榜命令
+    leaderboard_parser = subparsers.add_parser('leaderboard', help='按rank_score查看排行榜')
+    leaderboard_parser.add_argument("--limit", type=int, default=50,
+                                    help=f"每页条数（最多{LEADERBOARD_MAX_LIMIT}）")
+    leaderboard_parser.add_argument("--cursor", type=str, help="上一页输出的下一页游标")
+    leaderboard_parser.add_argument("--pages", type=int, default=1, help="连续输出的页数")
+
+    # 分数分布统计命令
+    stats_parser = subparsers.add_parser('stats', help='统计全体用户及各车辆的分数分布（需要numpy）')
+    stats_parser.add_argument("--percentiles", type=float, nargs="+", help="分位数，默认 50 90 99")
+    stats_parser.add_argument("--bins", type=int, help="直方图分桶数，默认20")
+    stats_parser.add_argument("--cars", type=str, nargs="+", help="只输出指定车辆ID")
+    stats_parser.add_argument("--field", type=str, default="rank_score",
+                              help="每车汇总表展示的字段：rank_score、season_best_rank_score、palace_0..palace_4")
+    stats_parser.add_argument("--cache-file", type=str, help="统计结果缓存文件")
+    stats_parser.add_argument("--max-age", type=float, default=STATS_CACHE_MAX_AGE, help="缓存有效期（秒）")
+    stats_parser.add_argument("--output", type=str, help="完整结果写入的JSON文件")
+
+    # 全局名次命令
+    position_parser = subparsers.add_parser('position', help='查询用户的全局名次')
+    position_parser.add_argument("--uids", type=int, nargs="+", required=True, help="用户ID列表")
+    position_parser.add_argument("--build-index", action="store_true",
+                                 help="先扫描构建名次索引，查询大量UID时比逐个计数快")
 
     # 更新用户排名命令
     update_user_parser = subparsers.add_parser('update-user', help='更新用户排名和分数')
@@ -505,31 +2143,290 @@ def setup_arg_parser() -> argparse.ArgumentParser:
                                   '}')
 
     # 更新比赛记录命令
-    rank_parser = subparsers.add_parser('rank-list', help='更新比赛记录')
+    rank_parser = subparsers.add_parser('rank-list', help='比赛记录操作')
     rank_subparsers = rank_parser.add_subparsers(dest='rank_command', required=True)
 
+    get_rank = rank_subparsers.add_parser('get', help='获取单个用户的recent_rank_list')
+    get_rank.add_argument("--uid", type=int, required=True, help="用户ID")
+
+    batch_get_rank = rank_subparsers.add_parser('batch-get', help='批量获取多个用户的recent_rank_list')
+    uid_group = batch_get_rank.add_mutually_exclusive_group(required=True)
+    uid_group.add_argument("--uids", type=str, help="逗号分隔的UID列表")
+    uid_group.add_argument("--file", type=str, help="包含UID列表的文件路径")
+
     update_rank_list = rank_subparsers.add_parser('update-list', help='更新整个recent_rank_list')
     update_rank_list.add_argument("--uid", type=int, required=True, help="用户ID")
     update_rank_list.add_argument("--new-list", type=json.loads, required=True,
                                   help='新的列表内容（JSON格式），如 "[{\\"rank\\":1}, 2]"')
 
     batch_update_rank_list = rank_subparsers.add_parser('batch-update-list', help='批量更新多个用户的整个recent_rank_list')
-    batch_update_rank_list.add_argument("--uids", type=str, required=True, help="逗号分隔的UID列表")
+    batch_uid_group = batch_update_rank_list.add_mutually_exclusive_group(required=True)
+    batch_uid_group.add_argument("--uids", type=str, help="逗号分隔的UID列表")
+    batch_uid_group.add_argument("--file", type=str, help="包含UID列表的文件路径")
     batch_update_rank_list.add_argument("--new-list", type=json.loads, required=True, help='新的列表内容（JSON格式）')
+    batch_update_rank_list.add_argument("--chunk-size", type=int, default=BULK_WRITE_CHUNK_SIZE,
+                                        help="每次bulk_write包含的UID数量")
+
+    update_record = rank_subparsers.add_parser('update-record', help='更新单个记录')
+    update_record.add_argument("--uid", type=int, required=True, help="用户ID")
+    update_record.add_argument("--index", type=int, required=True, help="记录索引（从0开始）")
+    update_record.add_argument("--value", type=json.loads, required=True,
+                               help='新值（JSON格式），如 "{\\"rank\\":1}" 或 2')
+
+    batch_update_record = rank_subparsers.add_parser('batch-update-record', help='批量更新多个用户的单个记录')
+    batch_record_uid_group = batch_update_record.add_mutually_exclusive_group(required=True)
+    batch_record_uid_group.add_argument("--uids", type=str, help="逗号分隔的UID列表")
+    batch_record_uid_group.add_argument("--file", type=str, help="包含UID列表的文件路径")
+    batch_update_record.add_argument("--index", type=int, required=True, help="记录索引")
+    batch_update_record.add_argument("--value", type=json.loads, required=True, help='新值（JSON格式）')
+    batch_update_record.add_argument("--chunk-size", type=int, default=BULK_WRITE_CHUNK_SIZE,
+                                     help="每次bulk_write包含的UID数量")
+
+    # 组合更新命令
+    combo_parser = subparsers.add_parser('combo-update', help='批量组合更新车辆分数和比赛记录')
+    combo_uid_group = combo_parser.add_mutually_exclusive_group(required=True)
+    combo_uid_group.add_argument("--uids", type=str, help="逗号分隔的UID列表")
+    combo_uid_group.add_argument("--file", type=str, help="包含UID列表的文件路径")
+    combo_parser.add_argument("--car-id", type=str, required=True, help="车辆ID")
+    combo_parser.add_argument("--rank-score", type=int, required=True, help="新的rank_score")
+    combo_parser.add_argument("--season-score", type=int, required=True, help="新的season_best_rank_score")
+    combo_parser.add_argument("--rank-list", type=json.loads, required=True,
+                              help='新的比赛记录列表（JSON格式），如 "[1,1,3,4,1]"')
+    combo_parser.add_argument("--chunk-size", type=int, default=BULK_WRITE_CHUNK_SIZE,
+                              help="每次bulk_write包含的UID数量")
 
     return parser
-def main():
-    parser = setup_arg_parser()
-    args = parser.parse_args()
+def handle_normalize_uids(args, manager):
+    """处理UID规范化命令：分批转换字符串UID，记录断点，完成后写入规范化标记"""
+    state = {"last_id": None, "scanned": 0, "converted": 0, "skipped": [], "errors": 0}
+    if not args.restart and os.path.exists(args.checkpoint):
+        with open(args.checkpoint, 'r') as f:
+            state = json_util.loads(f.read())
+        print(f"从断点继续: 已扫描 {state['scanned']}，已转换 {state['converted']}")
+
+    remaining = manager.count_string_uids()
+    print(f"待转换的字符串UID: {remaining}")
+
+    while True:
+        batch = manager.normalize_uid_batch(state["last_id"], args.batch_size)
+        if not batch["scanned"]:
+            break
+        state["last_id"] = batch["last_id"]
+        state["scanned"] += batch["scanned"]
+        state["converted"] += batch["converted"]
+        state["skipped"].extend(batch["skipped"])
+        state["errors"] += batch["errors"]
+        with open(args.checkpoint, 'w') as f:
+            f.write(json_util.dumps(state))
+        print(f"进度: 已扫描 {state['scanned']}/{remaining}，已转换 {state['converted']}，"
+              f"跳过 {len(state['skipped'])}，失败 {state['errors']}")
+
+    left = manager.count_string_uids()
+    if left == 0:
+        manager.mark_uid_normalized()
+        if os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+        print("UID规范化完成，已写入规范化标记")
+    else:
+        print(f"仍有 {left} 个字符串UID未转换，未写入规范化标记")
+
+    print_result("UID规范化结果", {
+        '扫描': state['scanned'],
+        '转换': state['converted'],
+        '跳过': state['skipped'],
+        '失败': state['errors']
+    })
+
+
+def handle_leaderboard(args, manager):
+    """处理排行榜命令：逐页打印名次、UID、rank_score和rank_level"""
+    cursor = args.cursor
+    print(f"{'名次':>8}{'UID':>14}{'rank_score':>12}{'rank_level':>12}")
+    for _ in range(args.pages):
+        result = manager.get_leaderboard(args.limit, cursor)
+        if not result['success']:
+            print(f"查询排行榜失败: {result['error']}")
+            return
+        for entry in result['data']['entries']:
+            print(f"{entry['rank']:>8}{entry['uid']:>14}{entry['rank_score']:>12}{entry['rank_level']:>12}")
+        cursor = result['data']['next']
+        if not cursor:
+            break
+    if cursor:
+        print(f"下一页游标: {cursor}")
+
+
+def handle_stats(args, manager):
+    """处理分数分布统计命令：打印全体汇总和每车汇总表，完整结果可写入JSON"""
+    result = manager.get_population_stats(
+        args.percentiles, args.bins, args.cache_file, args.max_age, args.cars
+    )
+    if not result['success']:
+        print(f"统计失败: {result['error']}")
+        return
+    data = result['data']
+    pct_keys = [f"p{pct:g}" for pct in data['percentiles']]
+    header = f"{'':<24}{'数量':>10}{'均值':>10}{'最小':>10}" + "".join(f"{key:>10}" for key in pct_keys) + f"{'最大':>10}"
+
+    def row(name, stats):
+        cells = [stats['count'], stats['mean'], stats['min']] + [stats[key] for key in pct_keys] + [stats['max']]
+        return f"{name:<24}" + "".join(f"{'-' if cell is None else cell:>10}" for cell in cells)
+
+    print(f"用户数: {data['users']}，车辆行数: {data['cars']}，"
+          f"快照时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(data['snapshot_time']))}")
+    print("\n===== 全体车辆 =====")
+    print(header)
+    for field, stats in data['overall'].items():
+        print(row(field, stats))
+    print(f"\n===== 各车辆 {args.field} =====")
+    print(header)
+    for car_id, fields in data['per_car'].items():
+        print(row(car_id, fields[args.field]))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        print(f"完整结果已写入 {args.output}")
+
+
+# 大批量任务的操作及其必需参数（命令行 job 子命令和 HTTP /jobs 接口共用）
+JOB_ACTIONS = {
+    'update-list': ('new_list',),
+    'update-record': ('index', 'value'),
+    'update-cars': ('updates',),
+}
+
+
+def job_chunk_processor(
+        manager: MongoDBManager,
+        action: str,
+        params: Dict[str, Any]
+) -> Callable[[List[int]], Dict[int, Dict[str, Any]]]:
+    """
+    返回处理一个UID块的函数，供 run_chunked_job 调用
+    update-list: 将每个用户的比赛记录替换为 new_list
+    update-record: 将每个用户第 index 条比赛记录改为 value
+    update-cars: 对每个用户执行相同的车辆更新 updates（格式同 batch_update_cars_for_user）
+    参数缺失或操作未知时抛出ValueError
+    """
+    if action not in JOB_ACTIONS:
+        raise ValueError(f"未知的任务操作: {action}，可选: {', '.join(JOB_ACTIONS)}")
+    missing = [name for name in JOB_ACTIONS[action] if params.get(name) is None]
+    if missing:
+        raise ValueError(f"{action} 缺少参数: {', '.join(missing)}")
+
+    if action == 'update-list':
+        def process_chunk(uids):
+            return manager.batch_update_recent_rank_list(uids, params['new_list'], len(uids))
+    elif action == 'update-record':
+        index = int(params['index'])
+
+        def process_chunk(uids):
+            return manager.batch_update_single_record(uids, index, params['value'], len(uids))
+    else:
+        def process_chunk(uids):
+            return {uid: manager.batch_update_cars_for_user(uid, params['updates']) for uid in uids}
+    return process_chunk
+
 
-    manager = MongoDBManager()
+def handle_job(args, manager):
+    """处理大批量任务命令：流式分块、线程池并发执行、断点续跑，进度和失败记录写入NDJSON日志"""
+    if args.action == 'update-list':
+        params = {'new_list': args.new_list}
+    else:
+        params = {'index': args.index, 'value': args.value}
     try:
-        if not manager.connect():
+        process_chunk = job_chunk_processor(manager, args.action, params)
+    except ValueError as e:
+        print(e)
+        return
+
+    checkpoint = JobCheckpoint(
+        args.checkpoint or f"{args.file}.checkpoint.json",
+        {'file': file_signature(args.file), 'action': args.action,
+         'chunk_size': args.chunk_size, 'params': params},
+        restart=args.restart
+    )
+    if checkpoint.done:
+        print(f"从断点继续: 已完成 {len(checkpoint.done)} 块")
+    log_path = args.log or f"{args.file}.job.ndjson"
+    log = NDJSONLog(log_path)
+
+    def on_progress(summary):
+        print(f"进度: 已完成 {summary['chunks']} 块 / {summary['uids']} 个UID，"
+              f"失败 {summary['failed']}，速率 {summary['uids_per_sec']} UIDs/s")
+
+    try:
+        summary = run_chunked_job(
+            iter_uid_chunks(args.file, args.chunk_size),
+            process_chunk,
+            workers=args.workers,
+            checkpoint=checkpoint,
+            log=log,
+            on_progress=on_progress
+        )
+    finally:
+        log.close()
+    checkpoint.remove()
+
+    print_result("任务完成", {
+        '处理块数': summary['chunks'],
+        '跳过块数': summary['skipped_chunks'],
+        'UID数': summary['uids'],
+        '成功': summary['success'],
+        '失败': summary['failed'],
+        '无效行': summary['invalid_lines'],
+        '耗时(秒)': summary['elapsed'],
+        '速率(UIDs/s)': summary['uids_per_sec'],
+        '日志': log_path
+    })
+
+
+def main(argv: Optional[List[str]] = None, manager: Optional[MongoDBManager] = None):
+    """
+    argv: 命令行参数，默认读取sys.argv
+    manager: 已连接的管理器（如基准测试中的内存库），传入时不再连接和关闭
+    """
+    parser = setup_arg_parser()
+    args = parser.parse_args(argv)
+
+    owns_manager = manager is None
+    if owns_manager:
+        manager = MongoDBManager(client_factory=get_client_factory(args.backend))
+    if args.cache_size > 0:
+        manager.enable_cache(args.cache_size, args.cache_ttl)
+    if args.raw_bson:
+        manager.enable_raw_bson()
+    if args.metrics:
+        instrument_manager(manager, MetricsRegistry())
+    try:
+        if owns_manager and not manager.connect():
             return
+        if args.memory_seed > 0 and isinstance(manager.client, MemoryClient):
+            from benchmarks.population import seed_population
+            seed_population(manager.db, args.memory_seed)
 
         if args.command == 'query':
             handle_query(args, manager)
 
+        elif args.command == 'job':
+            handle_job(args, manager)
+
+        elif args.command == 'normalize-uids':
+            handle_normalize_uids(args, manager)
+
+        elif args.command == 'leaderboard':
+            handle_leaderboard(args, manager)
+
+        elif args.command == 'stats':
+            handle_stats(args, manager)
+
+        elif args.command == 'position':
+            if args.build_index:
+                print(f"名次索引已构建: {manager.build_rank_index()} 个用户")
+            positions = manager.get_user_positions(args.uids, count_missing=True)
+            print_result("全局名次", {uid: positions[uid] or "不存在或无排名数据" for uid in args.uids})
+
         elif args.command == 'update-user':
             result = manager.update_user_rank(args.uid, args.score, args.level)
             print_result("更新用户排名", result or "更新失败或数据未改变")
@@ -555,32 +2452,23 @@ def main():
             elif args.rank_command == 'batch-get':
                 uids, source = parse_uids(getattr(args, 'uids'), getattr(args, 'file'))
                 print(f"UID来源: {source}")
+                bulk_data = manager.get_users_bulk(uids, ("rank-list",))
                 for uid in uids:
-                    result = manager.get_recent_rank_list(uid)
+                    result = bulk_data[uid]["rank_list"]
                     print_result(f"UID {uid} 比赛记录",
                                  format_rank_list(result) if result else "获取失败")
         if args.command == 'rank-list':
-            if args.rank_command == 'batch-update-list':
-                uids = [int(uid.strip()) for uid in args.uids.split(',')]
-                new_list = args.new_list
-
-                results = {}
-                for uid in uids:
-                    result = manager.update_recent_rank_list(uid, new_list)
-                    results[uid] = result
-
-                print_result("批量更新比赛记录", results)
-            elif args.rank_command == 'update-list':
+            if args.rank_command == 'update-list':
                 result = manager.update_recent_rank_list(args.uid, args.new_list)
                 print_result("更新比赛记录", result)
 
             elif args.rank_command == 'batch-update-list':
                 uids, source = parse_uids(getattr(args, 'uids'), getattr(args, 'file'))
                 print(f"UID来源: {source}")
-                results = manager.batch_update_recent_rank_list(uids, args.new_list)
+                results = manager.batch_update_recent_rank_list(uids, args.new_list, args.chunk_size)
                 success_count = sum(1 for r in results.values() if r['success'])
                 print_result("批量更新比赛记录", {
-                    '总计': f"{success_count}/{len(uids)}",
+                    '总计': f"{success_count}/{len(results)}",
                     '详情': results
                 })
 
@@ -591,60 +2479,28 @@ def main():
             elif args.rank_command == 'batch-update-record':
                 uids, source = parse_uids(getattr(args, 'uids'), getattr(args, 'file'))
                 print(f"UID来源: {source}")
-                results = manager.batch_update_single_record(uids, args.index, args.value)
+                results = manager.batch_update_single_record(uids, args.index, args.value, args.chunk_size)
                 success_count = sum(1 for r in results.values() if r['success'])
                 print_result("批量更新比赛记录项", {
-                    '总计': f"{success_count}/{len(uids)}",
+                    '总计': f"{success_count}/{len(results)}",
                     '详情': results
                 })
 
         elif args.command == 'combo-update':
-            uids, source = parse_uids(args.uids)
+            uids, source = parse_uids(args.uids, args.file)
             print(f"\n===== 开始组合更新 =====")
-            print(f"UID列表: {uids}")
+            print(f"UID来源: {source}")
+            print(f"UID数量: {len(uids)}")
             print(f"车辆ID: {args.car_id}")
             print(f"Rank Score: {args.rank_score}")
             print(f"Season Score: {args.season_score}")
             print(f"Rank List: {args.rank_list}")
             print("=" * 50)
 
-            results = {}
-            for uid in uids:
-                print(f"\n处理 UID {uid}:")
-
-                # 初始化操作列表
-                operations = []
-                update_success = True
-
-                # 检查是否需要更新车辆分数
-                if args.car_id and args.rank_score is not None and args.season_score is not None:
-                    print("1. 正在更新车辆分数...")
-                    car_result = manager.update_car_scores(
-                        uid, args.car_id, args.rank_score, args.season_score
-                    )
-                    operations.append(('车辆', car_result))
-                    update_success = update_success and car_result.get('success', False)
-                    if car_result.get('success'):
-                        print(f"  成功! 更新后数据: {car_result['data']}")
-                    else:
-                        print(f"  失败! 原因: {car_result.get('error', '未知错误')}")
-                else:
-                    print("1. 跳过车辆分数更新（参数不全）")
-
-                # 总是更新比赛记录
-                print("2. 正在更新比赛记录...")
-                rank_result = manager.update_recent_rank_list(uid, args.rank_list)
-                operations.append(('比赛记录', rank_result))
-                update_success = update_success and rank_result.get('success', False)
-                if rank_result.get('success'):
-                    print(f"  成功! 更新后记录: {rank_result['data']}")
-                else:
-                    print(f"  失败! 原因: {rank_result.get('error', '未知错误')}")
-
-                results[uid] = {
-                    'operations': operations,
-                    'success': update_success
-                }
+            # 每批一次查询和一次bulk_write
+            results = manager.combo_update_bulk(
+                uids, args.car_id, args.rank_score, args.season_score, args.rank_list, args.chunk_size
+            )
 
             success_count = sum(1 for r in results.values() if r['success'])
             print("\n===== 组合更新结果汇总 =====")
@@ -657,9 +2513,9 @@ def main():
                 for uid, result in results.items():
                     if not result['success']:
                         print(f"UID {uid}:")
-                        for op_name, op_result in result['operations']:
-                            if not op_result.get('success'):
-                                print(f"  {op_name}更新失败: {op_result.get('error')}")
+                        for op_name, key in (('车辆', 'car'), ('比赛记录', 'rank_list')):
+                            if not result[key]['success']:
+                                print(f"  {op_name}更新失败: {result[key]['error']}")
 
             print("\n===== 组合更新完成 =====")
 
@@ -700,7 +2556,13 @@ def main():
 
                 print("\n===== 更新完成 =====")
     finally:
-        manager.close()
+        if manager.cache:
+            print_result("缓存统计", manager.cache_stats())
+        if args.metrics:
+            print("\n===== 操作耗时统计 =====")
+            print(manager.metrics.format_table())
+        if owns_manager:
+            manager.close()
 
 
 if __name__ == "__main__":
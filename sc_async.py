@@ -0,0 +1,761 @@
+import asyncio
+import time
+from typing import Optional, Dict, Any, List, Union, Tuple, Callable, AsyncIterator
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from cache import MISSING, AsyncSingleFlight
+from rank_index import RankIndex
+from sc import (
+    BaseMongoDBManager, DB_NAME, QUERY_PARTS, BULK_QUERY_CHUNK_SIZE, BULK_WRITE_CHUNK_SIZE,
+    EXTRA_INFO_FIELDS, EXTRA_RESULT_KEYS, META_COLLECTION, UID_NORMALIZED_KEY, USER_BULK_PROJECTION,
+    LEADERBOARD_SORT, LEADERBOARD_INDEX_NAME, LEADERBOARD_SNAPSHOT_SIZE, LEADERBOARD_SNAPSHOT_TTL,
+    LEADERBOARD_MAX_LIMIT, RANK_INDEX_SCAN_BATCH, RANK_INDEX_REFRESH_INTERVAL, STATS_SCAN_BATCH, STATS_CACHE_MAX_AGE
+)
+
+
+class AsyncMongoDBManager(BaseMongoDBManager):
+    """
+    MongoDBManager 的 asyncio 版本，所有数据库操作均为协程
+    文档解析、缓存和结果组装逻辑来自 BaseMongoDBManager；
+    写回队列、UID规范化和后台线程刷新名次索引只在同步版中提供
+    """
+
+    def __init__(
+            self,
+            uid_normalized: Optional[bool] = None,
+            uri: Optional[str] = None,
+            client_factory: Callable[..., Any] = AsyncIOMotorClient,
+            max_pool_size: Optional[int] = None
+    ):
+        """
+        client_factory: 创建异步客户端的函数，默认使用motor；
+                        测试时可传入内存实现（如 mongomock_motor.AsyncMongoMockClient）
+        """
+        super().__init__(uid_normalized, uri, client_factory, max_pool_size)
+        self.single_flight = AsyncSingleFlight()
+
+    async def connect(self) -> bool:
+        """连接 MongoDB 数据库，并读取UID规范化标记"""
+        try:
+            self.client = self.client_factory(self.uri, **self._client_options())
+            self.db = self.client[DB_NAME]
+        except Exception as e:
+            print(f"连接失败: {e}")
+            return False
+
+        # 异步版本无法在构造查询条件时读取标记，连接时读取一次
+        if self.uid_normalized is None:
+            try:
+                meta = await self.db[META_COLLECTION].find_one({"_id": UID_NORMALIZED_KEY})
+                self.uid_normalized = bool(meta and meta.get("value"))
+            except Exception as e:
+                print(f"读取UID规范化标记失败: {e}")
+        return True
+
+    async def health(self) -> Dict[str, Any]:
+        """健康检查，与同步版一致"""
+        result = self._health_info()
+        if self.db is None:
+            result['error'] = '未连接'
+            return result
+        start = time.perf_counter()
+        try:
+            await self.db[META_COLLECTION].find_one({"_id": UID_NORMALIZED_KEY})
+            result['ok'] = True
+        except Exception as e:
+            result['error'] = str(e)
+        result['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+    async def _set_if_changed(
+            self,
+            collection: str,
+            conditions: List[Dict],
+            fields: Dict[str, Any],
+            projection: Dict[str, int]
+    ) -> Optional[Dict]:
+        """一次往返执行$set并返回更新后的文档，数据未改变时返回None"""
+        changed = {"$or": [{field: {"$ne": value}} for field, value in fields.items()]}
+        return await self.db[collection].find_one_and_update(
+            {"$and": conditions + [changed]},
+            {"$set": fields},
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+
+    # ==================== UserInfo 集合操作 ====================
+    async def get_user_rank(self, uid: int) -> Optional[Dict[str, Any]]:
+        """查询用户排名数据"""
+        cached = self._cache_get("user", uid)
+        if cached is not MISSING:
+            return cached
+        generation = self.generations.get(("user", uid))
+        try:
+            data = await self.single_flight.do(("UserInfo", uid), lambda: self.db["UserInfo"].find_one(
+                {"uid": uid},
+                {"_id": 0, "racetrack_rank_data.rank_score": 1, "racetrack_rank_data.rank_level": 1}
+            ), generation)
+            result = self._extract_user_rank(data)
+        except Exception as e:
+            self._handle_db_error("查询UserInfo", uid, e)
+            return None
+        self._cache_set("user", uid, result, generation)
+        return result
+
+    async def update_user_rank(self, uid: int, score: int, level: int) -> Optional[Dict[str, Any]]:
+        """更新用户排名数据"""
+        try:
+            data = await self._set_if_changed(
+                "UserInfo",
+                [{"uid": uid}],
+                {
+                    "racetrack_rank_data.rank_score": score,
+                    "racetrack_rank_data.rank_level": level
+                },
+                {"_id": 0, "racetrack_rank_data.rank_score": 1, "racetrack_rank_data.rank_level": 1}
+            )
+            self._invalidate("user", uid)
+            rank = self._extract_user_rank(data)
+            if rank:
+                self._update_rank_index(uid, rank)
+            return rank
+        except Exception as e:
+            self._handle_db_error("更新UserInfo", uid, e)
+            self._invalidate("user", uid)
+            return None
+
+    # ==================== UserExtraInfo 集合操作 ====================
+    async def get_extra_info(self, uid: int, parts: Tuple[str, ...] = ("car", "rank-list")) -> Dict[str, Any]:
+        """一次查询同时获取car_list和recent_rank_list"""
+        parts = tuple(part for part in EXTRA_INFO_FIELDS if part in parts)
+        values = {}
+        for part in parts:
+            cached = self._cache_get(part, uid)
+            if cached is not MISSING:
+                values[part] = cached
+
+        missing = tuple(part for part in parts if part not in values)
+        if missing:
+            generations = self._read_generations(missing, [uid])
+            try:
+                data = await self.single_flight.do(
+                    ("UserExtraInfo", uid, missing),
+                    lambda: self._extra_info_collection(missing).find_one(
+                        self._get_user_filter(uid),
+                        self._get_extra_projection(missing)
+                    ),
+                    self.generations.stamp(generations)
+                )
+            except Exception as e:
+                self._handle_db_error("查询UserExtraInfo", uid, e)
+                for part in missing:
+                    values[part] = {} if part == "car" else None
+            else:
+                for part in missing:
+                    values[part] = self._extract_extra_part(part, data)
+                    self._cache_set(part, uid, values[part], generations[(part, uid)])
+
+        return {EXTRA_RESULT_KEYS[part]: values[part] for part in parts}
+
+    async def get_car_list(self, uid: int) -> Dict[str, Any]:
+        """获取用户的car_list数据"""
+        return (await self.get_extra_info(uid, ("car",)))["car_list"]
+
+    async def get_car_scores(self, uid: int) -> Dict[str, Dict[str, Any]]:
+        """获取所有车辆的分数信息"""
+        return self._build_car_scores(await self.get_car_list(uid))
+
+    async def batch_update_cars_for_user(
+            self,
+            uid: int,
+            car_updates: Dict[str, Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """批量更新车辆分数和宫殿分数，参数格式与同步版一致"""
+        plan = self._plan_car_updates(uid, car_updates)
+        if plan['error']:
+            return {'success': False, 'error': plan['error']}
+
+        try:
+            data = await self._set_if_changed(
+                "UserExtraInfo", plan['conditions'], plan['fields'], plan['projection']
+            )
+            if data is None:
+                self._invalidate("car", uid)
+                error, retry_fields = self._check_car_fallback(
+                    await self.get_car_list(uid), car_updates, plan['fields']
+                )
+                if error:
+                    return {'success': False, 'error': error}
+                if retry_fields:
+                    data = await self._set_if_changed(
+                        "UserExtraInfo", plan['car_conditions'], retry_fields, plan['projection']
+                    )
+            self._invalidate("car", uid)
+            return self._car_update_result(data, car_updates)
+        except Exception as e:
+            self._handle_db_error("批量更新用户车辆", uid, e)
+            self._invalidate("car", uid)
+            return {'success': False, 'error': str(e)}
+
+    async def update_car_scores(
+            self,
+            uid: int,
+            car_id: str,
+            rank_score: int,
+            season_best_rank_score: int
+    ) -> Dict[str, Any]:
+        """更新指定车辆的分数"""
+        prefix = f"car_garage.car_list.{car_id}"
+        try:
+            data = await self._set_if_changed(
+                "UserExtraInfo",
+                [self._get_user_filter(uid), {prefix: {"$exists": True}}],
+                {
+                    f"{prefix}.rank_score": rank_score,
+                    f"{prefix}.season_best_rank_score": season_best_rank_score
+                },
+                {"_id": 0, f"{prefix}.rank_score": 1, f"{prefix}.season_best_rank_score": 1}
+            )
+            self._invalidate("car", uid)
+
+            if data:
+                car_data = self._extract_car_list(data)[car_id]
+                return {
+                    'success': True,
+                    'data': {
+                        car_id: {
+                            'rank_score': car_data.get('rank_score'),
+                            'season_best_rank_score': car_data.get('season_best_rank_score')
+                        }
+                    }
+                }
+            if car_id not in await self.get_car_list(uid):
+                return {'success': False, 'error': f'车辆 {car_id} 不存在'}
+            return {'success': False, 'error': '数据未改变'}
+        except Exception as e:
+            self._handle_db_error("更新车辆分数", uid, e)
+            self._invalidate("car", uid)
+            return {'success': False, 'error': str(e)}
+
+    # ==================== recent_rank_list 操作 ====================
+    async def get_recent_rank_list(self, uid: int) -> Optional[List[Union[Dict[str, Any], int]]]:
+        """获取用户的最近比赛排名列表"""
+        return (await self.get_extra_info(uid, ("rank-list",)))["rank_list"]
+
+    async def get_car_scores_and_rank_list(self, uid: int) -> Dict[str, Any]:
+        """一次查询同时获取车辆分数和比赛记录"""
+        extra = await self.get_extra_info(uid)
+        return {
+            "car_scores": self._build_car_scores(extra["car_list"]),
+            "rank_list": extra["rank_list"]
+        }
+
+    async def update_recent_rank_list(
+            self,
+            uid: int,
+            new_list: List[Union[Dict[str, Any], int]]
+    ) -> Dict[str, Any]:
+        """更新整个比赛排名列表"""
+        try:
+            result = await self.db["UserExtraInfo"].update_one(
+                self._get_user_filter(uid),
+                {"$set": {"racetrack_match_data.recent_rank_list": new_list}}
+            )
+            self._invalidate("rank-list", uid)
+            return {
+                'success': result.modified_count == 1,
+                'data': new_list,
+                'error': None if result.modified_count == 1 else '数据未改变'
+            }
+        except Exception as e:
+            self._handle_db_error("更新比赛记录", uid, e)
+            self._invalidate("rank-list", uid)
+            return {'success': False, 'error': str(e)}
+
+    async def _fetch_rank_lists(self, uids: List[int]) -> Dict[int, List[Union[Dict[str, Any], int]]]:
+        """一次$in查询获取多个用户当前的recent_rank_list"""
+        rank_lists = {}
+        async for doc in self.db["UserExtraInfo"].find(
+                self._get_users_filter(uids),
+                {"_id": 0, "uid": 1, "racetrack_match_data.recent_rank_list": 1}
+        ):
+            rank_lists.setdefault(int(doc["uid"]), self._extract_recent_rank_list(doc))
+        return rank_lists
+
+    async def _bulk_write_rank_lists(self, updates: Dict[int, Tuple[Dict, Dict]]) -> Dict[int, str]:
+        """以一次无序bulk_write执行多个用户的更新，返回写入失败的 {uid: 错误信息}"""
+        uids = list(updates)
+        operations = [
+            UpdateOne({**self._get_user_filter(uid), **updates[uid][0]}, {"$set": updates[uid][1]})
+            for uid in uids
+        ]
+        try:
+            await self.db["UserExtraInfo"].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return {uids[err["index"]]: err.get("errmsg", str(e)) for err in e.details.get("writeErrors", [])}
+        finally:
+            for uid in uids:
+                self._invalidate("rank-list", uid)
+        return {}
+
+    async def _update_rank_list_chunk(
+            self,
+            chunk: List[int],
+            new_list: List[Union[Dict[str, Any], int]]
+    ) -> Dict[int, Dict[str, Any]]:
+        """更新一批用户的比赛排名列表"""
+        try:
+            current = await self._fetch_rank_lists(chunk)
+            updates = self._plan_rank_list_updates(chunk, current, new_list)
+            failed = await self._bulk_write_rank_lists(updates) if updates else {}
+        except Exception as e:
+            self._handle_db_error("批量更新比赛记录", chunk[0], e)
+            return self._chunk_error_results(chunk, e)
+        return self._rank_list_results(chunk, current, updates, failed, new_list)
+
+    async def batch_update_recent_rank_list(
+            self,
+            uids: List[int],
+            new_list: List[Union[Dict[str, Any], int]],
+            chunk_size: int = BULK_WRITE_CHUNK_SIZE
+    ) -> Dict[int, Dict[str, Any]]:
+        """批量更新多个用户的比赛排名列表，各批并发执行"""
+        uids = list(dict.fromkeys(uids))
+        chunk_results = await asyncio.gather(*[
+            self._update_rank_list_chunk(uids[start:start + chunk_size], new_list)
+            for start in range(0, len(uids), chunk_size)
+        ])
+        results = {}
+        for chunk_result in chunk_results:
+            results.update(chunk_result)
+        return results
+
+    async def update_single_record(
+            self,
+            uid: int,
+            index: int,
+            new_value: Union[Dict[str, Any], int]
+    ) -> Dict[str, Any]:
+        """按位置更新单个比赛记录，一次往返完成"""
+        field = f"racetrack_match_data.recent_rank_list.{index}"
+        try:
+            data = None
+            if index >= 0:
+                data = await self.db["UserExtraInfo"].find_one_and_update(
+                    {**self._get_user_filter(uid), field: {"$exists": True, "$ne": new_value}},
+                    {"$set": {field: new_value}},
+                    projection={"_id": 0, "racetrack_match_data.recent_rank_list": 1},
+                    return_document=ReturnDocument.AFTER
+                )
+            self._invalidate("rank-list", uid)
+            if data:
+                return {
+                    'success': True,
+                    'data': self._extract_recent_rank_list(data),
+                    'error': None
+                }
+
+            current_list = await self.get_recent_rank_list(uid) or []
+            if not 0 <= index < len(current_list):
+                return {
+                    'success': False,
+                    'error': f'索引 {index} 超出范围（0-{len(current_list) - 1}）'
+                }
+            return {'success': False, 'data': current_list, 'error': '数据未改变'}
+        except Exception as e:
+            self._handle_db_error("更新比赛记录项", uid, e)
+            self._invalidate("rank-list", uid)
+            return {'success': False, 'error': str(e)}
+
+    async def _update_record_chunk(
+            self,
+            chunk: List[int],
+            index: int,
+            new_value: Union[Dict[str, Any], int]
+    ) -> Dict[int, Dict[str, Any]]:
+        """更新一批用户的单个比赛记录"""
+        try:
+            current = await self._fetch_rank_lists(chunk)
+            updates = self._plan_record_updates(chunk, current, index, new_value)
+            failed = await self._bulk_write_rank_lists(updates) if updates else {}
+        except Exception as e:
+            self._handle_db_error("批量更新比赛记录项", chunk[0], e)
+            return self._chunk_error_results(chunk, e)
+        return self._record_results(chunk, current, updates, failed, index, new_value)
+
+    async def batch_update_single_record(
+            self,
+            uids: List[int],
+            index: int,
+            new_value: Union[Dict[str, Any], int],
+            chunk_size: int = BULK_WRITE_CHUNK_SIZE
+    ) -> Dict[int, Dict[str, Any]]:
+        """批量更新多个用户的单个比赛记录，各批并发执行"""
+        uids = list(dict.fromkeys(uids))
+        chunk_results = await asyncio.gather(*[
+            self._update_record_chunk(uids[start:start + chunk_size], index, new_value)
+            for start in range(0, len(uids), chunk_size)
+        ])
+        results = {}
+        for chunk_result in chunk_results:
+            results.update(chunk_result)
+        return results
+
+    # ==================== 组合更新 ====================
+    async def _fetch_combo_state(self, uids: List[int], car_id: str) -> Dict[int, Tuple[Optional[Dict], List]]:
+        """一次$in查询获取指定车辆的分数和recent_rank_list，返回格式与同步版一致"""
+        prefix = f"car_garage.car_list.{car_id}"
+        state = {}
+        async for doc in self.db["UserExtraInfo"].find(
+                self._get_users_filter(uids),
+                {
+                    "_id": 0, "uid": 1,
+                    f"{prefix}.rank_score": 1,
+                    f"{prefix}.season_best_rank_score": 1,
+                    "racetrack_match_data.recent_rank_list": 1
+                }
+        ):
+            state.setdefault(int(doc["uid"]), (
+                self._extract_car_list(doc).get(car_id),
+                self._extract_recent_rank_list(doc)
+            ))
+        return state
+
+    async def _bulk_write_extra(
+            self,
+            keys: List[Tuple[int, str]],
+            operations: List[UpdateOne]
+    ) -> Dict[Tuple[int, str], str]:
+        """以一次无序bulk_write执行UserExtraInfo上的多个更新，返回写入失败的 {key: 错误信息}"""
+        try:
+            await self.db["UserExtraInfo"].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return {keys[err["index"]]: err.get("errmsg", str(e)) for err in e.details.get("writeErrors", [])}
+        finally:
+            for uid, part in keys:
+                self._invalidate(part, uid)
+        return {}
+
+    async def _combo_update_chunk(
+            self,
+            chunk: List[int],
+            car_id: str,
+            car_fields: Dict[str, Any],
+            rank_list: List[Union[Dict[str, Any], int]]
+    ) -> Dict[int, Dict[str, Any]]:
+        """组合更新一批用户"""
+        try:
+            current = await self._fetch_combo_state(chunk, car_id)
+            keys, operations = self._plan_combo_updates(chunk, current, car_id, car_fields, rank_list)
+            failed = await self._bulk_write_extra(keys, operations) if operations else {}
+        except Exception as e:
+            self._handle_db_error("批量组合更新", chunk[0], e)
+            error = self._chunk_error_results(chunk, e)
+            return {uid: {'success': False, 'car': error[uid], 'rank_list': error[uid]} for uid in chunk}
+        rank_score, season_best_rank_score = car_fields.values()
+        return self._combo_results(
+            chunk, current, set(keys), failed, car_id, rank_score, season_best_rank_score, rank_list
+        )
+
+    async def combo_update_bulk(
+            self,
+            uids: List[int],
+            car_id: str,
+            rank_score: int,
+            season_best_rank_score: int,
+            rank_list: List[Union[Dict[str, Any], int]],
+            chunk_size: int = BULK_WRITE_CHUNK_SIZE
+    ) -> Dict[int, Dict[str, Any]]:
+        """批量更新多个用户的指定车辆分数和整个recent_rank_list，返回格式与同步版一致，各批并发执行"""
+        uids = list(dict.fromkeys(uids))
+        car_fields = {
+            f"car_garage.car_list.{car_id}.rank_score": rank_score,
+            f"car_garage.car_list.{car_id}.season_best_rank_score": season_best_rank_score
+        }
+        chunk_results = await asyncio.gather(*[
+            self._combo_update_chunk(uids[start:start + chunk_size], car_id, car_fields, rank_list)
+            for start in range(0, len(uids), chunk_size)
+        ])
+        results = {}
+        for chunk_result in chunk_results:
+            results.update(chunk_result)
+        return results
+
+    # ==================== UID 规范化 ====================
+    async def count_string_uids(self) -> int:
+        """统计UserExtraInfo中仍为字符串类型的UID数量"""
+        return await self.db["UserExtraInfo"].count_documents({"uid": {"$type": "string"}})
+
+    async def mark_uid_normalized(self, value: bool = True) -> None:
+        """写入UID规范化标记"""
+        await self.db[META_COLLECTION].update_one(
+            {"_id": UID_NORMALIZED_KEY},
+            {"$set": {"value": value}},
+            upsert=True
+        )
+        self.uid_normalized = value
+
+    # ==================== 批量查询 ====================
+    async def _load_user_chunk(self, values: Dict[int, Dict[str, Any]], missing: List[int]) -> None:
+        """查询一批UserInfo文档"""
+        generations = self._read_generations(("user",), missing)
+        try:
+            docs = await self.single_flight.do(
+                ("UserInfo", tuple(sorted(missing))),
+                lambda: self.db["UserInfo"].find({"uid": {"$in": missing}}, USER_BULK_PROJECTION).to_list(length=None),
+                self.generations.stamp(generations)
+            )
+        except Exception as e:
+            self._handle_db_error("批量查询UserInfo", missing[0], e)
+            self._fill_failed_values(values, missing, ("user",))
+        else:
+            self._store_user_docs(values, missing, docs, generations)
+
+    async def _load_extra_chunk(
+            self,
+            values: Dict[int, Dict[str, Any]],
+            missing: List[int],
+            parts: Tuple[str, ...]
+    ) -> None:
+        """查询一批UserExtraInfo文档"""
+        generations = self._read_generations(parts, missing)
+        try:
+            docs = await self.single_flight.do(
+                ("UserExtraInfo", tuple(sorted(missing)), parts),
+                lambda: self._extra_info_collection(parts).find(
+                    self._get_users_filter(missing),
+                    {**self._get_extra_projection(parts), "uid": 1}
+                ).to_list(length=None),
+                self.generations.stamp(generations)
+            )
+        except Exception as e:
+            self._handle_db_error("批量查询UserExtraInfo", missing[0], e)
+            self._fill_failed_values(values, missing, parts)
+        else:
+            self._store_extra_docs(values, missing, parts, docs, generations)
+
+    async def get_users_bulk(
+            self,
+            uids: List[int],
+            parts: Tuple[str, ...] = QUERY_PARTS
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        批量查询多个用户的数据，返回格式与同步版一致
+        每批UID对UserInfo和UserExtraInfo的查询以及各批之间均通过asyncio.gather并发执行
+        """
+        uids = list(dict.fromkeys(uids))
+        parts = tuple(part for part in QUERY_PARTS if part in parts)
+        user_parts = tuple(part for part in parts if part == "user")
+        extra_parts = tuple(part for part in parts if part in EXTRA_INFO_FIELDS)
+        values = self._cached_values(uids, parts)
+
+        tasks = []
+        for start in range(0, len(uids), BULK_QUERY_CHUNK_SIZE):
+            chunk = uids[start:start + BULK_QUERY_CHUNK_SIZE]
+            missing = self._missing_uids(values, chunk, user_parts)
+            if missing:
+                tasks.append(self._load_user_chunk(values, missing))
+            missing = self._missing_uids(values, chunk, extra_parts)
+            if missing:
+                tasks.append(self._load_extra_chunk(values, missing, extra_parts))
+        await asyncio.gather(*tasks)
+
+        return self._assemble_bulk_results(uids, parts, values)
+
+    async def iter_users(
+            self,
+            parts: Tuple[str, ...] = QUERY_PARTS,
+            batch_size: int = BULK_QUERY_CHUNK_SIZE
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """以服务端游标遍历全部用户，逐个返回 (uid, 数据)，与同步版一致：async for uid, data in manager.iter_users()"""
+        parts = tuple(part for part in QUERY_PARTS if part in parts)
+        extra_parts = tuple(part for part in parts if part in EXTRA_INFO_FIELDS)
+        extra_projection = {**self._get_extra_projection(extra_parts), "uid": 1}
+        if "user" in parts:
+            cursor = self.db["UserInfo"].find({}, USER_BULK_PROJECTION)
+        else:
+            cursor = self._extra_info_collection(extra_parts).find({}, extra_projection)
+
+        batch = []
+        async for doc in cursor.batch_size(batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                for item in await self._export_batch(batch, parts, extra_parts, extra_projection):
+                    yield item
+                batch = []
+        if batch:
+            for item in await self._export_batch(batch, parts, extra_parts, extra_projection):
+                yield item
+
+    async def _export_batch(
+            self,
+            docs: List[Dict],
+            parts: Tuple[str, ...],
+            extra_parts: Tuple[str, ...],
+            extra_projection: Dict[str, int]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """组装一批主游标文档，需要时补查另一个集合"""
+        values = self._export_values(docs, parts, extra_parts)
+        uids = list(values)
+        if "user" in parts and extra_parts and uids:
+            extra_docs = {}
+            try:
+                async for doc in self._extra_info_collection(extra_parts).find(
+                        self._get_users_filter(uids), extra_projection
+                ):
+                    extra_docs.setdefault(int(doc["uid"]), doc)
+            except Exception as e:
+                self._handle_db_error("批量查询UserExtraInfo", uids[0], e)
+                self._fill_failed_values(values, uids, extra_parts)
+            else:
+                for uid in uids:
+                    for part in extra_parts:
+                        values[uid][part] = self._extract_extra_part(part, extra_docs.get(uid))
+        return list(self._assemble_bulk_results(uids, parts, values).items())
+
+    # ==================== 排行榜 ====================
+    async def ensure_leaderboard_index(self) -> None:
+        """确保UserInfo上存在排行榜复合索引"""
+        if not self._leaderboard_index_ready:
+            await self.db["UserInfo"].create_index(LEADERBOARD_SORT, name=LEADERBOARD_INDEX_NAME)
+            self._leaderboard_index_ready = True
+
+    async def _get_leaderboard_snapshot(self) -> List[Dict[str, Any]]:
+        """排行榜前若干名的快照，单线程事件循环中不需要加锁"""
+        entries = self._fresh_snapshot()
+        if entries is None:
+            await self.ensure_leaderboard_index()
+            docs = await (
+                self.db["UserInfo"].find(self._leaderboard_filter(None), USER_BULK_PROJECTION)
+                .sort(LEADERBOARD_SORT)
+                .limit(LEADERBOARD_SNAPSHOT_SIZE)
+            ).to_list(length=None)
+            entries = self._leaderboard_entries(docs, 0)
+            self._leaderboard_snapshot = (time.monotonic() + LEADERBOARD_SNAPSHOT_TTL, entries)
+        return entries
+
+    async def get_leaderboard(self, limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """按rank_score（相同时按rank_level）降序返回排行榜，返回格式与同步版一致"""
+        limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+        try:
+            after, start_rank = self.decode_leaderboard_cursor(cursor)
+        except ValueError as e:
+            return {'success': False, 'data': None, 'error': str(e)}
+        try:
+            entries = self._page_from_snapshot(await self._get_leaderboard_snapshot(), after, limit)
+            if entries is None:
+                docs = await (
+                    self.db["UserInfo"].find(self._leaderboard_filter(after), USER_BULK_PROJECTION)
+                    .sort(LEADERBOARD_SORT)
+                    .limit(limit)
+                ).to_list(length=None)
+                entries = self._leaderboard_entries(docs, start_rank)
+            return self._leaderboard_result(entries, limit)
+        except Exception as e:
+            self._handle_db_error("查询排行榜", 0, e)
+            return {'success': False, 'data': None, 'error': str(e)}
+
+    # ==================== 全局名次 ====================
+    async def build_rank_index(self, batch_size: int = RANK_INDEX_SCAN_BATCH) -> int:
+        """流式扫描UserInfo构建内存名次索引，返回索引中的用户数"""
+        self._start_rank_index_build()
+        entries = []
+        cursor = self.db["UserInfo"].find(self._leaderboard_filter(None), USER_BULK_PROJECTION)
+        async for doc in cursor.batch_size(batch_size):
+            rank = doc["racetrack_rank_data"]
+            entries.append((doc["uid"], rank["rank_score"], rank.get("rank_level")))
+        index = RankIndex()
+        index.build(entries)
+        self._finish_rank_index_build(index)
+        return len(index)
+
+    async def refresh_rank_index(self, interval: float = RANK_INDEX_REFRESH_INTERVAL,
+                                 max_age: Optional[float] = None) -> None:
+        """立即构建名次索引，之后每interval秒重建一次，作为后台任务运行直到 close()；max_age 与同步版一致"""
+        self.rank_index_max_age = max_age if max_age is not None else interval * 2
+        self._rank_index_stop.clear()
+        while not self._rank_index_stop.is_set():
+            try:
+                await self.build_rank_index()
+            except Exception as e:
+                print(f"构建名次索引失败: {e}")
+            await asyncio.sleep(interval)
+
+    async def _count_positions(self, uids: List[int]) -> Dict[int, Optional[int]]:
+        """名次索引中没有的UID：先$in查询排名数据，再并发计数"""
+        positions = {uid: None for uid in uids}
+        docs = await self.db["UserInfo"].find({"uid": {"$in": uids}}, USER_BULK_PROJECTION).to_list(length=None)
+        ranks = {doc["uid"]: self._extract_user_rank(doc) for doc in docs if doc.get("racetrack_rank_data")}
+        ranks = {uid: rank for uid, rank in ranks.items() if isinstance(rank["rank_score"], (int, float))}
+        counts = await asyncio.gather(*(
+            self.db["UserInfo"].count_documents(self._position_filter(rank, uid)) for uid, rank in ranks.items()
+        ))
+        for uid, count in zip(ranks, counts):
+            positions[uid] = count + 1
+        return positions
+
+    async def get_user_positions(self, uids: List[int], count_missing: bool = False) -> Dict[int, Optional[int]]:
+        """批量查询全局名次，返回格式与同步版一致；默认只从名次索引读取，count_missing=True 时计数补充"""
+        uids = list(dict.fromkeys(uids))
+        index = self._fresh_rank_index()
+        positions = index.positions(uids) if index is not None else {uid: None for uid in uids}
+        missing = [uid for uid, position in positions.items() if position is None] if count_missing else []
+        if missing:
+            try:
+                positions.update(await self._count_positions(missing))
+            except Exception as e:
+                self._handle_db_error("查询全局名次", missing[0], e)
+        return positions
+
+    async def get_user_position(self, uid: int) -> Optional[int]:
+        """查询单个用户的全局名次"""
+        return (await self.get_user_positions([uid]))[uid]
+
+    # ==================== 分数分布统计 ====================
+    async def iter_car_lists(self, batch_size: int = STATS_SCAN_BATCH) -> AsyncIterator[Dict[str, Any]]:
+        """以最小投影流式遍历所有用户的car_list"""
+        cursor = self.db["UserExtraInfo"].find({}, {"_id": 0, "car_garage.car_list": 1})
+        async for doc in cursor.batch_size(batch_size):
+            yield self._extract_car_list(doc)
+
+    async def get_population_stats(
+            self,
+            percentiles: Optional[List[float]] = None,
+            bins: Optional[int] = None,
+            cache_file: Optional[str] = None,
+            max_age: float = STATS_CACHE_MAX_AGE,
+            car_ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """统计车辆分数分布，参数和返回格式与同步版一致；分位数计算在线程池中执行，不阻塞事件循环"""
+        from stats import (
+            DEFAULT_BINS, DEFAULT_PERCENTILES, CarScoreColumns, compute_stats, load_cached_stats, save_cached_stats
+        )
+        percentiles = list(percentiles or DEFAULT_PERCENTILES)
+        bins = bins or DEFAULT_BINS
+        loop = asyncio.get_running_loop()
+        try:
+            key = {
+                "documents": await self.db["UserExtraInfo"].estimated_document_count(),
+                "percentiles": percentiles,
+                "bins": bins
+            }
+            result = load_cached_stats(cache_file, key, max_age)
+            if result is None:
+                snapshot_time = time.time()
+                columns = CarScoreColumns()
+                async for car_list in self.iter_car_lists():
+                    columns.add_user(car_list)
+                result = await loop.run_in_executor(None, compute_stats, columns, percentiles, bins)
+                result['snapshot_time'] = snapshot_time
+                if cache_file:
+                    save_cached_stats(cache_file, key, snapshot_time, result)
+            result.pop('key', None)
+            if car_ids:
+                result['per_car'] = {car_id: result['per_car'][car_id] for car_id in car_ids if car_id in result['per_car']}
+            return {'success': True, 'data': result, 'error': None}
+        except Exception as e:
+            self._handle_db_error("统计车辆分数分布", 0, e)
+            return {'success': False, 'data': None, 'error': str(e)}
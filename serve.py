@@ -0,0 +1,203 @@
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict
+
+# 多进程生产入口：主进程只监听端口，不创建数据库客户端；fork出的工作进程各自懒加载管理器
+#   python serve.py --workers 4 --threads 8 --bind 0.0.0.0:5001 --max-pool-size 20
+# 安装了gunicorn时默认使用gunicorn（gthread），否则使用内置的预fork服务器（werkzeug多线程服务器）
+
+
+class ProcessLocal:
+    """
+    按进程懒加载的对象代理：当前进程首次访问属性时调用factory创建对象，
+    fork出的子进程不会复用父进程创建的对象（如不能跨fork使用的pymongo客户端）
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._pid = None
+        self._instance = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            # fork时父进程可能正持有锁，子进程使用新的锁
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._instance = self._factory()
+                    self._pid = pid
+        return self._instance
+
+    def created(self) -> bool:
+        """当前进程是否已创建对象"""
+        return self._pid == os.getpid()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+def parse_bind(bind: str) -> tuple:
+    host, _, port = bind.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+def init_worker(*args) -> None:
+    """工作进程启动后立即创建后台任务执行器，继续执行重启前未完成的任务，不等到第一个任务请求"""
+    from app import job_runner
+    job_runner.get()
+
+
+def close_manager(*args) -> None:
+    """工作进程退出前关闭本进程的管理器：写入写回队列中剩余的更新并关闭连接池"""
+    from app import manager
+    if manager.created():
+        manager.close()
+
+
+# ==================== gunicorn ====================
+def run_gunicorn(args) -> None:
+    from gunicorn.app.base import BaseApplication
+    from app import app
+
+    class Application(BaseApplication):
+        def __init__(self, options: Dict[str, Any]):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Application({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'graceful_timeout': args.timeout,
+        # 主进程预加载应用，app导入时不连接数据库，fork后各工作进程再创建客户端
+        'preload_app': True,
+        'post_worker_init': init_worker,
+        'worker_exit': close_manager,
+    }).run()
+
+
+# ==================== 内置预fork服务器 ====================
+def _serve_worker(sock: socket.socket, host: str, port: int) -> None:
+    """工作进程：在继承的监听套接字上运行多线程WSGI服务器，收到SIGTERM后停止并正常退出"""
+    from werkzeug.serving import make_server
+    from app import app
+
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    init_worker()
+    server.serve_forever()
+
+
+def run_prefork(args) -> None:
+    host, port = parse_bind(args.bind)
+    sock = socket.create_server((host, port), backlog=2048)
+    sock.set_inheritable(True)
+    # 主进程预先导入应用，工作进程fork后无需重复导入
+    import app  # noqa: F401
+
+    workers: Dict[int, float] = {}
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                _serve_worker(sock, host, port)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                close_manager()
+                os._exit(status)
+        workers[pid] = time.time()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        spawn()
+    print(f"预fork服务器已启动: http://{host}:{port}，{args.workers} 个工作进程")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        # 工作进程异常退出时重新启动；启动后立即退出的不再重试，避免循环fork
+        if time.time() - started < 1:
+            print(f"工作进程 {pid} 启动失败(状态 {status})")
+            continue
+        print(f"工作进程 {pid} 已退出(状态 {status})，重新启动")
+        spawn()
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程运行 app.py")
+    parser.add_argument("--bind", default="0.0.0.0:5001", help="监听地址")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument("--threads", type=int, default=8, help="每个工作进程的线程数（仅gunicorn）")
+    parser.add_argument("--max-pool-size", type=int, help="每个工作进程的MongoDB连接池上限")
+    parser.add_argument("--timeout", type=int, default=30, help="请求超时和优雅退出时间（秒，仅gunicorn）")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "prefork"], default="auto",
+                        help="auto：安装了gunicorn时使用gunicorn，否则使用内置预fork服务器")
+    args = parser.parse_args()
+
+    if args.max_pool_size:
+        # 管理器在工作进程中创建时读取
+        os.environ["MONGO_MAX_POOL_SIZE"] = str(args.max_pool_size)
+
+    server = args.server
+    if server == "auto":
+        try:
+            import gunicorn  # noqa: F401
+            server = "gunicorn"
+        except ImportError:
+            server = "prefork"
+    if server == "gunicorn":
+        run_gunicorn(args)
+    else:
+        run_prefork(args)
+
+
+if __name__ == '__main__':
+    main()
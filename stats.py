@@ -0,0 +1,189 @@
+import json
+import os
+import time
+from array import array
+from typing import Optional, Dict, Any, Tuple, Iterable
+
+import numpy as np
+
+# 车辆分数分布统计：流式读取 car_list 写入列式数组，再用 NumPy 按车辆ID分组向量化计算
+# 统计字段：rank_score、season_best_rank_score 和 palace_score_list 的五个位置
+PALACE_SLOTS = 5
+STAT_FIELDS = ("rank_score", "season_best_rank_score") + tuple(f"palace_{i}" for i in range(PALACE_SLOTS))
+DEFAULT_PERCENTILES = (50, 90, 99)
+DEFAULT_BINS = 20
+
+
+class CarScoreColumns:
+    """
+    按行追加车辆分数的列式缓冲区，每辆车一行
+    车辆ID映射为整数下标，缺失或非数字的分数记为NaN
+    """
+
+    def __init__(self):
+        self.car_ids: Dict[str, int] = {}
+        self.car_index = array('i')
+        self.columns = {field: array('d') for field in STAT_FIELDS}
+        self.users = 0
+
+    def add_user(self, car_list: Dict[str, Any]) -> None:
+        self.users += 1
+        for car_id, car in car_list.items():
+            if not isinstance(car, dict):
+                continue
+            self.car_index.append(self.car_ids.setdefault(car_id, len(self.car_ids)))
+            self.columns["rank_score"].append(_number(car.get("rank_score")))
+            self.columns["season_best_rank_score"].append(_number(car.get("season_best_rank_score")))
+            palace = car.get("palace_score_list") or []
+            for i in range(PALACE_SLOTS):
+                entry = palace[i] if i < len(palace) else None
+                self.columns[f"palace_{i}"].append(_number(entry.get("score") if isinstance(entry, dict) else None))
+
+    def arrays(self) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """返回 (车辆下标数组, {字段: 分数数组})，不复制缓冲区"""
+        index = np.frombuffer(self.car_index, dtype=np.int32) if len(self.car_index) else np.zeros(0, np.int32)
+        columns = {
+            field: np.frombuffer(values, dtype=np.float64) if len(values) else np.zeros(0)
+            for field, values in self.columns.items()
+        }
+        return index, columns
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return float("nan")
+
+
+def group_stats(
+        groups: np.ndarray,
+        values: np.ndarray,
+        n_groups: int,
+        percentiles: Iterable[float],
+        edges: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    按分组向量化计算计数、均值、最小最大值、分位数（线性插值，与np.percentile一致）和直方图
+    返回的每个数组第一维为分组下标，没有数据的分组为NaN
+    """
+    mask = ~np.isnan(values)
+    groups, values = groups[mask], values[mask]
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    has_data = counts > 0
+    last = np.maximum(counts - 1, 0)
+
+    def pick(offsets: np.ndarray) -> np.ndarray:
+        picked = values[np.minimum(starts + offsets, max(len(values) - 1, 0))] if len(values) else np.zeros(n_groups)
+        return np.where(has_data, picked, np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = {
+            'count': counts,
+            'mean': np.where(has_data, np.bincount(groups, weights=values, minlength=n_groups) / counts, np.nan),
+            'min': pick(np.zeros(n_groups, dtype=np.int64)),
+            'max': pick(last),
+        }
+    for pct in percentiles:
+        position = last * (pct / 100.0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        fraction = position - lower
+        result[f'p{pct:g}'] = pick(lower) * (1 - fraction) + pick(upper) * fraction
+
+    bins = len(edges) - 1
+    bin_index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, bins - 1)
+    result['histogram'] = np.bincount(groups * bins + bin_index, minlength=n_groups * bins).reshape(n_groups, bins)
+    return result
+
+
+def _histogram_edges(values: np.ndarray, bins: int) -> np.ndarray:
+    """全体数据共用的直方图分桶边界，便于不同车辆之间比较"""
+    finite = values[~np.isnan(values)]
+    if not len(finite):
+        return np.linspace(0.0, 1.0, bins + 1)
+    low, high = float(finite.min()), float(finite.max())
+    if low == high:
+        high = low + 1
+    return np.linspace(low, high, bins + 1)
+
+
+def _to_json(stats: Dict[str, np.ndarray], index: int) -> Dict[str, Any]:
+    """取出一个分组的统计结果，NaN转换为None"""
+    row = {}
+    for key, values in stats.items():
+        value = values[index]
+        if key == 'histogram':
+            row[key] = value.tolist()
+        elif key == 'count':
+            row[key] = int(value)
+        else:
+            row[key] = None if np.isnan(value) else round(float(value), 2)
+    return row
+
+
+def compute_stats(
+        columns: CarScoreColumns,
+        percentiles: Iterable[float] = DEFAULT_PERCENTILES,
+        bins: int = DEFAULT_BINS
+) -> Dict[str, Any]:
+    """
+    计算全体车辆和每个车辆ID的分数分布
+    返回格式：
+        {
+            "users": 用户数, "cars": 车辆行数, "percentiles": [...],
+            "bins": {字段: 分桶边界},
+            "overall": {字段: {count, mean, min, max, p50..., histogram}},
+            "per_car": {car_id: {字段: {...}}}
+        }
+    """
+    percentiles = list(percentiles)
+    car_index, values = columns.arrays()
+    n_cars = len(columns.car_ids)
+    car_names = sorted(columns.car_ids, key=columns.car_ids.get)
+    everyone = np.zeros(len(car_index), dtype=np.int32)
+
+    result = {
+        'users': columns.users,
+        'cars': int(len(car_index)),
+        'percentiles': percentiles,
+        'bins': {},
+        'overall': {},
+        'per_car': {car_id: {} for car_id in car_names},
+    }
+    for field in STAT_FIELDS:
+        edges = _histogram_edges(values[field], bins)
+        result['bins'][field] = [round(float(edge), 2) for edge in edges]
+        result['overall'][field] = _to_json(group_stats(everyone, values[field], 1, percentiles, edges), 0)
+        per_car = group_stats(car_index, values[field], n_cars, percentiles, edges)
+        for i, car_id in enumerate(car_names):
+            result['per_car'][car_id][field] = _to_json(per_car, i)
+    return result
+
+
+def load_cached_stats(path: str, key: Dict[str, Any], max_age: float) -> Optional[Dict[str, Any]]:
+    """
+    读取缓存的统计结果
+    缓存键（文档数、分位数、分桶数）一致且快照时间未超过max_age秒时返回结果，否则返回None
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('key') != key or time.time() - cached.get('snapshot_time', 0) > max_age:
+        return None
+    return cached
+
+
+def save_cached_stats(path: str, key: Dict[str, Any], snapshot_time: float, result: Dict[str, Any]) -> None:
+    """写入统计结果缓存，先写临时文件再替换"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'key': key, 'snapshot_time': snapshot_time, **result}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
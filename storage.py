@@ -0,0 +1,705 @@
+import os
+import threading
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterator
+
+from bson import ObjectId
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+# 存储后端：MongoDBManager 通过 client_factory 创建客户端，后端只需实现管理器用到的 pymongo 接口子集：
+#   client[db][collection] 上的 find(...).sort/limit/batch_size、find_one、find_one_and_update、
+#   update_one、bulk_write(UpdateOne)、insert_one/insert_many、delete_many、count_documents、create_index
+# "mongo" 为 pymongo/motor，"memory" 为进程内存引擎，通过环境变量 MONGO_BACKEND 或命令行 --backend 选择
+
+DEFAULT_BACKEND = "mongo"
+
+# 按数据类型匹配 $type，只覆盖管理器用到的类型名
+_TYPE_NAMES = {
+    "string": (str,),
+    "int": (int,),
+    "long": (int,),
+    "double": (float,),
+    "number": (int, float),
+    "bool": (bool,),
+    "object": (dict,),
+    "array": (list,),
+    "null": (type(None),),
+}
+
+_MISSING = object()
+
+
+# ==================== 文档工具函数 ====================
+def _get_path(doc: Any, path: str) -> Any:
+    """按点分路径读取字段，数字段可访问数组元素，不存在时返回_MISSING"""
+    value = doc
+    for key in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(key, _MISSING)
+        elif isinstance(value, list) and key.isdigit():
+            index = int(key)
+            value = value[index] if index < len(value) else _MISSING
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _set_path(doc: Dict, path: str, value: Any) -> None:
+    """按点分路径写入字段，自动创建中间文档；数组按下标写入，越界时以None补齐"""
+    keys = path.split(".")
+    target = doc
+    for i, key in enumerate(keys):
+        last = i == len(keys) - 1
+        if isinstance(target, list):
+            if not key.isdigit():
+                raise ValueError(f"无法在数组上设置字段 '{key}'（路径 {path}）")
+            index = int(key)
+            while len(target) <= index:
+                target.append(None)
+            if last:
+                target[index] = value
+            else:
+                if target[index] is None:
+                    target[index] = {}
+                target = target[index]
+        elif isinstance(target, dict):
+            if last:
+                target[key] = value
+            else:
+                if not isinstance(target.get(key), (dict, list)):
+                    target[key] = {}
+                target = target[key]
+        else:
+            raise ValueError(f"无法在非文档字段上设置 '{key}'（路径 {path}）")
+
+
+def _values_equal(value: Any, expected: Any) -> bool:
+    """等值比较：数组字段与标量比较时匹配任一元素，布尔与整数不视为相等"""
+    if isinstance(value, list) and not isinstance(expected, list):
+        return any(_values_equal(item, expected) for item in value)
+    if isinstance(value, bool) != isinstance(expected, bool):
+        return False
+    return value == expected
+
+
+def _hash_key(value: Any) -> Tuple[bool, Any]:
+    """$in 集合的键，区分布尔和整数"""
+    return isinstance(value, bool), value
+
+
+def _compare(value: Any, expected: Any, op: str) -> bool:
+    """$gt/$gte/$lt/$lte 比较，类型不可比较时视为不匹配"""
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > expected
+        if op == "$gte":
+            return value >= expected
+        if op == "$lt":
+            return value < expected
+        return value <= expected
+    except TypeError:
+        return False
+
+
+def _compile_in(expected: List[Any]) -> Callable[[Any], bool]:
+    """$in 的值全部可哈希时转换为集合查找，否则逐个比较"""
+    try:
+        keys = {_hash_key(item) for item in expected}
+    except TypeError:
+        return lambda value: value is not _MISSING and any(_values_equal(value, item) for item in expected)
+
+    def match(value: Any) -> bool:
+        if value is _MISSING:
+            return False
+        if isinstance(value, list):
+            return any(match(item) for item in value)
+        try:
+            return _hash_key(value) in keys
+        except TypeError:
+            return False
+    return match
+
+
+def _compile_operator(op: str, expected: Any) -> Callable[[Any], bool]:
+    """将单个查询操作符编译为判断函数"""
+    if op == "$eq":
+        return lambda value: value is not _MISSING and _values_equal(value, expected)
+    if op == "$ne":
+        return lambda value: value is _MISSING or not _values_equal(value, expected)
+    if op == "$in":
+        return _compile_in(expected)
+    if op == "$nin":
+        matches = _compile_in(expected)
+        return lambda value: not matches(value)
+    if op == "$exists":
+        return lambda value: (value is not _MISSING) == bool(expected)
+    if op == "$type":
+        types = _TYPE_NAMES.get(expected, ())
+        return lambda value: value is not _MISSING and isinstance(value, types) and not (
+            isinstance(value, bool) and bool not in types)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return lambda value: _compare(value, expected, op)
+    raise ValueError(f"内存引擎不支持的查询操作符: {op}")
+
+
+def _compile_condition(path: str, condition: Any) -> Callable[[Dict], bool]:
+    """编译单个字段的条件，condition 为操作符文档或等值"""
+    if not (isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition)):
+        return lambda doc: _match_value(_get_path(doc, path), condition)
+    checks = [_compile_operator(op, expected) for op, expected in condition.items()]
+    if len(checks) == 1:
+        check = checks[0]
+        return lambda doc: check(_get_path(doc, path))
+
+    def match(doc: Dict) -> bool:
+        value = _get_path(doc, path)
+        return all(check(value) for check in checks)
+    return match
+
+
+def _match_value(value: Any, expected: Any) -> bool:
+    return value is not _MISSING and _values_equal(value, expected)
+
+
+def compile_filter(query: Optional[Dict]) -> Callable[[Dict], bool]:
+    """将查询条件编译为判断函数，每次查询只解析一次条件"""
+    checks = []
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            subs = [compile_filter(sub) for sub in condition]
+            checks.append(lambda doc, subs=subs: all(sub(doc) for sub in subs))
+        elif key == "$or":
+            subs = [compile_filter(sub) for sub in condition]
+            checks.append(lambda doc, subs=subs: any(sub(doc) for sub in subs))
+        else:
+            checks.append(_compile_condition(key, condition))
+    if not checks:
+        return lambda doc: True
+    if len(checks) == 1:
+        return checks[0]
+    return lambda doc: all(check(doc) for check in checks)
+
+
+def match_filter(doc: Dict, query: Optional[Dict]) -> bool:
+    """判断文档是否满足查询条件"""
+    return compile_filter(query)(doc)
+
+
+def clone(value: Any) -> Any:
+    """复制文档，只递归复制dict和list，其余BSON类型均不可变，比copy.deepcopy快得多"""
+    if isinstance(value, dict):
+        return {k: clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone(v) for v in value]
+    return value
+
+
+def apply_projection(doc: Dict, projection: Optional[Dict]) -> Dict:
+    """按包含式投影返回文档副本，只有 {"_id": 0} 时返回去掉_id的完整文档"""
+    if not projection:
+        return clone(doc)
+    include_id = projection.get("_id", 1)
+    fields = [path for path, flag in projection.items() if path != "_id" and flag]
+    if not fields:
+        result = {k: clone(v) for k, v in doc.items() if k != "_id"}
+    else:
+        result = {}
+        for path in fields:
+            value = _get_path(doc, path)
+            if value is not _MISSING:
+                _set_path(result, path, clone(value))
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    return result
+
+
+def _delete_path(doc: Dict, path: str) -> None:
+    """删除点分路径上的字段，用于更新失败时回滚新增的字段"""
+    parent_path, _, key = path.rpartition(".")
+    parent = _get_path(doc, parent_path) if parent_path else doc
+    if isinstance(parent, dict):
+        parent.pop(key, None)
+
+
+def _same_value(old: Any, new: Any) -> bool:
+    """$set前后值是否相同，类型不同（如 1 与 True）视为改变"""
+    return old is not _MISSING and type(old) is type(new) and old == new
+
+
+def apply_update(doc: Dict, update: Dict) -> bool:
+    """
+    原地执行更新文档，只支持$set，返回文档是否发生变化
+    只写入值有变化的字段；任一路径写入失败时回滚已写入的字段，保证单文档更新的原子性
+    """
+    changes = []
+    for op, fields in update.items():
+        if op != "$set":
+            raise ValueError(f"内存引擎不支持的更新操作符: {op}")
+        for path, value in fields.items():
+            old = _get_path(doc, path)
+            if not _same_value(old, value):
+                changes.append((path, old, value))
+
+    applied = []
+    try:
+        for path, old, value in changes:
+            _set_path(doc, path, clone(value))
+            applied.append((path, old))
+    except Exception:
+        for path, old in reversed(applied):
+            if old is _MISSING:
+                _delete_path(doc, path)
+            else:
+                _set_path(doc, path, old)
+        raise
+    return bool(changes)
+
+
+def _upsert_document(query: Dict) -> Dict:
+    """upsert时由查询条件中的等值字段构造新文档"""
+    doc = {}
+    for key, condition in query.items():
+        if key.startswith("$") or (isinstance(condition, dict) and any(k.startswith("$") for k in condition)):
+            continue
+        _set_path(doc, key, clone(condition))
+    return doc
+
+
+# ==================== 结果对象 ====================
+class MemoryUpdateResult:
+    """与 pymongo.results.UpdateResult 一致的字段"""
+
+    def __init__(self, matched_count: int, modified_count: int, upserted_id: Any = None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class MemoryBulkWriteResult:
+    """与 pymongo.results.BulkWriteResult 一致的字段"""
+
+    def __init__(self, details: Dict[str, Any]):
+        self.bulk_api_result = details
+        self.matched_count = details["nMatched"]
+        self.modified_count = details["nModified"]
+        self.upserted_count = details["nUpserted"]
+        self.inserted_count = 0
+        self.deleted_count = 0
+        self.acknowledged = True
+
+
+class MemoryInsertResult:
+    def __init__(self, inserted_ids: List[Any]):
+        self.inserted_ids = inserted_ids
+        self.inserted_id = inserted_ids[0] if inserted_ids else None
+        self.acknowledged = True
+
+
+# ==================== 内存引擎 ====================
+class MemoryCursor:
+    """
+    查询结果游标，支持 sort/limit/batch_size 链式调用
+    与MongoDB一致按完整文档排序，迭代时才对limit后的文档应用投影；lock 为所属集合的锁
+    """
+
+    def __init__(self, docs: List[Dict], projection: Optional[Dict] = None, lock=None):
+        self._docs = docs
+        self._projection = projection
+        self._lock = lock or threading.RLock()
+
+    def sort(self, key, direction: int = 1) -> "MemoryCursor":
+        keys = key if isinstance(key, list) else [(key, direction)]
+        with self._lock:
+            # 多键排序：从最后一个键开始依次稳定排序
+            for field, order in reversed(keys):
+                self._docs.sort(key=lambda d: _sort_key(_get_path(d, field)), reverse=order < 0)
+        return self
+
+    def limit(self, n: int) -> "MemoryCursor":
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    def batch_size(self, n: int) -> "MemoryCursor":
+        return self
+
+    def __iter__(self) -> Iterator[Dict]:
+        with self._lock:
+            docs = [apply_projection(doc, self._projection) for doc in self._docs]
+        return iter(docs)
+
+
+def _sort_key(value: Any) -> Tuple:
+    """不存在和None排在最前，数字排在字符串之前，与MongoDB的类型顺序一致"""
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, ObjectId):
+        return (3, value)
+    return (4, str(value))
+
+
+class MemoryCollection:
+    """
+    以_id为主键存放文档，并维护 uid 字段的哈希索引
+    uid 的等值、$in 和 {"$or": [{"uid": ...}]} 条件直接查索引，其余条件全表扫描
+    """
+
+    INDEX_FIELD = "uid"
+
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: Dict[Any, Dict] = {}
+        self._index: Dict[Any, Dict[Any, None]] = {}
+        self._lock = threading.RLock()
+
+    # ---------- 索引 ----------
+    def _index_add(self, doc: Dict) -> None:
+        uid = doc.get(self.INDEX_FIELD, _MISSING)
+        if uid is not _MISSING:
+            self._index.setdefault(uid, {})[doc["_id"]] = None
+
+    def _index_remove(self, doc: Dict) -> None:
+        uid = doc.get(self.INDEX_FIELD, _MISSING)
+        ids = self._index.get(uid) if uid is not _MISSING else None
+        if ids is not None:
+            ids.pop(doc["_id"], None)
+            if not ids:
+                del self._index[uid]
+
+    def _lookup(self, values: List[Any]) -> List[Dict]:
+        ids = {}
+        for value in values:
+            ids.update(self._index.get(value, {}))
+        return [self._docs[_id] for _id in ids]
+
+    def _candidates(self, query: Optional[Dict]) -> List[Dict]:
+        """根据查询条件缩小候选文档范围"""
+        query = query or {}
+        if "_id" in query and not isinstance(query["_id"], dict):
+            doc = self._docs.get(query["_id"])
+            return [doc] if doc else []
+
+        condition = query.get(self.INDEX_FIELD, _MISSING)
+        if condition is not _MISSING:
+            if not isinstance(condition, dict):
+                return self._lookup([condition])
+            if set(condition) == {"$in"}:
+                return self._lookup(condition["$in"])
+
+        branches = query.get("$or")
+        if branches and all(set(branch) == {self.INDEX_FIELD} for branch in branches):
+            values = [branch[self.INDEX_FIELD] for branch in branches]
+            if not any(isinstance(value, dict) for value in values):
+                return self._lookup(values)
+
+        for sub in query.get("$and", []):
+            candidates = self._candidates(sub)
+            if len(candidates) < len(self._docs):
+                return candidates
+        return list(self._docs.values())
+
+    def _matching(self, query: Optional[Dict]) -> Iterator[Dict]:
+        match = compile_filter(query)
+        for doc in self._candidates(query):
+            if match(doc):
+                yield doc
+
+    # ---------- 读操作 ----------
+    def find(self, filter: Optional[Dict] = None, projection: Optional[Dict] = None, **kwargs) -> MemoryCursor:
+        with self._lock:
+            return MemoryCursor(list(self._matching(filter)), projection, self._lock)
+
+    def find_one(self, filter: Optional[Dict] = None, projection: Optional[Dict] = None, **kwargs) -> Optional[Dict]:
+        with self._lock:
+            for doc in self._matching(filter):
+                return apply_projection(doc, projection)
+        return None
+
+    def count_documents(self, filter: Dict, **kwargs) -> int:
+        with self._lock:
+            return sum(1 for _ in self._matching(filter))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    # ---------- 写操作 ----------
+    def insert_one(self, document: Dict, **kwargs) -> MemoryInsertResult:
+        return MemoryInsertResult(self._insert([document]))
+
+    def insert_many(self, documents: List[Dict], **kwargs) -> MemoryInsertResult:
+        return MemoryInsertResult(self._insert(documents))
+
+    def _insert(self, documents: List[Dict]) -> List[Any]:
+        ids = []
+        with self._lock:
+            for document in documents:
+                doc = clone(document)
+                doc.setdefault("_id", ObjectId())
+                if doc["_id"] in self._docs:
+                    raise ValueError(f"重复的_id: {doc['_id']}")
+                self._docs[doc["_id"]] = doc
+                self._index_add(doc)
+                ids.append(doc["_id"])
+        return ids
+
+    def _update_doc(self, doc: Dict, update: Dict) -> bool:
+        """原地更新一个文档，uid被修改时维护索引，返回文档是否发生变化"""
+        reindex = any(self.INDEX_FIELD in fields for fields in update.values())
+        if reindex:
+            self._index_remove(doc)
+        try:
+            return apply_update(doc, update)
+        finally:
+            if reindex:
+                self._index_add(doc)
+
+    def _update_one(
+            self,
+            filter: Dict,
+            update: Dict,
+            upsert: bool,
+            keep_before: Optional[Dict] = None
+    ) -> Tuple[bool, Optional[Dict], Optional[Dict], int, Any]:
+        """
+        更新第一个匹配的文档
+        keep_before 不为None时按该投影保留更新前的文档
+        返回 (是否匹配, 更新前文档, 更新后文档, 修改数, upsert的_id)
+        """
+        for doc in self._matching(filter):
+            before = apply_projection(doc, keep_before) if keep_before is not None else None
+            modified = self._update_doc(doc, update)
+            return True, before, doc, int(modified), None
+        if not upsert:
+            return False, None, None, 0, None
+        doc = _upsert_document(filter)
+        apply_update(doc, update)
+        _id = self._insert([doc])[0]
+        return False, None, self._docs[_id], 0, _id
+
+    def update_one(self, filter: Dict, update: Dict, upsert: bool = False, **kwargs) -> MemoryUpdateResult:
+        with self._lock:
+            matched, _, _, modified, upserted_id = self._update_one(filter, update, upsert)
+        return MemoryUpdateResult(int(matched), modified, upserted_id)
+
+    def find_one_and_update(
+            self,
+            filter: Dict,
+            update: Dict,
+            projection: Optional[Dict] = None,
+            return_document: bool = ReturnDocument.BEFORE,
+            upsert: bool = False,
+            **kwargs
+    ) -> Optional[Dict]:
+        with self._lock:
+            if return_document == ReturnDocument.AFTER:
+                _, _, after, _, _ = self._update_one(filter, update, upsert)
+                return apply_projection(after, projection) if after is not None else None
+            _, before, _, _, _ = self._update_one(filter, update, upsert, keep_before=projection or {})
+            return before
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> MemoryBulkWriteResult:
+        """只支持 UpdateOne 请求，出错的请求以 BulkWriteError 报告"""
+        details = {"nMatched": 0, "nModified": 0, "nUpserted": 0, "upserted": [], "writeErrors": []}
+        with self._lock:
+            for index, request in enumerate(requests):
+                try:
+                    matched, _, _, modified, upserted_id = self._update_one(
+                        request._filter, request._doc, getattr(request, "_upsert", False)
+                    )
+                except Exception as e:
+                    details["writeErrors"].append({"index": index, "code": 2, "errmsg": str(e)})
+                    if ordered:
+                        break
+                    continue
+                details["nMatched"] += int(matched)
+                details["nModified"] += modified
+                if upserted_id is not None:
+                    details["nUpserted"] += 1
+                    details["upserted"].append({"index": index, "_id": upserted_id})
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return MemoryBulkWriteResult(details)
+
+    def delete_many(self, filter: Dict, **kwargs) -> MemoryUpdateResult:
+        with self._lock:
+            docs = list(self._matching(filter))
+            for doc in docs:
+                self._index_remove(doc)
+                del self._docs[doc["_id"]]
+        result = MemoryUpdateResult(0, 0)
+        result.deleted_count = len(docs)
+        return result
+
+    def create_index(self, keys, **kwargs) -> str:
+        """uid 索引始终存在，其余索引只返回名称"""
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+    def drop(self) -> None:
+        with self._lock:
+            self._docs.clear()
+            self._index.clear()
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(name)
+            return self._collections[name]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    def drop_collection(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+
+
+class MemoryClient:
+    """
+    与 MongoClient 接口一致的内存客户端
+    同一进程内相同地址的客户端共享数据，便于应用和测试代码各自创建客户端
+    """
+
+    _servers: Dict[str, Dict[str, MemoryDatabase]] = {}
+    _servers_lock = threading.Lock()
+
+    def __init__(self, host: Optional[str] = None, *args, **kwargs):
+        key = host or "memory"
+        with MemoryClient._servers_lock:
+            self._databases = MemoryClient._servers.setdefault(key, {})
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        with MemoryClient._servers_lock:
+            if name not in self._databases:
+                self._databases[name] = MemoryDatabase(name)
+            return self._databases[name]
+
+    def get_database(self, name: str) -> MemoryDatabase:
+        return self[name]
+
+    def drop_database(self, name: str) -> None:
+        with MemoryClient._servers_lock:
+            self._databases.pop(name, None)
+
+    def close(self) -> None:
+        pass
+
+
+# ==================== 异步包装 ====================
+class AsyncMemoryCursor:
+    """motor 风格的游标，支持 async for 和 to_list"""
+
+    def __init__(self, cursor: MemoryCursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs) -> "AsyncMemoryCursor":
+        self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, n: int) -> "AsyncMemoryCursor":
+        self._cursor.limit(n)
+        return self
+
+    def batch_size(self, n: int) -> "AsyncMemoryCursor":
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        docs = list(self._cursor)
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._cursor:
+            yield doc
+
+
+class AsyncMemoryCollection:
+    """将内存集合的方法包装为协程，find返回异步游标"""
+
+    def __init__(self, collection: MemoryCollection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs) -> AsyncMemoryCursor:
+        return AsyncMemoryCursor(self._collection.find(*args, **kwargs))
+
+    def __getattr__(self, name: str):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncMemoryDatabase:
+    def __init__(self, database: MemoryDatabase):
+        self._database = database
+
+    def __getitem__(self, name: str) -> AsyncMemoryCollection:
+        return AsyncMemoryCollection(self._database[name])
+
+
+class AsyncMemoryClient:
+    """与 AsyncIOMotorClient 接口一致的内存客户端，与同地址的 MemoryClient 共享数据"""
+
+    def __init__(self, host: Optional[str] = None, *args, **kwargs):
+        self._client = MemoryClient(host)
+
+    def __getitem__(self, name: str) -> AsyncMemoryDatabase:
+        return AsyncMemoryDatabase(self._client[name])
+
+    def close(self) -> None:
+        pass
+
+
+# ==================== 后端选择 ====================
+def _motor_client(*args, **kwargs):
+    """延迟导入motor，只使用同步版时不需要安装"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(*args, **kwargs)
+
+
+BACKENDS: Dict[str, Callable[..., Any]] = {
+    "mongo": MongoClient,
+    "memory": MemoryClient,
+}
+
+ASYNC_BACKENDS: Dict[str, Callable[..., Any]] = {
+    "mongo": _motor_client,
+    "memory": AsyncMemoryClient,
+}
+
+
+def backend_name(name: Optional[str] = None) -> str:
+    """未指定时读取环境变量 MONGO_BACKEND，默认为mongo"""
+    name = name or os.environ.get("MONGO_BACKEND") or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"未知的存储后端: {name}，可选: {', '.join(BACKENDS)}")
+    return name
+
+
+def get_client_factory(name: Optional[str] = None) -> Callable[..., Any]:
+    """返回同步管理器使用的客户端工厂"""
+    return BACKENDS[backend_name(name)]
+
+
+def get_async_client_factory(name: Optional[str] = None) -> Callable[..., Any]:
+    """返回异步管理器使用的客户端工厂"""
+    return ASYNC_BACKENDS[backend_name(name)]
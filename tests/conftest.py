@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# 模块位于仓库根目录（未打包），测试从任意目录运行时都能导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sc  # noqa: E402
+from benchmarks.population import seed_population  # noqa: E402
+from storage import MemoryClient  # noqa: E402
+
+
+@pytest.fixture
+def manager():
+    """连接内存引擎的管理器，UID已规范化"""
+    manager = sc.MongoDBManager(uid_normalized=True, uri="memory://", client_factory=MemoryClient)
+    assert manager.connect()
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def uids(manager):
+    """写入50个合成用户，返回UID列表"""
+    return seed_population(manager.db, 50, cars_per_user=4, rank_list_len=5, seed=7)
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+from pymongo.errors import ExecutionTimeout, OperationFailure
+
+import admission
+
+
+def test_deadline_nesting_keeps_earlier():
+    assert admission.remaining() is None
+    with admission.deadline(10):
+        outer = admission.remaining()
+        with admission.deadline(60):
+            assert admission.remaining() <= outer
+        with admission.deadline(None):
+            assert admission.remaining() <= outer
+    assert admission.remaining() is None
+
+
+def test_remaining_ms_raises_after_deadline():
+    assert admission.remaining_ms() is None
+    with admission.deadline(0.001):
+        threading.Event().wait(0.01)
+        with pytest.raises(admission.DeadlineExceeded):
+            admission.remaining_ms()
+
+
+def test_is_timeout():
+    assert admission.is_timeout(admission.DeadlineExceeded())
+    assert admission.is_timeout(ExecutionTimeout("operation exceeded time limit", 50))
+    assert not admission.is_timeout(OperationFailure("bad query"))
+    assert not admission.is_timeout(ValueError())
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, 5.0), ("", 5.0), ("abc", 5.0), ("0", 5.0), ("250", 0.25), ("60000", 30.0),
+])
+def test_request_timeout(value, expected):
+    assert admission.request_timeout(value, 5.0, 30.0) == expected
+
+
+def test_controller_rejects_when_queue_is_full():
+    controller = admission.AdmissionController(1, max_queue=0)
+    with controller.slot():
+        with pytest.raises(admission.Overloaded):
+            controller.acquire()
+    assert controller.stats()['active'] == 0
+    assert controller.stats()['rejected'] == 1
+
+
+def test_controller_queue_times_out():
+    controller = admission.AdmissionController(1, max_queue=1, queue_timeout=0.01)
+    with controller.slot():
+        with pytest.raises(admission.DeadlineExceeded):
+            controller.acquire()
+    assert controller.stats()['timed_out'] == 1
+
+
+def test_controller_admits_waiter_on_release():
+    controller = admission.AdmissionController(1, max_queue=1, queue_timeout=5)
+    controller.acquire()
+    admitted = threading.Event()
+
+    def waiter():
+        with controller.slot():
+            admitted.set()
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert not admitted.wait(0.05)
+    controller.release()
+    thread.join(5)
+    assert admitted.is_set()
+    stats = controller.stats()
+    assert (stats['admitted'], stats['max_waiting'], stats['active']) == (2, 1, 0)
+
+
+def test_controller_from_env(monkeypatch):
+    monkeypatch.delenv("MONGO_MAX_CONCURRENCY", raising=False)
+    assert admission.controller_from_env() is None
+    monkeypatch.setenv("MONGO_MAX_CONCURRENCY", "4")
+    monkeypatch.setenv("MONGO_QUEUE_TIMEOUT_MS", "200")
+    controller = admission.controller_from_env()
+    assert (controller.max_concurrent, controller.max_queue, controller.queue_timeout) == (4, 4, 0.2)
@@ -0,0 +1,43 @@
+def test_batch_update_recent_rank_list_across_chunks(manager, uids):
+    new_list = [1, 2, 3]
+    missing = 1
+    results = manager.batch_update_recent_rank_list(uids[:5] + [missing], new_list, chunk_size=2)
+
+    assert set(results) == set(uids[:5]) | {missing}
+    for uid in uids[:5]:
+        assert results[uid]['success'] and results[uid]['modified'] == 1
+        assert manager.get_recent_rank_list(uid) == new_list
+    assert results[missing] == {
+        'success': False, 'data': new_list, 'error': '用户不存在', 'matched': 0, 'modified': 0
+    }
+
+
+def test_batch_update_recent_rank_list_reports_unchanged(manager, uids):
+    manager.batch_update_recent_rank_list(uids[:2], [5, 5])
+    results = manager.batch_update_recent_rank_list(uids[:2], [5, 5])
+    assert all(not r['success'] and r['error'] == '数据未改变' and r['matched'] == 1 for r in results.values())
+
+
+def test_batch_update_recent_rank_list_deduplicates_uids(manager, uids):
+    results = manager.batch_update_recent_rank_list([uids[0], uids[0]], [9])
+    assert list(results) == [uids[0]]
+    assert results[uids[0]]['modified'] == 1
+
+
+def test_batch_update_single_record(manager, uids):
+    before = manager.get_recent_rank_list(uids[0])
+    results = manager.batch_update_single_record([uids[0], uids[1]], 2, 99, chunk_size=1)
+
+    expected = list(before)
+    expected[2] = 99
+    assert results[uids[0]]['success']
+    assert results[uids[0]]['data'] == expected
+    assert manager.get_recent_rank_list(uids[0]) == expected
+    assert results[uids[1]]['success']
+
+
+def test_batch_update_single_record_out_of_range(manager, uids):
+    results = manager.batch_update_single_record([uids[0], 1], 10, 99)
+    length = len(manager.get_recent_rank_list(uids[0]))
+    assert results[uids[0]]['error'] == f'索引 10 超出范围（0-{length - 1}）'
+    assert results[1]['error'] == '索引 10 超出范围（0--1）'
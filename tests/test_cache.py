@@ -0,0 +1,107 @@
+import threading
+
+from cache import MISSING, Generations, LRUTTLCache, SingleFlight
+
+
+def test_generations_stamp_changes_on_bump():
+    generations = Generations(stripes=8)
+    keys = [("user", 1), ("car", 2)]
+    before = generations.stamp(keys)
+    generations.bump(("car", 2))
+    # 两个key可能落在同一段，此时一次修改使合计增加2
+    assert generations.stamp(keys) > before
+
+
+def test_cache_rejects_stale_set():
+    cache = LRUTTLCache()
+    cache.set("a", 1, valid=lambda: False)
+    assert cache.get("a") is MISSING
+    cache.set("a", 2, valid=lambda: True)
+    assert cache.get("a") == 2
+    assert cache.stats()['stale_sets'] == 1
+
+
+def test_single_flight_shares_only_same_stamp():
+    flight = SingleFlight()
+    gate = threading.Event()
+    started = threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        gate.wait(5)
+        return ["old"]
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow, 1)))
+    leader.start()
+    assert started.wait(5)
+    # 标记不同（期间有写入）时不加入进行中的调用
+    assert flight.do("k", lambda: ["new"], 2) == ["new"]
+    gate.set()
+    leader.join(5)
+    assert results == [["old"]]
+    assert flight.stats()['calls'] == 2 and flight.stats()['shared'] == 0
+
+
+class BlockingFindOne:
+    """第一次 find_one 在gate打开前阻塞，模拟读取期间发生写入"""
+
+    def __init__(self, find_one):
+        self.find_one = find_one
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        result = self.find_one(*args, **kwargs)
+        if self.calls == 1:
+            self.started.set()
+            self.gate.wait(5)
+        return result
+
+
+def test_read_overlapping_write_is_not_cached_or_shared(manager, uids, monkeypatch):
+    uid = uids[0]
+    manager.enable_cache()
+    collection = manager.db["UserInfo"]
+    find_one = BlockingFindOne(collection.find_one)
+    monkeypatch.setattr(collection, "find_one", find_one)
+
+    stale = []
+    reader = threading.Thread(target=lambda: stale.append(manager.get_user_rank(uid)))
+    reader.start()
+    assert find_one.started.wait(5)
+
+    # 读取进行中时写入：之后开始的读取不加入进行中的读取，直接读到新值
+    manager.update_user_rank(uid, 999999, 1)
+    assert manager.get_user_rank(uid) == {"rank_score": 999999, "rank_level": 1}
+    assert find_one.calls == 2
+
+    find_one.gate.set()
+    reader.join(5)
+    assert stale[0]["rank_score"] != 999999
+    # 写入前开始的读取结果不写入缓存，缓存中仍是新值
+    assert manager.get_user_rank(uid) == {"rank_score": 999999, "rank_level": 1}
+    assert find_one.calls == 2
+    assert manager.cache_stats()['stale_sets'] == 1
+
+
+def test_bulk_read_overlapping_write_is_not_cached(manager, uids, monkeypatch):
+    manager.enable_cache()
+    collection = manager.db["UserExtraInfo"]
+    find = collection.find
+    written = []
+
+    def find_then_write(*args, **kwargs):
+        docs = list(find(*args, **kwargs))
+        if not written:
+            # 查询结果返回后、写入缓存前数据被修改（写入本身也会调用find）
+            written.append(True)
+            manager.batch_update_recent_rank_list([uids[0]], [8, 8, 8])
+        return iter(docs)
+    monkeypatch.setattr(collection, "find", find_then_write)
+    manager.get_users_bulk(uids[:3], ("rank-list",))
+    monkeypatch.setattr(collection, "find", find)
+
+    assert manager.get_recent_rank_list(uids[0]) == [8, 8, 8]
@@ -0,0 +1,147 @@
+import asyncio
+import json
+
+import pytest
+
+import http_codec
+
+
+class FakeResponse:
+    """make_conditional 用到的响应接口子集，测试环境不依赖Flask"""
+
+    def __init__(self, body: bytes, status_code: int = 200, is_streamed: bool = False):
+        self.status_code = status_code
+        self.is_streamed = is_streamed
+        self.headers = {"Content-Type": "application/json", "Content-Length": str(len(body))}
+        self._body = body
+
+    def get_data(self) -> bytes:
+        return self._body
+
+    def set_data(self, body: bytes) -> None:
+        self._body = body
+
+
+class FakeAsyncResponse(FakeResponse):
+    """Quart响应的get_data是协程"""
+
+    async def get_data(self) -> bytes:
+        return self._body
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0.8, gzip;q=0.8", "br"),
+    ("GZIP;q=0.3", "gzip"),
+    ("*", "br"),
+    ("*;q=0.5, br;q=0", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("gzip;q=abc", None),
+    ("identity, deflate", None),
+])
+def test_negotiate_encoding(accept, expected):
+    assert http_codec.negotiate_encoding(accept, ("br", "gzip")) == expected
+
+
+def test_negotiate_encoding_only_offers_given_encodings():
+    assert http_codec.negotiate_encoding("br, gzip;q=0.5", ("gzip",)) == "gzip"
+    assert http_codec.negotiate_encoding("br", ("gzip",)) is None
+
+
+@pytest.mark.parametrize("tag, expected", [
+    ('"abc"', '"abc"'),
+    ('"abc-gzip"', '"abc"'),
+    ('"abc-br"', '"abc"'),
+    ('W/"abc-gzip"', '"abc"'),
+    (' "abc" ', '"abc"'),
+    ('"abc-deflate"', '"abc-deflate"'),
+])
+def test_etag_base(tag, expected):
+    assert http_codec._etag_base(tag) == expected
+
+
+def test_etag_matches_returns_client_tag():
+    etag = http_codec.body_etag(b'{"a":1}')
+    gzip_tag = etag[:-1] + '-gzip"'
+    br_tag = etag[:-1] + '-br"'
+    assert http_codec.etag_matches(None, etag) is None
+    assert http_codec.etag_matches(etag, etag) == etag
+    assert http_codec.etag_matches(gzip_tag, etag) == gzip_tag
+    assert http_codec.etag_matches(f'"other", {br_tag}', etag) == br_tag
+    assert http_codec.etag_matches("W/" + etag, etag) == "W/" + etag
+    assert http_codec.etag_matches("*", etag) == etag
+    assert http_codec.etag_matches('"other", "other-gzip"', etag) is None
+
+
+def test_make_conditional_sets_etag():
+    body = b'{"success":true}'
+    response = http_codec.make_conditional(FakeResponse(body), None)
+    assert response.status_code == 200
+    assert response.get_data() == body
+    assert response.headers["ETag"] == http_codec.body_etag(body)
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_make_conditional_not_modified():
+    body = b'{"success":true}'
+    etag = http_codec.body_etag(body)
+    client_tag = etag[:-1] + '-gzip"'
+    response = http_codec.make_conditional(FakeResponse(body), client_tag)
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    # 304沿用客户端持有的带编码后缀的ETag，不带响应体相关的头
+    assert response.headers["ETag"] == client_tag
+    assert "Content-Type" not in response.headers
+    assert "Content-Length" not in response.headers
+
+
+def test_make_conditional_changed_body():
+    old = http_codec.body_etag(b'{"v":1}')
+    response = http_codec.make_conditional(FakeResponse(b'{"v":2}'), old)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != old
+
+
+@pytest.mark.parametrize("response", [
+    FakeResponse(b'{"success":false}', status_code=400),
+    FakeResponse(b'{"a":1}\n', is_streamed=True),
+])
+def test_make_conditional_skips_errors_and_streams(response):
+    result = http_codec.make_conditional(response, "*")
+    assert result.status_code == response.status_code
+    assert "ETag" not in result.headers
+
+
+def test_make_conditional_async():
+    body = b'{"success":true}'
+    etag = http_codec.body_etag(body)
+    response = asyncio.run(http_codec.make_conditional_async(FakeAsyncResponse(body), etag))
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    response = asyncio.run(http_codec.make_conditional_async(FakeAsyncResponse(body), None))
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("value", [2 ** 64, -(2 ** 63) - 1, 10 ** 30])
+def test_orjson_falls_back_outside_64_bit(value):
+    pytest.importorskip("orjson")
+    codec = http_codec.ORJSONCodec()
+    obj = {"uid": 1, "score": value}
+    assert json.loads(codec.dumps(obj)) == obj
+    assert codec.dumps(obj) == http_codec.StdJSONCodec().dumps(obj)
+
+
+def test_orjson_sort_keys_and_int_keys():
+    pytest.importorskip("orjson")
+    codec = http_codec.ORJSONCodec()
+    assert codec.dumps({"b": 1, "a": 2}, sort_keys=True) == b'{"a":2,"b":1}'
+    assert codec.dumps({"b": 1, "a": 2}) == b'{"b":1,"a":2}'
+    assert json.loads(codec.dumps({1: "x"})) == {"1": "x"}
+    # 回退到标准库时同样排序
+    assert codec.dumps({"b": 2 ** 64, "a": 1}, sort_keys=True) == b'{"a":1,"b":18446744073709551616}'
+
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+
+import pytest
+
+from jobs import JobCheckpoint, JobRunner, JobStore, file_signature, iter_uid_chunks, run_chunked_job
+
+
+def write_uids(path, lines):
+    path.write_text("".join(f"{line}\n" for line in lines))
+    return str(path)
+
+
+def succeed(uids):
+    return {uid: {'success': True, 'error': None} for uid in uids}
+
+
+def wait_for(predicate, timeout=5.0):
+    until = time.monotonic() + timeout
+    while time.monotonic() < until:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_iter_uid_chunks(tmp_path):
+    path = write_uids(tmp_path / "uids.txt", [1, 2, "", "abc", 3, 4, 5, " 6 "])
+    assert list(iter_uid_chunks(path, 2)) == [
+        (0, [1, 2], []), (1, [3, 4], ["abc"]), (2, [5, 6], []),
+    ]
+    path = write_uids(tmp_path / "tail.txt", [1, "x"])
+    assert list(iter_uid_chunks(path, 2)) == [(0, [1], ["x"])]
+
+
+def test_checkpoint_resume_skips_done_chunks(tmp_path):
+    path = write_uids(tmp_path / "uids.txt", range(1, 11))
+    checkpoint_path = str(tmp_path / "job.checkpoint.json")
+    signature = {'file': file_signature(path), 'chunk_size': 3}
+    checkpoint = JobCheckpoint(checkpoint_path, signature)
+    checkpoint.mark_done(0)
+    checkpoint.mark_done(2)
+
+    seen = []
+
+    def process_chunk(uids):
+        seen.extend(uids)
+        return succeed(uids)
+
+    resumed = JobCheckpoint(checkpoint_path, signature)
+    assert resumed.done == {0, 2}
+    summary = run_chunked_job(iter_uid_chunks(path, 3), process_chunk, workers=2, checkpoint=resumed)
+    assert sorted(seen) == [4, 5, 6, 10]
+    assert (summary['chunks'], summary['skipped_chunks'], summary['success']) == (2, 2, 4)
+    assert JobCheckpoint(checkpoint_path, signature).done == {0, 1, 2, 3}
+
+    assert JobCheckpoint(checkpoint_path, signature, restart=True).done == set()
+    assert JobCheckpoint(checkpoint_path, {**signature, 'chunk_size': 4}).done == set()
+    resumed.remove()
+    assert not os.path.exists(checkpoint_path)
+
+
+def test_checkpoint_ignored_after_file_changes(tmp_path):
+    path = write_uids(tmp_path / "uids.txt", [1, 2])
+    checkpoint_path = str(tmp_path / "job.checkpoint.json")
+    JobCheckpoint(checkpoint_path, {'file': file_signature(path)}).mark_done(0)
+    write_uids(tmp_path / "uids.txt", [1, 2, 3])
+    assert JobCheckpoint(checkpoint_path, {'file': file_signature(path)}).done == set()
+
+
+def test_run_chunked_job_bounds_in_flight_chunks(tmp_path):
+    path = write_uids(tmp_path / "uids.txt", range(1, 21))
+    gate = threading.Event()
+    yielded = []
+
+    def chunks():
+        for chunk in iter_uid_chunks(path, 1):
+            yielded.append(chunk[0])
+            yield chunk
+
+    def process_chunk(uids):
+        gate.wait(5)
+        return succeed(uids)
+
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(run_chunked_job(chunks(), process_chunk, workers=2)))
+    thread.start()
+    # 两个执行线程都阻塞时最多提交 workers * 2 个块，再读取一块后等待
+    assert wait_for(lambda: len(yielded) == 5)
+    time.sleep(0.1)
+    assert len(yielded) == 5
+    gate.set()
+    thread.join(5)
+    assert (result['chunks'], result['success']) == (20, 20)
+
+
+def test_run_chunked_job_records_failures(tmp_path):
+    path = write_uids(tmp_path / "uids.txt", [1, 2, "bad", 3])
+    records = []
+
+    class Log:
+        def write(self, record):
+            records.append(record)
+
+    def process_chunk(uids):
+        if 3 in uids:
+            raise RuntimeError("连接断开")
+        return {uid: {'success': uid != 2, 'error': None if uid != 2 else '用户不存在'} for uid in uids}
+
+    summary = run_chunked_job(iter_uid_chunks(path, 2), process_chunk, workers=1, log=Log())
+    assert (summary['success'], summary['failed'], summary['invalid_lines']) == (1, 2, 1)
+    errors = {r.get('uid', r.get('line')): r['error'] for r in records if r['type'] == 'error'}
+    assert errors == {2: '用户不存在', 3: '连接断开', 'bad': '无效UID'}
+    assert records[-1]['type'] == 'summary'
+
+
+def test_job_store_create_and_claim(tmp_path):
+    store = JobStore(str(tmp_path))
+    job_id = store.new_id("key-1")
+    assert job_id == store.new_id("key-1")
+    state, created = store.create(job_id, "update-list", {'new_list': [1]}, [3, 1, 3], 2)
+    assert created and state['progress']['uids_total'] == 2
+    assert store.create(job_id, "update-list", {}, [9], 2) == (state, False)
+    assert store.load("../etc/passwd") is None
+
+    assert store.claim(job_id)
+    # 当前进程持有锁，其他执行者无法获取
+    assert not store.claim(job_id)
+    store.release(job_id)
+    assert store.claim(job_id)
+
+    # 持有锁的进程已退出时可以接管
+    with open(store.path(job_id, ".lock"), 'w') as f:
+        f.write("999999999")
+    assert store.claim(job_id)
+
+
+def make_runner(store, processor=succeed):
+    def make_processor(action, params):
+        if action != "ok":
+            raise ValueError(f"未知操作: {action}")
+        return processor
+    return JobRunner(store, make_processor, max_jobs=1, workers=2)
+
+
+def test_job_runner_completes_job(tmp_path):
+    store = JobStore(str(tmp_path))
+    runner = make_runner(store)
+    with pytest.raises(ValueError):
+        runner.submit("bad", {}, [1], 10)
+
+    state, _ = runner.submit("ok", {}, list(range(1, 8)), 3)
+    assert wait_for(lambda: store.load(state['id'])['status'] == 'completed')
+    progress = store.load(state['id'])['progress']
+    assert (progress['chunks_done'], progress['success'], progress['percent']) == (3, 7, 100.0)
+    assert not os.path.exists(store.path(state['id'], ".checkpoint.json"))
+    assert wait_for(lambda: not os.path.exists(store.path(state['id'], ".lock")))
+
+
+def test_job_runner_survives_errors_outside_chunks(tmp_path):
+    store = JobStore(str(tmp_path))
+    runner = make_runner(store)
+    job_id = store.new_id("corrupt")
+    store.create(job_id, "ok", {}, [1, 2], 2)
+    with open(store.path(job_id, ".checkpoint.json"), 'w') as f:
+        f.write("{not json")
+    runner.resume()
+    assert wait_for(lambda: store.load(job_id)['status'] == 'failed')
+    assert store.load(job_id)['error']
+
+    # 执行线程仍在运行，后续任务正常完成
+    state, _ = runner.submit("ok", {}, [1, 2, 3], 2)
+    assert wait_for(lambda: store.load(state['id'])['status'] == 'completed')
+    assert runner.stats()['failed'] == 1 and runner.stats()['completed'] == 1
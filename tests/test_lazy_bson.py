@@ -0,0 +1,74 @@
+import random
+
+import bson
+from bson.int64 import Int64
+from bson.raw_bson import RawBSONDocument
+
+import sc
+from benchmarks.population import make_user_extra_info
+from lazy_bson import RAW_BSON_CODEC_OPTIONS, RawCarList, decode_path
+
+SCORE_FIELDS = ("rank_score", "season_best_rank_score", "palace_score_list")
+
+
+def raw(doc):
+    return bson.decode(bson.encode(doc), RAW_BSON_CODEC_OPTIONS)
+
+
+def score_subset(car_list):
+    return {
+        car_id: {field: car[field] for field in SCORE_FIELDS if field in car}
+        for car_id, car in car_list.items() if isinstance(car, dict)
+    }
+
+
+def test_score_fields_match_full_decode():
+    doc = make_user_extra_info(1, random.Random(5), 20, 5, extra_car_fields=6)
+    car_list = doc["car_garage"]["car_list"]
+    cars = RawCarList.from_document(raw(doc))
+    assert cars.score_fields() == score_subset(car_list)
+    assert sc.MongoDBManager._build_car_scores(cars) == sc.MongoDBManager._build_car_scores(car_list)
+
+
+def test_score_fields_without_score_prefix():
+    # 分数字段不在开头、数值类型不同或缺少字段时逐字段查找
+    car_list = {
+        "1": {"attr": {"x": [1, 2]}, "palace_score_list": [{"score": 3}], "rank_score": Int64(2 ** 40),
+              "name": "a", "season_best_rank_score": 1.5},
+        "2": {"rank_score": 7},
+        "3": {},
+        "4": 5,
+    }
+    cars = RawCarList.from_document(raw({"uid": 1, "car_garage": {"car_list": car_list}}))
+    assert cars.score_fields() == score_subset(car_list)
+
+
+def test_mapping_access():
+    car_list = {"1001": {"rank_score": 1, "extra": {"a": 1}}, "1002": {"rank_score": 2}, "bad": "x"}
+    cars = RawCarList.from_document(raw({"car_garage": {"car_list": car_list}}))
+    assert len(cars) == 2 and list(cars) == ["1001", "1002"]
+    assert "1001" in cars and "bad" not in cars
+    assert cars["1001"] == car_list["1001"]
+    assert dict(cars.items()) == {"1001": car_list["1001"], "1002": car_list["1002"]}
+    assert cars.to_dict() == car_list
+
+
+def test_missing_car_list_is_empty():
+    for doc in ({"uid": 1}, {"car_garage": {}}, {"car_garage": {"car_list": []}}):
+        cars = RawCarList.from_document(raw(doc))
+        assert len(cars) == 0 and cars.score_fields() == {}
+
+
+def test_raw_document_from_batch_memoryview():
+    docs = [{"car_garage": {"car_list": {str(i): {"rank_score": i}}}} for i in range(3)]
+    batch = b"".join(bson.encode(doc) for doc in docs)
+    decoded = bson.decode_all(batch, RAW_BSON_CODEC_OPTIONS)
+    assert isinstance(decoded[1], RawBSONDocument)
+    assert RawCarList.from_document(decoded[1]).score_fields() == {"1": {"rank_score": 1}}
+
+
+def test_decode_path():
+    data = bson.encode({"a": {"b": [1, 2]}, "c": 1})
+    assert decode_path(data, ("a", "b")) == [1, 2]
+    assert decode_path(data, ("a", "x"), "missing") == "missing"
+    assert decode_path(data, ("c", "d")) is None
@@ -0,0 +1,65 @@
+import pytest
+
+import sc
+
+
+def expected_order(manager):
+    """按 rank_score、rank_level 降序，uid 升序的全部UID"""
+    docs = manager.db["UserInfo"].find({"racetrack_rank_data.rank_score": {"$type": "number"}})
+    return [
+        doc["uid"] for doc in sorted(docs, key=lambda doc: (
+            -doc["racetrack_rank_data"]["rank_score"], -doc["racetrack_rank_data"].get("rank_level", 0), doc["uid"]
+        ))
+    ]
+
+
+def walk(manager, limit):
+    """按游标翻完整个排行榜，返回全部条目"""
+    entries, cursor = [], None
+    while True:
+        result = manager.get_leaderboard(limit, cursor)
+        assert result['success'], result['error']
+        entries.extend(result['data']['entries'])
+        cursor = result['data']['next']
+        if not cursor:
+            return entries
+
+
+def test_cursor_round_trip():
+    entry = {"rank": 12, "uid": 10000003, "rank_score": 4500, "rank_level": 0}
+    cursor = sc.MongoDBManager.encode_leaderboard_cursor(entry)
+    assert sc.MongoDBManager.decode_leaderboard_cursor(cursor) == ((4500, 0, 10000003), 12)
+    assert sc.MongoDBManager.decode_leaderboard_cursor(None) == (None, 0)
+
+
+@pytest.mark.parametrize("cursor", ["abc", "1:2:3", "1:2:3:4:5", "1:x:3:4"])
+def test_invalid_cursor(manager, cursor):
+    result = manager.get_leaderboard(10, cursor)
+    assert not result['success']
+    assert result['error'] == f"无效的分页游标: {cursor}"
+
+
+@pytest.mark.parametrize("snapshot_size", [1000, 7])
+def test_pages_cover_leaderboard_in_order(manager, uids, monkeypatch, snapshot_size):
+    # 快照小于排行榜时，快照之后的页按键集分页查询
+    monkeypatch.setattr(sc, "LEADERBOARD_SNAPSHOT_SIZE", snapshot_size)
+    # 制造分数和等级都相同的用户，按uid区分先后
+    for uid in uids[:4]:
+        manager.db["UserInfo"].update_one(
+            {"uid": uid}, {"$set": {"racetrack_rank_data": {"rank_score": 2500, "rank_level": 5}}}
+        )
+    manager.db["UserInfo"].update_one({"uid": uids[4]}, {"$set": {"racetrack_rank_data.rank_score": None}})
+
+    entries = walk(manager, 6)
+    order = expected_order(manager)
+    assert [entry["uid"] for entry in entries] == order
+    assert [entry["rank"] for entry in entries] == list(range(1, len(order) + 1))
+    assert uids[4] not in order
+
+
+def test_limit_is_clamped(manager, uids):
+    result = manager.get_leaderboard(0)
+    assert len(result['data']['entries']) == 1
+    result = manager.get_leaderboard(sc.LEADERBOARD_MAX_LIMIT + 1)
+    assert len(result['data']['entries']) == len(uids)
+    assert result['data']['next'] is None
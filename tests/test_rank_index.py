@@ -0,0 +1,77 @@
+import random
+
+from rank_index import RankIndex, rank_key
+
+
+def brute_positions(ranks):
+    """{uid: (score, level)} 按排行榜顺序排列后的名次"""
+    ordered = sorted(ranks, key=lambda uid: rank_key(uid, *ranks[uid]))
+    return {uid: position for position, uid in enumerate(ordered, 1)}
+
+
+def test_rank_key_orders_like_leaderboard():
+    keys = [rank_key(3, 100, 2), rank_key(1, 100, 2), rank_key(2, 100, 5), rank_key(4, 200, None)]
+    assert [key[2] for key in sorted(keys)] == [4, 2, 1, 3]
+    assert rank_key(5, 10, None) == rank_key(5, 10, 0)
+
+
+def test_build_and_positions():
+    index = RankIndex(load=2)
+    index.build([(1, 10, 0), (2, 30, 1), (3, 30, 2), (4, 20, None), (2, 5, 0)])
+    assert len(index) == 4
+    assert index.positions([1, 2, 3, 4, 99]) == {3: 1, 4: 2, 1: 3, 2: 4, 99: None}
+    assert 99 not in index
+
+
+def test_updates_match_brute_force():
+    # load很小，插入和删除时频繁拆分、删空分段
+    rng = random.Random(3)
+    index = RankIndex(load=3)
+    ranks = {}
+    for step in range(2000):
+        uid = rng.randrange(60)
+        if rng.random() < 0.2:
+            index.remove(uid)
+            ranks.pop(uid, None)
+        else:
+            ranks[uid] = (rng.randrange(20), rng.randrange(3))
+            index.update(uid, *ranks[uid])
+        if step % 100 == 0:
+            expected = brute_positions(ranks)
+            assert index.positions(range(60)) == {uid: expected.get(uid) for uid in range(60)}
+    assert len(index) == len(ranks)
+    assert all(index.position(uid) == position for uid, position in brute_positions(ranks).items())
+
+
+def test_update_same_key_is_noop():
+    index = RankIndex()
+    index.update(1, 10, 0)
+    index.update(1, 10, 0)
+    index.remove(2)
+    assert len(index) == 1 and index.position(1) == 1
+
+
+def test_manager_positions_follow_updates(manager, uids):
+    assert manager.get_user_positions(uids[:3]) == {uid: None for uid in uids[:3]}
+    assert manager.build_rank_index() == len(uids)
+
+    leaderboard = manager.get_leaderboard(len(uids))['data']['entries']
+    assert manager.get_user_positions(uids) == {entry["uid"]: entry["rank"] for entry in leaderboard}
+
+    manager.update_user_rank(uids[10], 10 ** 6, 0)
+    assert manager.get_user_position(uids[10]) == 1
+    assert manager.get_user_positions([uids[10], 1], count_missing=True) == {uids[10]: 1, 1: None}
+
+
+def test_count_missing_matches_index(manager, uids):
+    counted = manager.get_user_positions(uids, count_missing=True)
+    manager.build_rank_index()
+    assert manager.get_user_positions(uids) == counted
+
+
+def test_stale_index_is_not_used(manager, uids):
+    manager.build_rank_index()
+    manager.rank_index_max_age = 60
+    assert manager.get_user_position(uids[0]) is not None
+    manager.rank_index_built_at -= 61
+    assert manager.get_user_position(uids[0]) is None
@@ -0,0 +1,143 @@
+import pytest
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from storage import MemoryClient, apply_update, compile_filter
+
+
+DOC = {
+    "uid": 7,
+    "flag": True,
+    "racetrack_rank_data": {"rank_score": 120, "rank_level": 3},
+    "racetrack_match_data": {"recent_rank_list": [1, 4, 2]},
+}
+
+
+@pytest.mark.parametrize("query, expected", [
+    ({}, True),
+    ({"uid": 7}, True),
+    ({"uid": "7"}, False),
+    ({"flag": 1}, False),
+    ({"racetrack_rank_data.rank_score": {"$gte": 120, "$lt": 121}}, True),
+    ({"racetrack_rank_data.rank_score": {"$gt": "a"}}, False),
+    ({"racetrack_match_data.recent_rank_list": 4}, True),
+    ({"racetrack_match_data.recent_rank_list.1": 4}, True),
+    ({"racetrack_match_data.recent_rank_list.5": {"$exists": True}}, False),
+    ({"uid": {"$in": [1, 7]}}, True),
+    ({"uid": {"$in": [True]}}, False),
+    ({"uid": {"$nin": [7]}}, False),
+    ({"missing": {"$ne": 1}}, True),
+    ({"uid": {"$type": "number"}}, True),
+    ({"flag": {"$type": "int"}}, False),
+    ({"$or": [{"uid": 1}, {"uid": 7}]}, True),
+    ({"$and": [{"uid": 7}, {"flag": False}]}, False),
+])
+def test_compile_filter(query, expected):
+    assert compile_filter(query)(DOC) is expected
+
+
+def test_compile_filter_rejects_unknown_operator():
+    with pytest.raises(ValueError):
+        compile_filter({"uid": {"$regex": "7"}})
+
+
+def test_apply_update_reports_changes():
+    doc = {"a": {"b": 1}, "l": [1, 2]}
+    assert apply_update(doc, {"$set": {"a.b": 2, "l.3": 5, "c.d": True}})
+    assert doc == {"a": {"b": 2}, "l": [1, 2, None, 5], "c": {"d": True}}
+    assert not apply_update(doc, {"$set": {"a.b": 2}})
+    # 类型不同视为改变
+    assert apply_update(doc, {"$set": {"c.d": 1}})
+
+
+def test_apply_update_rolls_back_on_failure():
+    doc = {"a": {"b": 1}, "l": [1, 2]}
+    with pytest.raises(ValueError):
+        apply_update(doc, {"$set": {"a.b": 2, "new": 1, "l.x": 3}})
+    assert doc == {"a": {"b": 1}, "l": [1, 2]}
+
+
+def test_apply_update_rejects_other_operators():
+    with pytest.raises(ValueError):
+        apply_update({}, {"$inc": {"a": 1}})
+
+
+@pytest.fixture
+def collection():
+    # 同一地址的内存客户端共享数据，测试结束后删除数据库
+    client = MemoryClient("memory://test-storage")
+    collection = client["db"]["UserInfo"]
+    collection.insert_many([
+        {"uid": uid, "racetrack_rank_data": {"rank_score": score}}
+        for uid, score in [(1, 10), (2, 30), (3, 20), (4, 30)]
+    ])
+    yield collection
+    client.drop_database("db")
+
+
+def test_find_sort_limit_projection(collection):
+    docs = list(
+        collection.find({}, {"_id": 0, "uid": 1})
+        .sort([("racetrack_rank_data.rank_score", -1), ("uid", 1)])
+        .limit(3)
+    )
+    assert docs == [{"uid": 2}, {"uid": 4}, {"uid": 3}]
+
+
+def test_find_returns_copies(collection):
+    doc = collection.find_one({"uid": 1})
+    doc["racetrack_rank_data"]["rank_score"] = 0
+    assert collection.find_one({"uid": 1})["racetrack_rank_data"]["rank_score"] == 10
+
+
+def test_uid_index_follows_updates(collection):
+    collection.update_one({"uid": 1}, {"$set": {"uid": 10}})
+    assert collection.find_one({"uid": 1}) is None
+    assert collection.count_documents({"uid": {"$in": [10, 2]}}) == 2
+    assert collection.count_documents({"$or": [{"uid": 10}, {"uid": 3}]}) == 2
+
+
+def test_update_one_upsert(collection):
+    result = collection.update_one({"uid": 9}, {"$set": {"racetrack_rank_data.rank_score": 5}}, upsert=True)
+    assert (result.matched_count, result.modified_count) == (0, 0)
+    assert result.upserted_id is not None
+    assert collection.find_one({"uid": 9}, {"_id": 0}) == {"uid": 9, "racetrack_rank_data": {"rank_score": 5}}
+
+
+def test_find_one_and_update(collection):
+    before = collection.find_one_and_update({"uid": 1}, {"$set": {"x": 1}}, projection={"_id": 0, "x": 1})
+    assert before == {}
+    after = collection.find_one_and_update(
+        {"uid": 1}, {"$set": {"x": 2}}, projection={"_id": 0, "x": 1}, return_document=ReturnDocument.AFTER
+    )
+    assert after == {"x": 2}
+
+
+def test_bulk_write_unordered_reports_errors(collection):
+    collection.update_one({"uid": 3}, {"$set": {"l": [1]}})
+    with pytest.raises(BulkWriteError) as info:
+        collection.bulk_write([
+            UpdateOne({"uid": 1}, {"$set": {"x": 1}}),
+            UpdateOne({"uid": 3}, {"$set": {"l.x": 1}}),
+            UpdateOne({"uid": 2}, {"$set": {"x": 1}}),
+            UpdateOne({"uid": 99}, {"$set": {"x": 1}}),
+        ], ordered=False)
+    details = info.value.details
+    assert [error["index"] for error in details["writeErrors"]] == [1]
+    assert (details["nMatched"], details["nModified"]) == (2, 2)
+    assert collection.find_one({"uid": 2})["x"] == 1
+
+
+def test_bulk_write_ordered_stops_at_first_error(collection):
+    collection.update_one({"uid": 3}, {"$set": {"l": [1]}})
+    with pytest.raises(BulkWriteError):
+        collection.bulk_write([
+            UpdateOne({"uid": 3}, {"$set": {"l.x": 1}}),
+            UpdateOne({"uid": 2}, {"$set": {"x": 1}}),
+        ])
+    assert "x" not in collection.find_one({"uid": 2})
+
+
+def test_delete_many(collection):
+    assert collection.delete_many({"racetrack_rank_data.rank_score": {"$gte": 20}}).deleted_count == 3
+    assert [doc["uid"] for doc in collection.find()] == [1]
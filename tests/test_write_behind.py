@@ -0,0 +1,244 @@
+import pytest
+from pymongo.errors import ExecutionTimeout
+
+import admission
+import sc
+from write_behind import PendingWrite, WriteBehindQueue, WriteFailed, merge_set, set_path
+
+
+def test_set_path():
+    target = {"a": [{"x": 1}, {"x": 2}]}
+    assert set_path(target, "a.1.x", 5)
+    assert set_path(target, "b.c", 1)
+    assert target == {"a": [{"x": 1}, {"x": 5}], "b": {"c": 1}}
+    assert not set_path(target, "a.5.x", 1)
+    assert not set_path(target, "b.c.d", 1)
+
+
+def test_merge_set_later_values_win():
+    fields = {}
+    merge_set(fields, "car.1.rank_score", 10)
+    merge_set(fields, "car.1.palace_score_list.0.score", 3)
+    merge_set(fields, "car.1.rank_score", 20)
+    assert fields == {"car.1.rank_score": 20, "car.1.palace_score_list.0.score": 3}
+
+
+def test_merge_set_parent_replaces_children():
+    fields = {"car.1.rank_score": 10, "car.1.palace_score_list.0.score": 3, "car.2.rank_score": 1}
+    merge_set(fields, "car.1", {"rank_score": 5})
+    assert fields == {"car.2.rank_score": 1, "car.1": {"rank_score": 5}}
+
+
+def test_merge_set_child_writes_into_parent():
+    value = {"palace_score_list": [{"score": 1}, {"score": 2}]}
+    fields = {}
+    merge_set(fields, "car.1", value)
+    merge_set(fields, "car.1.palace_score_list.1.score", 9)
+    assert fields == {"car.1": {"palace_score_list": [{"score": 1}, {"score": 9}]}}
+    # 合并时复制提交的值
+    assert value["palace_score_list"][1]["score"] == 2
+    # 下级路径无法写入已有值时单独保留
+    merge_set(fields, "car.1.palace_score_list.4.score", 7)
+    assert fields["car.1.palace_score_list.4.score"] == 7
+
+
+class Recorder:
+    """记录每次flush的批次，按fail返回失败的下标"""
+
+    def __init__(self, fail=None, error=None):
+        self.batches = []
+        self.fail = fail or {}
+        self.error = error
+
+    def __call__(self, entries):
+        self.batches.append([(entry.key, dict(entry.query), dict(entry.fields)) for entry in entries])
+        if self.error:
+            raise self.error
+        return self.fail
+
+
+@pytest.fixture
+def queue():
+    queues = []
+
+    def make(flush_batch, **kwargs):
+        # 窗口足够长，只有测试调用flush时才写入
+        queues.append(WriteBehindQueue(flush_batch, window=60, **kwargs))
+        return queues[-1]
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+def test_submissions_for_same_key_are_coalesced(queue):
+    recorder = Recorder()
+    q = queue(recorder)
+    first = q.submit("UserInfo", ("user", 1), {"uid": 1}, {"score": 1, "level": 1})
+    second = q.submit("UserInfo", ("user", 1), {"uid": 1, "extra": True}, {"score": 2})
+    other = q.submit("UserInfo", ("user", 2), {"uid": 2}, {"score": 3})
+    assert q.depth() == 2 and not first.done()
+
+    assert q.flush() == 2
+    assert recorder.batches == [[
+        (("user", 1), {"uid": 1, "extra": True}, {"score": 2, "level": 1}),
+        (("user", 2), {"uid": 2}, {"score": 3}),
+    ]]
+    assert all(ticket.done() and ticket.error is None for ticket in (first, second, other))
+    assert second.query == {"uid": 1, "extra": True}
+    stats = q.stats()
+    assert (stats['submitted'], stats['coalesced'], stats['flushes'], stats['flushed']) == (3, 1, 1, 2)
+    assert q.flush() == 0
+
+
+def test_failed_entries_resolve_their_tickets(queue):
+    q = queue(Recorder(fail={1: "用户不存在"}))
+    ok = q.submit("UserInfo", 1, {}, {"a": 1})
+    failed = q.submit("UserInfo", 2, {}, {"a": 1})
+    assert q.flush() == 1
+    ok.result(0)
+    with pytest.raises(WriteFailed, match="用户不存在"):
+        failed.result(0)
+    assert q.stats()['errors'] == 1
+
+
+def test_flush_batch_exception_fails_every_ticket(queue):
+    # 队列的兜底处理：flush_batch 本身抛出时整批失败；管理器的 flush_batch 按批记录错误，不会抛出
+    q = queue(Recorder(error=RuntimeError("连接断开")))
+    tickets = [q.submit("UserInfo", key, {}, {"a": key}) for key in range(3)]
+    assert q.flush() == 0
+    assert [ticket.error for ticket in tickets] == ["连接断开"] * 3
+
+
+def test_tickets_resolved_by_flush_batch_are_kept(queue):
+    def flush_batch(entries):
+        # 合并写入中的第一次提交单独失败，其余成功
+        entries[0].tickets[0].resolve("车辆ID无效")
+        return {}
+
+    q = queue(flush_batch)
+    bad = q.submit("UserExtraInfo", 1, {}, {"a": 1})
+    good = q.submit("UserExtraInfo", 1, {}, {"b": 1})
+    q.flush()
+    assert (bad.error, good.error) == ("车辆ID无效", None)
+
+
+def test_flush_keys_leaves_other_entries(queue):
+    recorder = Recorder()
+    q = queue(recorder)
+    mine = q.submit("UserInfo", 1, {}, {"a": 1})
+    other = q.submit("UserInfo", 2, {}, {"a": 1})
+    assert q.flush([1, 3]) == 1
+    assert mine.done() and not other.done()
+    assert q.depth() == 1
+    assert recorder.batches == [[(1, {}, {"a": 1})]]
+
+
+def test_pending_write_timeout():
+    with pytest.raises(TimeoutError):
+        PendingWrite().result(0.01)
+
+
+def test_max_pending_triggers_flush(queue):
+    recorder = Recorder()
+    q = queue(recorder, max_pending=2)
+    q.submit("UserInfo", 1, {}, {"a": 1})
+    ticket = q.submit("UserInfo", 2, {}, {"a": 1})
+    assert ticket.wait(5)
+    assert len(recorder.batches[0]) == 2
+
+
+def test_close_flushes_and_rejects_new_writes(queue):
+    recorder = Recorder()
+    q = queue(recorder)
+    ticket = q.submit("UserInfo", 1, {}, {"a": 1})
+    assert q.close() == 1
+    assert ticket.done()
+    with pytest.raises(RuntimeError):
+        q.submit("UserInfo", 1, {}, {"a": 1})
+
+
+def test_manager_rank_updates_are_confirmed_on_flush(manager, uids):
+    manager.build_rank_index()
+    manager.enable_write_behind(window=60)
+    manager.update_user_rank(uids[0], 10 ** 6, 1)
+    manager.update_user_rank(uids[0], 10 ** 6, 2)
+    assert manager.db["UserInfo"].find_one({"uid": uids[0]})["racetrack_rank_data"]["rank_score"] != 10 ** 6
+    assert manager.get_user_position(uids[0]) != 1
+
+    assert manager.flush_writes() == 1
+    assert manager.db["UserInfo"].find_one({"uid": uids[0]})["racetrack_rank_data"] == {
+        "rank_score": 10 ** 6, "rank_level": 2
+    }
+    assert manager.get_user_position(uids[0]) == 1
+    assert manager.write_behind_stats()['coalesced'] == 1
+
+
+def test_manager_sync_write_reports_missing_user(manager, uids):
+    manager.enable_write_behind(window=60)
+    with pytest.raises(WriteFailed, match="用户不存在"):
+        manager.update_user_rank(1, 100, 1, sync=True)
+
+
+def test_manager_invalid_car_fails_only_its_update(manager, uids):
+    car_id = next(iter(manager.get_car_list(uids[0])))
+    manager.enable_write_behind(window=60)
+    manager.batch_update_cars_for_user(uids[0], {car_id: {"rank_score": 4321}})
+    result = manager.batch_update_cars_for_user(uids[0], {"999999": {"rank_score": 1}}, sync=True)
+
+    assert not result['success']
+    assert result['error'] == "无效车辆ID: 999999"
+    assert manager.get_car_list(uids[0])[car_id]["rank_score"] == 4321
+
+
+def test_manager_timeout_fails_only_its_chunk(manager, uids, monkeypatch):
+    monkeypatch.setattr(sc, "BULK_WRITE_CHUNK_SIZE", 2)
+    collection = manager.db["UserInfo"]
+    bulk_write = collection.bulk_write
+    calls = []
+
+    def flaky_bulk_write(operations, **kwargs):
+        calls.append(len(operations))
+        if len(calls) == 2:
+            raise ExecutionTimeout("operation exceeded time limit", 50)
+        return bulk_write(operations, **kwargs)
+    monkeypatch.setattr(collection, "bulk_write", flaky_bulk_write)
+
+    manager.build_rank_index()
+    manager.enable_write_behind(window=60)
+    tickets = [manager.write_behind.submit(
+        "UserInfo", ("user", uid), {"uid": uid},
+        {"racetrack_rank_data.rank_score": 10 ** 6 + i, "racetrack_rank_data.rank_level": 0}
+    ) for i, uid in enumerate(uids[:5])]
+    assert manager.flush_writes() == 3
+
+    assert calls == [2, 2, 1]
+    assert [ticket.error is None for ticket in tickets] == [True, True, False, False, True]
+    assert "exceeded time limit" in tickets[2].error
+    for i, uid in enumerate(uids[:5]):
+        written = tickets[i].error is None
+        assert (collection.find_one({"uid": uid})["racetrack_rank_data"]["rank_score"] == 10 ** 6 + i) is written
+    # 名次索引只反映已写入的更新
+    assert manager.get_user_position(uids[4]) == 1
+    assert manager.get_user_position(uids[3]) > 3
+
+
+def test_manager_sync_write_flushes_only_its_key(manager, uids, monkeypatch):
+    collection = manager.db["UserInfo"]
+    bulk_write = collection.bulk_write
+    deadlines = []
+
+    def recording_bulk_write(operations, **kwargs):
+        deadlines.append(admission.remaining())
+        return bulk_write(operations, **kwargs)
+    monkeypatch.setattr(collection, "bulk_write", recording_bulk_write)
+
+    manager.enable_write_behind(window=60)
+    manager.update_user_rank(uids[0], 123, 1)
+    with admission.deadline(5):
+        manager.update_user_rank(uids[1], 456, 1, sync=True)
+
+    # 同步写入不受请求截止时间限制，也不写入其他用户排队的更新
+    assert deadlines == [None]
+    assert collection.find_one({"uid": uids[1]})["racetrack_rank_data"]["rank_score"] == 456
+    assert collection.find_one({"uid": uids[0]})["racetrack_rank_data"]["rank_score"] != 123
+    assert manager.write_behind.depth() == 1
@@ -0,0 +1,227 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+
+class WriteFailed(Exception):
+    """写回队列中的写入失败，消息为写入凭证的错误信息"""
+
+
+class PendingWrite:
+    """一次提交的写入凭证，所在批次写入完成后被确认；query 为本次提交的过滤条件"""
+
+    def __init__(self, query: Optional[Dict] = None):
+        self._event = threading.Event()
+        self.query = query or {}
+        self.error: Optional[str] = None
+
+    def done(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待写入完成，超时返回False；完成后error为None表示写入成功"""
+        return self._event.wait(timeout)
+
+    def result(self, timeout: Optional[float] = None) -> None:
+        """等待写入完成，写入失败时抛出WriteFailed，超时抛出TimeoutError"""
+        if not self.wait(timeout):
+            raise TimeoutError("等待写入确认超时")
+        if self.error is not None:
+            raise WriteFailed(self.error)
+
+    def resolve(self, error: Optional[str]) -> None:
+        """确认写入结果；flush_batch 可提前以错误确认合并写入中的单次提交，之后不再被覆盖"""
+        self.error = error
+        self._event.set()
+
+
+class QueuedWrite:
+    """队列中一个文档的合并写入：多次提交的$set字段和过滤条件合并为一次更新"""
+
+    __slots__ = ("collection", "key", "query", "fields", "tickets")
+
+    def __init__(self, collection: str, key: Hashable, query: Dict):
+        self.collection = collection
+        self.key = key
+        self.query = dict(query)
+        self.fields: Dict[str, Any] = {}
+        self.tickets: List[PendingWrite] = []
+
+
+def set_path(target: Any, path: str, value: Any) -> bool:
+    """按点分路径写入字段（数组按已有下标写入），路径无法写入时返回False"""
+    keys = path.split(".")
+    for i, key in enumerate(keys):
+        last = i == len(keys) - 1
+        if isinstance(target, list) and key.isdigit() and int(key) < len(target):
+            if last:
+                target[int(key)] = value
+            else:
+                target = target[int(key)]
+        elif isinstance(target, dict):
+            if last:
+                target[key] = value
+            else:
+                target = target.setdefault(key, {})
+        else:
+            return False
+    return True
+
+
+def merge_set(fields: Dict[str, Any], path: str, value: Any) -> None:
+    """
+    将一个$set字段合并到已排队的字段中，后写入的值覆盖先写入的值
+    新路径是已有路径的上级时删除已有的下级路径；是已有路径的下级时写入已有值的内部，
+    保证合并后的$set中不存在相互冲突的路径
+    """
+    value = copy.deepcopy(value)
+    prefix = path + "."
+    for existing in [key for key in fields if key.startswith(prefix)]:
+        del fields[existing]
+    for existing, current in fields.items():
+        if path.startswith(existing + ".") and set_path(current, path[len(existing) + 1:], value):
+            return
+    fields[path] = value
+
+
+class WriteBehindQueue:
+    """
+    写回队列：更新先进入内存队列，同一文档在窗口期内的多次$set合并为一次，
+    由后台线程每隔window秒（或排队文档数达到max_pending时立即）调用flush_batch批量写入
+    flush_batch(entries) 返回写入失败的 {下标: 错误信息}；各批次按提交顺序串行写入
+    """
+
+    def __init__(
+            self,
+            flush_batch: Callable[[List[QueuedWrite]], Dict[int, str]],
+            window: float = 0.05,
+            max_pending: int = 1000
+    ):
+        self.flush_batch = flush_batch
+        self.window = window
+        self.max_pending = max_pending
+        self._pending: "OrderedDict[Hashable, QueuedWrite]" = OrderedDict()
+        self._oldest = 0.0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+        self.submitted = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+
+    def submit(self, collection: str, key: Hashable, query: Dict, fields: Dict[str, Any]) -> PendingWrite:
+        """
+        提交一次$set更新，立即返回写入凭证
+        key 标识目标文档，相同key的更新合并，过滤条件取并集
+        """
+        ticket = PendingWrite(dict(query))
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("写回队列已关闭")
+            entry = self._pending.get(key)
+            if entry is None:
+                if not self._pending:
+                    self._oldest = time.monotonic()
+                entry = self._pending[key] = QueuedWrite(collection, key, query)
+            else:
+                entry.query.update(query)
+                self.coalesced += 1
+            for path, value in fields.items():
+                merge_set(entry.fields, path, value)
+            entry.tickets.append(ticket)
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._ensure_thread()
+            self._cond.notify()
+        return ticket
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # 等待窗口期结束，期间到达的更新一并写入
+                deadline = self._oldest + self.window
+                while self._pending and not self._closed and len(self._pending) < self.max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self.flush()
+
+    def flush(self, keys: Optional[Iterable[Hashable]] = None) -> int:
+        """
+        同步写入当前排队的更新，返回写入的文档数；返回时之前提交的更新均已确认
+        keys 不为None时只写入这些文档，其余更新留在队列中由后台线程写入
+        """
+        with self._flush_lock:
+            with self._cond:
+                if keys is None:
+                    entries = list(self._pending.values())
+                    self._pending.clear()
+                else:
+                    entries = [self._pending.pop(key) for key in keys if key in self._pending]
+            if not entries:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                failed = self.flush_batch(entries)
+            except Exception as e:
+                failed = {i: str(e) for i in range(len(entries))}
+            for i, entry in enumerate(entries):
+                for ticket in entry.tickets:
+                    if not ticket.done():
+                        ticket.resolve(failed.get(i))
+
+            with self._cond:
+                self.flushes += 1
+                self.flushed += len(entries) - len(failed)
+                self.errors += len(failed)
+                self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+            return len(entries) - len(failed)
+
+    def close(self) -> int:
+        """停止后台线程并写入剩余更新，返回最后一次写入的文档数"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        return self.flush()
+
+    def depth(self) -> int:
+        """当前排队等待写入的文档数"""
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回队列统计信息"""
+        with self._cond:
+            return {
+                'depth': len(self._pending),
+                'max_depth': self.max_depth,
+                'window': self.window,
+                'max_pending': self.max_pending,
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'flushes': self.flushes,
+                'flushed': self.flushed,
+                'errors': self.errors,
+                'last_flush_ms': self.last_flush_ms
+            }